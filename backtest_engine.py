@@ -0,0 +1,302 @@
+import os
+import pickle
+import numpy as np
+import metrics
+import position_sizing
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# --- Engine Configuration ---
+USE_NUMBA = True  # Falls back to the pure-Python kernels when numba is not installed
+
+TRADING_DAYS_PER_YEAR = 252
+DAY_NS = 86_400 * 10**9
+CHECKPOINT_VERSION = 3  # Bump whenever the checkpointed kernel state changes layout, so older checkpoints are ignored
+
+STOP_MODE_CODES = {'NONE': 0, 'TRAILING': 1, 'FIXED': 2, 'PREVIOUS_YEAR_LOW': 3}
+REASON_TRAILING, REASON_STATIC, REASON_TARGET = 1, 2, 3
+
+# Columns of the per-combination state array carried through the grid kernel.
+ST_IN_POS, ST_ENTRY, ST_PEAK, ST_SHARES, ST_STATIC, ST_CASH, ST_EQ_PEAK, ST_MIN_DD, ST_LAST_EQ, ST_TRADES = range(10)
+ST_DD_BARS, ST_MAX_DD_BARS, ST_DD_SQ, ST_RET_SUM, ST_RET_SQ, ST_DOWN_SQ, ST_EXPOSURE = range(10, 17)
+NUM_STATE_FIELDS = 17
+# State columns holding the running sums of metrics.curve_sums, by field name.
+SUM_COLUMNS = {'min_dd': ST_MIN_DD, 'dd_bars': ST_DD_BARS, 'max_dd_bars': ST_MAX_DD_BARS, 'dd_sq': ST_DD_SQ,
+               'ret_sum': ST_RET_SUM, 'ret_sq': ST_RET_SQ, 'down_sq': ST_DOWN_SQ, 'exposure': ST_EXPOSURE}
+
+def compile_kernel(fn):
+    """JIT-compiles a kernel with numba when it is available, otherwise returns None."""
+    return njit(cache=True)(fn) if njit is not None else None
+
+def select_kernel(compiled, fallback):
+    return compiled if (USE_NUMBA and compiled is not None) else fallback
+
+def prepare_arrays(df, sma_col, sizing=None):
+    """Pulls the columns the simulation needs into contiguous float64 arrays, once per DataFrame, together with the
+    entry weights of the position_sizing spec `sizing` (default: all-in) and the spec itself."""
+    close = np.ascontiguousarray(df['Close'].to_numpy(dtype=np.float64))
+    sma = np.ascontiguousarray(df[sma_col].to_numpy(dtype=np.float64))
+    signal = crossover_signals(close, sma)
+    prev_year_low = df['PrevYearLow'].to_numpy(dtype=np.float64) if 'PrevYearLow' in df.columns else np.zeros(len(df))
+    return {
+        'index': df.index,
+        'open': np.ascontiguousarray(df['Open'].to_numpy(dtype=np.float64)),
+        'high': np.ascontiguousarray(df['High'].to_numpy(dtype=np.float64)),
+        'low': np.ascontiguousarray(df['Low'].to_numpy(dtype=np.float64)),
+        'close': close, 'sma': sma, 'signal': signal,
+        'prev_year_low': np.ascontiguousarray(prev_year_low),
+        'weight': np.ascontiguousarray(position_sizing.entry_weights(sizing, df['High'], df['Low'], close, bars_per_year(df.index))),
+        'sizing': sizing or position_sizing.EQUAL,
+    }
+
+def crossover_signals(close, sma):
+    """Entry on bar i when Close crossed above the SMA between bars i-2 and i-1 (NaN compares False, as in the loop).
+    `sma` may be one column or a (bars x periods) matrix, giving one signal column per period."""
+    close = close if sma.ndim == 1 else close[:, None]
+    signal = np.zeros(sma.shape, dtype=np.bool_)
+    signal[2:] = (close[:-2] <= sma[:-2]) & (close[1:-1] > sma[1:-1])
+    return signal
+
+def prepare_sweep_arrays(df, ma_periods, sizing=None):
+    """prepare_arrays for several MA periods at once: 'sma' and 'signal' become (bars x periods) matrices whose
+    columns follow ma_periods, precomputed once so the sweep kernel only indexes into them."""
+    a = prepare_arrays(df, f'SMA_{ma_periods[0]}', sizing)
+    a['sma'] = np.ascontiguousarray(np.column_stack([df[f'SMA_{p}'].to_numpy(dtype=np.float64) for p in ma_periods]))
+    a['signal'] = crossover_signals(a['close'], a['sma'])
+    return a
+
+def slice_arrays(a, start, stop):
+    """Bars start..stop-1 of a prepare_arrays dict, as views. Indicators and crossover signals keep the values
+    computed on the full history, so a window needs no indicator warm-up of its own."""
+    return {k: v if k == 'sizing' else v[start:stop] for k, v in a.items()}
+
+def _grid_kernel(open_, high, low, close, signal, signal_rows, prev_year_low, weight, mode, stop_levels, profit_targets, commission_pct, max_trades, record_stops, state, trade_base, start):
+    """Advances every (stop level, profit target) combination together over bars start..n-1, updating `state` in place.
+    Combination c enters on column signal_rows[c] of the (bars x periods) signal matrix, putting weight[i] of its cash
+    into the position. Trades are recorded from slot trade_base[c] onwards. Per-combination logic mirrors
+    run_backtest_reference exactly."""
+    n = len(close); num_combos = len(stop_levels)
+    stop_series = np.full((num_combos, n if record_stops else 0), np.nan)
+    entry_idx = np.zeros((num_combos, max_trades), dtype=np.int64); exit_idx = np.zeros((num_combos, max_trades), dtype=np.int64)
+    entry_px = np.zeros((num_combos, max_trades)); exit_px = np.zeros((num_combos, max_trades))
+    stops = np.zeros((num_combos, max_trades)); reasons = np.zeros((num_combos, max_trades), dtype=np.int64)
+    for i in range(start, n):
+        for c in range(num_combos):
+            s = state[c]
+            in_position = s[ST_IN_POS] == 1.0
+            if in_position: equity = s[ST_SHARES] * close[i-1] + s[ST_CASH]
+            else: equity = s[ST_CASH]
+            ret = equity / s[ST_LAST_EQ] - 1
+            s[ST_LAST_EQ] = equity
+            if equity > s[ST_EQ_PEAK]: s[ST_EQ_PEAK] = equity
+            drawdown = (equity - s[ST_EQ_PEAK]) / s[ST_EQ_PEAK]
+            if drawdown < s[ST_MIN_DD]: s[ST_MIN_DD] = drawdown
+            # The running sums of metrics.curve_sums, bar by bar.
+            if drawdown < 0:
+                s[ST_DD_BARS] += 1
+                if s[ST_DD_BARS] > s[ST_MAX_DD_BARS]: s[ST_MAX_DD_BARS] = s[ST_DD_BARS]
+            else: s[ST_DD_BARS] = 0.0
+            s[ST_DD_SQ] += (drawdown * 100) ** 2
+            s[ST_RET_SUM] += ret; s[ST_RET_SQ] += ret * ret
+            if ret < 0: s[ST_DOWN_SQ] += ret * ret
+            if in_position: s[ST_EXPOSURE] += s[ST_SHARES] * close[i-1] / equity
+            if in_position:
+                exit_price = -1.0; reason = 0
+                if mode == 1:
+                    if high[i] > s[ST_PEAK]: s[ST_PEAK] = high[i]
+                    stop_price = s[ST_PEAK] * (1 - stop_levels[c] / 100)
+                    if record_stops: stop_series[c, i] = stop_price
+                    if low[i] <= stop_price:
+                        exit_price = stop_price; reason = REASON_TRAILING
+                elif mode == 2 or mode == 3:
+                    if low[i] <= s[ST_STATIC]:
+                        exit_price = s[ST_STATIC]; reason = REASON_STATIC
+                if exit_price == -1.0 and not np.isnan(profit_targets[c]):
+                    profit_target_price = s[ST_ENTRY] * (1 + profit_targets[c] / 100)
+                    if high[i] >= profit_target_price:
+                        exit_price = profit_target_price; reason = REASON_TARGET
+                if exit_price != -1.0:
+                    s[ST_CASH] += (s[ST_SHARES] * exit_price) * (1 - commission_pct)
+                    t = int(s[ST_TRADES]) - 1 - trade_base[c]
+                    exit_idx[c, t] = i; exit_px[c, t] = exit_price; reasons[c, t] = reason; stops[c, t] = s[ST_STATIC]
+                    s[ST_IN_POS] = 0.0; s[ST_SHARES] = 0.0
+                    in_position = False
+            if not in_position and i > 1 and signal[i][signal_rows[c]] and open_[i] > 0 and weight[i] > 0:
+                entry_price = open_[i]
+                invested = s[ST_CASH] * weight[i]
+                s[ST_ENTRY] = entry_price; s[ST_PEAK] = entry_price
+                s[ST_SHARES] = (invested * (1 - commission_pct)) / entry_price
+                s[ST_CASH] -= invested
+                s[ST_IN_POS] = 1.0
+                if mode == 2: s[ST_STATIC] = entry_price * (1 - stop_levels[c] / 100)
+                elif mode == 3: s[ST_STATIC] = prev_year_low[i]
+                t = int(s[ST_TRADES])
+                entry_idx[c, t - trade_base[c]] = i; entry_px[c, t - trade_base[c]] = entry_price
+                s[ST_TRADES] = t + 1
+    return stop_series, entry_idx, exit_idx, entry_px, exit_px, stops, reasons
+
+_compiled_grid_kernel = compile_kernel(_grid_kernel)
+
+def bars_per_year(index):
+    """Bars in one year of a bar index, derived from its timestamps: TRADING_DAYS_PER_YEAR for daily bars (52 and 12 for
+    weekly and monthly). Intraday bars count the median bars per session times the sessions per year, the latter
+    measured once the index spans a year: 390 one-minute bars a day over 252 sessions give 98,280."""
+    ns = np.asarray(index, dtype='datetime64[ns]').view(np.int64)
+    if len(ns) < 2: return TRADING_DAYS_PER_YEAR
+    spacing_days = np.median(np.diff(ns)) / DAY_NS
+    if spacing_days >= 1: return session_bars_per_year(spacing_days, None, 0)
+    _, per_session = np.unique(ns // DAY_NS, return_counts=True)
+    return session_bars_per_year(spacing_days, per_session, (ns[-1] - ns[0]) / DAY_NS)
+
+def session_bars_per_year(spacing_days, per_session, span_days):
+    """bars_per_year from its ingredients, for callers that gather them piecewise: the median bar spacing, the bar
+    count of every calendar day with bars (only read for intraday spacing) and the days from first to last bar."""
+    if spacing_days >= 28: return 12
+    if spacing_days >= 5: return 52
+    if spacing_days >= 1: return TRADING_DAYS_PER_YEAR
+    span_years = span_days / 365.25
+    return float(np.median(per_session)) * (len(per_session) / span_years if span_years >= 1 else TRADING_DAYS_PER_YEAR)
+
+def state_stats(state, num_bars, bars_per_year=TRADING_DAYS_PER_YEAR):
+    """metrics.summarize_sums of every combination of a grid state over num_bars bars, as arrays by combination."""
+    return metrics.summarize_sums({name: state[:, col] for name, col in SUM_COLUMNS.items()}, num_bars, bars_per_year)
+
+def risk_metrics(stats):
+    """The metrics.summarize_sums statistics under their single-asset report names."""
+    return {"Sharpe Ratio": stats['sharpe'], "Sortino Ratio": stats['sortino'], "Ulcer Index": stats['ulcer'],
+            "Max DD Duration (bars)": int(stats['max_dd_bars']), "Exposure (%)": stats['exposure']}
+
+def summarize_backtest(num_bars, stats, final_equity, trades_log, stop_level_pct, profit_target_pct, initial_capital, commission_pct, bars_per_year=TRADING_DAYS_PER_YEAR):
+    """Builds the metrics dict reported for one single-asset run; stats are its metrics.summarize_sums statistics."""
+    final_pnl = final_equity - initial_capital
+    cagr = metrics.cagr_pct(final_equity, initial_capital, num_bars, bars_per_year)
+    max_drawdown = stats['max_drawdown']
+    wins = sum(1 for t in trades_log if t.get('exit_price', 0) > t.get('entry_price', 0))
+    percent_profitable = (wins / len(trades_log) * 100) if trades_log else 0
+    return {
+        "Stop Level (%)": stop_level_pct if stop_level_pct is not None else "N/A",
+        "Profit Target (%)": "None" if profit_target_pct is None else profit_target_pct,
+        "P&L ($)": final_pnl, "CAGR (%)": cagr, "Max Drawdown (%)": max_drawdown,
+        "Calmar Ratio": metrics.calmar(cagr, max_drawdown), **risk_metrics(stats),
+        "Total Trades": len(trades_log), "% Profitable": percent_profitable, "Avg Trade (%)": metrics.average_trade_pct(trades_log, commission_pct),
+    }
+
+BENCHMARK_METRICS = ["P&L ($)", "CAGR (%)", "Max Drawdown (%)", "Calmar Ratio", "Sharpe Ratio", "Sortino Ratio", "Ulcer Index", "Max DD Duration (bars)", "Exposure (%)"]
+
+def buy_and_hold_summary(final_equity, stats, initial_capital, num_bars, bars_per_year=TRADING_DAYS_PER_YEAR):
+    """Metrics dict of a buy & hold benchmark (calculate_benchmark_stats' layout), from its final equity and statistics."""
+    cagr = metrics.cagr_pct(final_equity, initial_capital, num_bars, bars_per_year)
+    return {"P&L ($)": final_equity - initial_capital, "CAGR (%)": cagr, "Max Drawdown (%)": stats['max_drawdown'],
+            "Calmar Ratio": metrics.calmar(cagr, stats['max_drawdown']), **risk_metrics(stats)}
+
+def load_checkpoint(path):
+    """Reads a checkpoint written by save_checkpoint, or returns None when there is none (or it is unreadable)."""
+    try:
+        with open(path, 'rb') as f: return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+def save_checkpoint(path, checkpoint):
+    """Writes a checkpoint atomically, so an interrupted run never leaves a truncated file behind."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f: pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def _last_bar(a, n):
+    return np.concatenate([[a['close'][n - 1]], np.atleast_1d(a['sma'][n - 1])])
+
+def _resume_start(checkpoint, config, a):
+    """Bar to resume from when `checkpoint` was produced by the same configuration on a prefix of this data, else None."""
+    if checkpoint is None or checkpoint['config'] != config: return None
+    n = checkpoint['num_bars']
+    if n < 2 or len(a['close']) < n or a['index'][n - 1] != checkpoint['last_date']: return None
+    if not np.allclose(_last_bar(a, n), checkpoint['last_bar'], rtol=1e-12, atol=0): return None
+    return n
+
+def run_backtest_grid(df, stop_loss_mode, combos, initial_capital, commission_pct, sma_col, arrays=None, record_stops=True, checkpoint=None, return_checkpoint=False, signal_rows=None):
+    """Simulates every (stop_level_pct, profit_target_pct) pair in `combos` in a single traversal of the data.
+    Returns one run_backtest-style result per combination, in the order given. With record_stops=False the
+    per-combination trailing stop series is not kept (None), which keeps memory flat for very large grids.
+
+    With return_checkpoint=True, also returns the end-of-data simulation state. Passing that back as `checkpoint`
+    on a later call resumes from it and simulates only the bars appended since; a checkpoint from a different
+    configuration or a history that no longer matches is ignored and the full grid is rerun. Resumed runs do not
+    carry a trailing stop series.
+
+    With sweep arrays from prepare_sweep_arrays, signal_rows gives the MA column each combination trades on."""
+    a = arrays if arrays is not None else prepare_arrays(df, sma_col)
+    mode = STOP_MODE_CODES.get(stop_loss_mode, 0)
+    signal = a['signal'] if a['signal'].ndim == 2 else a['signal'][:, None]
+    signal_rows = np.zeros(len(combos), dtype=np.int64) if signal_rows is None else np.asarray(signal_rows, dtype=np.int64)
+    config = {'mode': stop_loss_mode, 'combos': list(combos), 'initial_capital': initial_capital, 'commission_pct': commission_pct, 'sma_col': sma_col,
+              'signal_rows': signal_rows.tolist(), 'sizing': a['sizing'], 'version': CHECKPOINT_VERSION}
+    stop_levels = np.array([np.nan if sl is None else float(sl) for sl, _ in combos])
+    profit_targets = np.array([np.nan if pt is None else float(pt) for _, pt in combos])
+    start = _resume_start(checkpoint, config, a)
+    if start is None:
+        start = 1
+        state = np.zeros((len(combos), NUM_STATE_FIELDS))
+        state[:, ST_CASH] = initial_capital; state[:, ST_EQ_PEAK] = initial_capital; state[:, ST_LAST_EQ] = initial_capital
+        prior_trades = [[] for _ in combos]
+    else:
+        state = checkpoint['state'].copy()
+        prior_trades = checkpoint['trades']
+        record_stops = False
+    # The trade still open at the checkpoint (if any) takes slot 0, so its exit can be recorded.
+    trade_base = np.array([int(s[ST_TRADES]) - int(s[ST_IN_POS]) for s in state], dtype=np.int64)
+    max_trades = int(signal[start:].any(axis=1).sum()) + 2  # at most one entry per crossover bar, plus the open trade
+    kernel = select_kernel(_compiled_grid_kernel, _grid_kernel)
+    inputs = [a['open'], a['high'], a['low'], a['close'], signal, signal_rows, a['prev_year_low'], a['weight']]
+    if kernel is _grid_kernel: inputs = [x.tolist() for x in inputs]  # list indexing is far cheaper than ndarray indexing in pure Python
+    resumed_open = state[:, ST_IN_POS] == 1.0
+    stop_series, entry_idx, exit_idx, entry_px, exit_px, stops, reasons = kernel(
+        *inputs, mode, stop_levels, profit_targets, float(commission_pct), max_trades, record_stops, state, trade_base, start)
+    index, close = a['index'], a['close']
+    reason_names = {REASON_TRAILING: "Trailing Stop", REASON_STATIC: f"{stop_loss_mode} Stop", REASON_TARGET: "Profit Target"}
+    results = []; raw_trades = []; year_bars = bars_per_year(index)
+    stats = state_stats(state, len(close), year_bars)
+    for c, (stop_level_pct, profit_target_pct) in enumerate(combos):
+        s = state[c]
+        in_position = s[ST_IN_POS] == 1.0
+        trades_log = [dict(t) for t in prior_trades[c][:trade_base[c]]]
+        num_slots = int(s[ST_TRADES]) - trade_base[c]
+        for k in range(num_slots):
+            if k == 0 and resumed_open[c]: trade = dict(prior_trades[c][-1])
+            else: trade = {'entry_date': index[entry_idx[c, k]], 'entry_price': entry_px[c, k], 'ts_pct': stop_level_pct, 'pt_pct': profit_target_pct}
+            if k < num_slots - 1 or not in_position:
+                trade.update({'exit_date': index[exit_idx[c, k]], 'exit_price': exit_px[c, k], 'reason': reason_names[reasons[c, k]], 'static_stop': stops[c, k]})
+            trades_log.append(trade)
+        raw_trades.append([dict(t) for t in trades_log])
+        if in_position:
+            final_equity = (s[ST_SHARES] * close[-1]) + s[ST_CASH]
+            trades_log[-1].update({'exit_date': index[-1], 'exit_price': close[-1], 'reason': 'End of Data', 'static_stop': s[ST_STATIC]})
+        else: final_equity = s[ST_LAST_EQ]
+        summary = summarize_backtest(len(close), {k: v[c] for k, v in stats.items()}, final_equity, trades_log, stop_level_pct, profit_target_pct, initial_capital, commission_pct, year_bars)
+        results.append({"metrics": summary, "trades_log": trades_log, "trailing_stop_series": stop_series[c].tolist() if record_stops else None})
+    if not return_checkpoint: return results
+    new_checkpoint = {'config': config, 'num_bars': len(close), 'last_date': index[-1], 'last_bar': _last_bar(a, len(close)),
+                      'state': state, 'trades': raw_trades, 'resumed_from': start if start > 1 else None}
+    return results, new_checkpoint
+
+def run_backtest(df, stop_loss_mode, stop_level_pct, profit_target_pct, initial_capital, commission_pct, sma_col, arrays=None):
+    """Array-kernel version of the single-asset backtest. Pass `arrays` from prepare_arrays to reuse them across a sweep."""
+    return run_backtest_grid(df, stop_loss_mode, [(stop_level_pct, profit_target_pct)], initial_capital, commission_pct, sma_col, arrays=arrays)[0]
+
+def run_backtest_sweep(df, stop_loss_mode, ma_periods, combos, initial_capital, commission_pct, arrays=None, record_stops=False, checkpoint=None, return_checkpoint=False):
+    """Simulates the full MA x SL x PT surface in one traversal: every (stop_level_pct, profit_target_pct) pair in
+    `combos` for every period in ma_periods, indexing a precomputed crossover-signal matrix. df needs an SMA_<p>
+    column per period. Results come back MA-major, each metrics dict led by an "MA Period" entry."""
+    a = arrays if arrays is not None else prepare_sweep_arrays(df, ma_periods)
+    sweep_combos = [combo for _ in ma_periods for combo in combos]
+    signal_rows = [j for j in range(len(ma_periods)) for _ in combos]
+    sma_col = ','.join(f'SMA_{p}' for p in ma_periods)
+    output = run_backtest_grid(df, stop_loss_mode, sweep_combos, initial_capital, commission_pct, sma_col, arrays=a, record_stops=record_stops,
+                               checkpoint=checkpoint, return_checkpoint=return_checkpoint, signal_rows=signal_rows)
+    results = output[0] if return_checkpoint else output
+    for result, row in zip(results, signal_rows):
+        result['metrics'] = dict({"MA Period": ma_periods[row]}, **result['metrics'])
+    return output
@@ -0,0 +1,185 @@
+import io
+import os
+import glob
+import json
+import time
+import argparse
+import itertools
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import chart_renderer
+import data_cache
+import instrumentation
+import metrics
+import results_store
+import individual_backtester as ib
+import portfolio_backtester_v2 as pb
+
+# --- Batch Configuration ---
+BACKTESTERS = ['portfolio', 'individual']
+STOP_LOSS_MODES = ['TRAILING', 'FIXED', 'PREVIOUS_YEAR_LOW', 'NONE']
+MATRIX_KEYS = ('backtester', 'data_dir', 'ma_period', 'stop_loss_mode')
+
+# --- <<< JOB MATRIX (--job-file, or the matrix flags) >>> ---
+JOB_FILE = None # e.g. 'jobs.json': a job matrix, or a list of them, in JSON; overrides DEFAULT_MATRIX
+DEFAULT_MATRIX = {'backtester': ['portfolio'], 'data_dir': [pb.STOCK_DATA_DIR], 'ma_period': [20, 50, 200], 'stop_loss_mode': STOP_LOSS_MODES}
+SUMMARY_PATH = os.path.join(ib.REPORTS_DIR, 'batch_summary.md')
+
+_PREPARED = {} # {data_dir: {file_path: frame}} of the running batch, set in every pool worker by _share_prepared
+
+def default_reports_dir(data_dir):
+    """Reports directory of a data directory, following the repository's layout: stockData -> reports, stockData_etfs -> reports_etfs."""
+    name = os.path.basename(os.path.normpath(data_dir))
+    return ib.REPORTS_DIR + name[len('stockData'):] if name.startswith('stockData') else os.path.join(ib.REPORTS_DIR, name)
+
+def expand_jobs(matrices):
+    """One job per backtester x data_dir x ma_period x stop_loss_mode of a matrix, a dict holding a value or a list of
+    values for each of those keys (missing keys take DEFAULT_MATRIX's) and optionally a reports_dir (default:
+    default_reports_dir of each data_dir). A list of matrices makes one batch; jobs listed twice run once."""
+    jobs = []
+    for matrix in (matrices if isinstance(matrices, list) else [matrices]):
+        unknown = set(matrix) - set(MATRIX_KEYS) - {'reports_dir'}
+        if unknown: raise ValueError(f"Unknown job key(s): {', '.join(sorted(unknown))}")
+        axes = [value if isinstance(value, list) else [value] for value in (matrix.get(key, DEFAULT_MATRIX[key]) for key in MATRIX_KEYS)]
+        for backtester, data_dir, ma_period, mode in itertools.product(*axes):
+            if backtester not in BACKTESTERS: raise ValueError(f"Unknown backtester '{backtester}' (options: {', '.join(BACKTESTERS)})")
+            if mode not in STOP_LOSS_MODES: raise ValueError(f"Unknown stop-loss mode '{mode}' (options: {', '.join(STOP_LOSS_MODES)})")
+            job = {'backtester': backtester, 'data_dir': data_dir, 'ma_period': int(ma_period), 'stop_loss_mode': mode,
+                   'reports_dir': matrix.get('reports_dir') or default_reports_dir(data_dir)}
+            if job not in jobs: jobs.append(job)
+    return jobs
+
+def load_job_file(path):
+    with open(path) as f: return json.load(f)
+
+def load_directory(data_dir, ma_periods):
+    """Every CSV of data_dir, loaded and indicated once for all of ma_periods: {file_path: frame} with an SMA column per
+    period and PrevYearLow, forward-filled but not yet cut to any period's warm-up. _job_frame cuts each job's frame
+    from it, identical to what prepare_data or prepare_all_data builds for that job's period alone."""
+    frames = {}
+    for file_path in sorted(glob.glob(os.path.join(data_dir, '*.csv'))):
+        ticker = os.path.basename(file_path).split('_')[0]
+        try:
+            with instrumentation.stage('load', ticker): df = data_cache.load_price_frame(file_path)
+            if not all(col in df.columns for col in ['Open', 'High', 'Low', 'Close']):
+                raise ValueError("Data file must contain Open, High, Low, Close columns.")
+            with instrumentation.stage('indicators', ticker, bars=len(df)): data_cache.add_indicators(df, file_path, ma_periods[0], ma_periods[1:])
+            frames[file_path] = df.ffill()
+        except Exception as e:
+            print(f"  [Error] Could not process {file_path}. Reason: {e}")
+    return frames
+
+def _job_frame(df, ma_period):
+    return df.drop(columns=[col for col in df.columns if col.startswith('SMA_') and col != f'SMA_{ma_period}'])
+
+def _share_prepared(prepared):
+    # Pool initializer: under fork the workers inherit the loaded frames without copying, under spawn each worker unpickles them once.
+    global _PREPARED
+    _PREPARED = prepared
+
+def run_job(job, use_store=True, rank_by=ib.RANK_METRIC):
+    """Runs one job on the shared prepared data, with its console output captured like _process_ticker_isolated.
+    Portfolio jobs run portfolio_backtester_v2.main on the aligned frame; individual jobs run process_ticker on every
+    ticker, queuing its charts. Returns (log, seconds, error or None, [chart specs per ticker])."""
+    buffer = io.StringIO(); charts = []; error = None
+    start = time.perf_counter()
+    frames = _PREPARED.get(job['data_dir'], {})
+    with contextlib.redirect_stdout(buffer):
+        try:
+            if not frames: raise ValueError(f"No usable CSV files in {job['data_dir']}")
+            if job['backtester'] == 'portfolio':
+                pb.configure(job['data_dir'], job['reports_dir'], job['ma_period'], job['stop_loss_mode'])
+                # The universe is joined in the order main() itself would glob it, so the frame matches prepare_all_data's.
+                order = [f for f in glob.glob(os.path.join(job['data_dir'], '*.csv')) if f in frames]
+                portfolio_df = pb.align_all_data({os.path.basename(f).split('_')[0]: _job_frame(frames[f], job['ma_period']) for f in order})
+                pb.main(use_store=use_store, rank_by=rank_by, portfolio_df=portfolio_df)
+            else:
+                ib.configure(job['data_dir'], job['reports_dir'], job['ma_period'], job['stop_loss_mode'])
+                os.makedirs(job['reports_dir'], exist_ok=True)
+                for file_path, df in frames.items():
+                    ticker_log, _, ticker_charts = ib._process_ticker_isolated(file_path, use_store=use_store, rank_by=rank_by, df=_job_frame(df, job['ma_period']).dropna())
+                    print(ticker_log, end=''); charts.append(ticker_charts)
+        except Exception as e:
+            error = str(e)
+            print(f"  [Error] Could not complete the job. Reason: {e}")
+    return buffer.getvalue(), time.perf_counter() - start, error, charts
+
+def write_summary(jobs, outcomes, prepare_seconds, wall_seconds, path=SUMMARY_PATH):
+    """Markdown index of a batch: every job with its reports directory, run time and status."""
+    summary_df = pd.DataFrame([{'Backtester': job['backtester'], 'Data': job['data_dir'], 'MA Period': job['ma_period'], 'Stop Loss Mode': job['stop_loss_mode'],
+                                'Reports': job['reports_dir'], 'Seconds': f"{seconds:,.2f}", 'Status': 'OK' if error is None else f"Failed: {error}"}
+                               for job, (_, seconds, error, _) in zip(jobs, outcomes)])
+    md_content = f"# Batch Run Summary\n\n"
+    md_content += f"- **Date of Analysis:** {datetime.now().strftime('%Y-%m-%d')}\n"
+    md_content += f"- **Jobs:** {len(jobs)} ({sum(1 for o in outcomes if o[2] is not None)} failed)\n"
+    md_content += f"- **Data Preparation:** " + ', '.join(f"{d} ({s:,.2f}s)" for d, s in prepare_seconds.items()) + "\n"
+    md_content += f"- **Wall Time:** {wall_seconds:,.2f}s\n\n"
+    md_content += "## Jobs\n\n"
+    md_content += summary_df.to_markdown(index=False)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f: f.write(md_content)
+    return path
+
+def main(matrices=DEFAULT_MATRIX, workers=1, use_store=True, rank_by=ib.RANK_METRIC, chart_workers=chart_renderer.CHART_WORKERS,
+         skip_unchanged_charts=chart_renderer.SKIP_UNCHANGED_CHARTS, summary_path=SUMMARY_PATH):
+    """Runs every job of the matrices (see expand_jobs) as one batch. Each data directory is loaded and its indicators
+    computed once, for all the MA periods its jobs use, and the prepared frames are shared with every job; the jobs
+    then run on a pool of `workers` processes, each writing its reports as the standalone script would, and the batch
+    ends with a summary of all jobs at summary_path. Charts of individual jobs are drawn by chart_workers render processes."""
+    try: jobs = expand_jobs(matrices)
+    except ValueError as e: print(f"Error: {e}"); return
+    if not jobs: print("Error: The job matrix is empty."); return
+    results_store.STORE_ENABLED = use_store
+    wall_start = time.perf_counter()
+    data_dirs = list(dict.fromkeys(job['data_dir'] for job in jobs))
+    print(f"Starting Batch ({len(jobs)} job(s) over {len(data_dirs)} data dir(s), Workers: {workers})...\n")
+    prepared, prepare_seconds = {}, {}
+    for data_dir in data_dirs:
+        ma_periods = sorted({job['ma_period'] for job in jobs if job['data_dir'] == data_dir})
+        start = time.perf_counter()
+        prepared[data_dir] = load_directory(data_dir, ma_periods)
+        prepare_seconds[data_dir] = time.perf_counter() - start
+        print(f"Prepared {data_dir}: {len(prepared[data_dir])} file(s), MA {ma_periods}, {prepare_seconds[data_dir]:.2f}s")
+    _share_prepared(prepared)
+
+    outcomes = []
+    with chart_renderer.RenderQueue(chart_workers, skip_unchanged_charts) as render_queue:
+        def collect(number, job, outcome):
+            print(f"\n=== Job {number}/{len(jobs)}: {job['backtester']} | {job['data_dir']} | MA {job['ma_period']} | {job['stop_loss_mode']} ({outcome[1]:.2f}s) ===")
+            print(outcome[0], end=''); outcomes.append(outcome)
+            for ticker_charts in outcome[3]: render_queue.submit(ticker_charts)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_share_prepared, initargs=(prepared,)) as executor:
+                # map() yields in submission order, so the log reads the same however the jobs were scheduled.
+                for number, (job, outcome) in enumerate(zip(jobs, executor.map(run_job, jobs, [use_store] * len(jobs), [rank_by] * len(jobs))), 1):
+                    collect(number, job, outcome)
+        else:
+            for number, job in enumerate(jobs, 1): collect(number, job, run_job(job, use_store, rank_by))
+        rendered = render_queue.drain()
+    if rendered: print(f"\n{sum(1 for r in rendered if r[2])} chart(s) rendered, {sum(1 for r in rendered if not r[2])} unchanged since the last render")
+
+    failed = sum(1 for outcome in outcomes if outcome[2] is not None)
+    print(f"\n--- Batch complete: {len(jobs) - failed} of {len(jobs)} job(s) succeeded in {time.perf_counter() - wall_start:.2f}s ---")
+    print(f"Summary saved to {write_summary(jobs, outcomes, prepare_seconds, time.perf_counter() - wall_start, summary_path)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a matrix of backtester configurations as one batch on shared prepared data.")
+    parser.add_argument('--job-file', default=JOB_FILE, help="JSON job matrix, or list of matrices, to run instead of the matrix flags below.")
+    parser.add_argument('--backtester', nargs='+', choices=BACKTESTERS, default=DEFAULT_MATRIX['backtester'], help=f"Backtesters to run (default: {' '.join(DEFAULT_MATRIX['backtester'])}).")
+    parser.add_argument('--data-dir', nargs='+', default=DEFAULT_MATRIX['data_dir'], help=f"Data directories to run on (default: {' '.join(DEFAULT_MATRIX['data_dir'])}).")
+    parser.add_argument('--ma-period', type=int, nargs='+', default=DEFAULT_MATRIX['ma_period'], help=f"MA periods to run (default: {' '.join(str(p) for p in DEFAULT_MATRIX['ma_period'])}).")
+    parser.add_argument('--stop-loss-mode', nargs='+', choices=STOP_LOSS_MODES, default=DEFAULT_MATRIX['stop_loss_mode'], help="Stop-loss modes to run (default: all).")
+    parser.add_argument('--reports-dir', default=None, help="Write every job's reports here instead of the data directory's own reports directory.")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes to spread the jobs across (default: 1).")
+    parser.add_argument('--no-store', action='store_true', help="Ignore the results store and simulate every combination.")
+    parser.add_argument('--rank-by', choices=metrics.RANK_METRICS, default=ib.RANK_METRIC, help=f"Ratio the optimal combination is chosen by (default: {ib.RANK_METRIC}).")
+    parser.add_argument('--chart-workers', type=int, default=chart_renderer.CHART_WORKERS, help=f"Number of processes rendering the individual jobs' charts (default: {chart_renderer.CHART_WORKERS}).")
+    parser.add_argument('--rerender-charts', action='store_true', help="Redraw every chart, even when its inputs are unchanged since the last render.")
+    parser.add_argument('--summary', default=SUMMARY_PATH, help=f"Where the batch summary is written (default: {SUMMARY_PATH}).")
+    args = parser.parse_args()
+    matrices = load_job_file(args.job_file) if args.job_file else {'backtester': args.backtester, 'data_dir': args.data_dir, 'ma_period': args.ma_period,
+                                                                   'stop_loss_mode': args.stop_loss_mode, 'reports_dir': args.reports_dir}
+    main(matrices, workers=args.workers, use_store=not args.no_store, rank_by=args.rank_by, chart_workers=args.chart_workers,
+         skip_unchanged_charts=not args.rerender_charts, summary_path=args.summary)
@@ -0,0 +1,360 @@
+import io
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import backtest_engine
+import portfolio_engine
+import data_cache
+import results_store
+import individual_backtester as ib
+import portfolio_backtester_v2 as pb
+
+# --- Benchmark Configuration ---
+BENCHMARK_DATA_DIR = ib.STOCK_DATA_DIR
+BENCHMARK_MODES = ['TRAILING', 'FIXED', 'PREVIOUS_YEAR_LOW', 'NONE']
+
+# --- <<< SYNTHETIC SUITE (default run) >>> ---
+SYNTHETIC_BARS = 252 * 20  # Bars per synthetic ticker
+SYNTHETIC_TICKERS = 10
+SYNTHETIC_SEED = 42
+SUITE_OUTPUT_PATH = os.path.join(ib.REPORTS_DIR, 'benchmark_results.json')
+REGRESSION_TOLERANCE = 1.25  # A stage slower than this multiple of its baseline time counts as a regression...
+REGRESSION_MIN_SECONDS = 0.05  # ...if it also lost at least this much time, so millisecond stages do not flag timer noise
+CHECK_TICKERS = 2  # Synthetic tickers cross-checked against the reference implementations
+CHECK_BARS = 1500  # Bars of the synthetic portfolio cross-checked against run_active_strategy_reference (it is slow)
+
+# --- <<< STARTUP TIME >>> ---
+STARTUP_MODULES = ['individual_backtester', 'portfolio_backtester_v2', 'batch_runner']  # Imported in a fresh interpreter, as a short scheduled run would
+STARTUP_REPEATS = 5  # Best of this many fresh interpreters, so a cold disk cache does not count as a regression
+HEAVY_MODULES = ['pandas_ta', 'matplotlib', 'PIL']  # Only the stages that need them may load these; any of them at import time is flagged
+
+def _same_value(a, b):
+    if isinstance(a, float) and isinstance(b, float) and np.isnan(a) and np.isnan(b): return True
+    return a == b
+
+def _close_value(a, b, rtol):
+    if isinstance(a, float) and isinstance(b, float): return _same_value(a, b) or bool(np.isclose(a, b, rtol=rtol, atol=1e-12))
+    return a == b
+
+def results_match(ref, fast, rtol=1e-12):
+    """True when two run_backtest results agree: every trade field and the trailing stop series exactly, metrics to
+    rtol. The engine sums the risk statistics bar by bar and the reference over whole arrays, so they differ by rounding."""
+    if ref['metrics'].keys() != fast['metrics'].keys(): return False
+    if not all(_close_value(ref['metrics'][k], fast['metrics'][k], rtol) for k in ref['metrics']): return False
+    if len(ref['trades_log']) != len(fast['trades_log']): return False
+    for t_ref, t_fast in zip(ref['trades_log'], fast['trades_log']):
+        if t_ref.keys() != t_fast.keys() or not all(_same_value(t_ref[k], t_fast[k]) for k in t_ref): return False
+    return np.array_equal(np.asarray(ref['trailing_stop_series'], dtype=float), np.asarray(fast['trailing_stop_series'], dtype=float), equal_nan=True)
+
+def portfolio_metrics_match(ref, fast, rtol=1e-9):
+    """True when two run_active_strategy metrics dicts agree: names and trade counts exactly, money figures to rtol."""
+    if ref.keys() != fast.keys(): return False
+    return all(ref[k] == fast[k] if isinstance(ref[k], (str, int, np.integer)) else np.isclose(ref[k], fast[k], rtol=rtol, atol=1e-9) for k in ref)
+
+def _grid_for_mode(mode, stop_levels=ib.STOP_LEVELS_PCT, profit_targets=ib.PROFIT_TARGETS_PCT):
+    levels = stop_levels if mode in ['TRAILING', 'FIXED'] else [None]
+    return [(sl, pt) for sl in levels for pt in profit_targets]
+
+def _numba_active():
+    return backtest_engine.USE_NUMBA and backtest_engine.njit is not None
+
+def _warm_up_kernels():
+    """Runs every kernel once on a tiny frame so JIT compilation is not charged to the first timed stage."""
+    warm = pd.DataFrame({'Open': [1.0] * 4, 'High': [1.0] * 4, 'Low': [1.0] * 4, 'Close': [1.0] * 4, 'SMA_1': [1.0] * 4, 'PrevYearLow': [1.0] * 4}, index=pd.date_range('2000-01-01', periods=4))
+    backtest_engine.run_backtest(warm, 'TRAILING', 10, 50, 1.0, 0.0, 'SMA_1')
+    portfolio_engine.run_active_strategy_grid(pd.concat({'A': warm}, axis=1), 'TRAILING', [(10, 50)], 1.0, 1, 0.0, 0.0)
+
+# --- Synthetic data ---
+
+def synthetic_ohlc(num_bars, seed=SYNTHETIC_SEED, start='1990-01-02', annual_drift=0.08, annual_vol=0.25, start_price=100.0):
+    """Seeded geometric random walk with consistent daily OHLCV bars on business days, in the yfinance CSV layout."""
+    rng = np.random.default_rng(seed)
+    daily_vol = annual_vol / np.sqrt(252)
+    close = start_price * np.exp(np.cumsum(rng.normal(annual_drift / 252 - daily_vol ** 2 / 2, daily_vol, num_bars)))
+    open_ = np.r_[start_price, close[:-1]] * np.exp(rng.normal(0, daily_vol / 4, num_bars))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, daily_vol / 2, num_bars)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, daily_vol / 2, num_bars)))
+    volume = rng.integers(100_000, 10_000_000, num_bars)
+    index = pd.bdate_range(start, periods=num_bars, name='Date')
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+def write_synthetic_universe(data_dir, num_tickers=SYNTHETIC_TICKERS, num_bars=SYNTHETIC_BARS, seed=SYNTHETIC_SEED):
+    """Writes num_tickers synthetic CSVs (SYN000_1d.csv, ...) with independent seeds derived from `seed`. Returns their paths."""
+    os.makedirs(data_dir, exist_ok=True)
+    paths = []
+    for i, child in enumerate(np.random.SeedSequence(seed).spawn(num_tickers)):
+        path = os.path.join(data_dir, f"SYN{i:03d}_1d.csv")
+        synthetic_ohlc(num_bars, seed=child).to_csv(path)
+        paths.append(path)
+    return paths
+
+# --- Stage timing ---
+
+class StageRecorder:
+    """Runs pipeline stages and records their wall time, or their peak traced memory when trace=True. Stage output
+    (report and chart messages) is swallowed so it does not drown the summary."""
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.values = {}
+
+    def __call__(self, name, fn):
+        if self.trace: tracemalloc.reset_peak()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter(); out = fn(); elapsed = time.perf_counter() - start
+        self.values[name] = self.values.get(name, 0.0) + (tracemalloc.get_traced_memory()[1] / 2**20 if self.trace else elapsed)
+        return out
+
+def _individual_pipeline(files, report_dir, ma_period, stage):
+    """Individual-backtester stages over every synthetic ticker. Returns the number of simulated bar-combinations."""
+    stage('load_csv', lambda: [data_cache.read_price_csv(f) for f in files])
+    frames = stage('load_cached', lambda: [data_cache.load_price_frame(f) for f in files])
+    def indicators():
+        data_cache.CACHE_ENABLED = False  # time the computation itself, not a cache read
+        try:
+            for f, df in zip(files, frames):
+                data_cache.add_indicators(df, f, ma_period); df.ffill(inplace=True); df.dropna(inplace=True)
+        finally: data_cache.CACHE_ENABLED = True
+    stage('indicators', indicators)
+    sma_col = f'SMA_{ma_period}'
+    runs = stage('simulation', lambda: [[backtest_engine.run_backtest_grid(df, mode, _grid_for_mode(mode), ib.INITIAL_CAPITAL, ib.COMMISSION_PCT, sma_col, record_stops=False)
+                                         for mode in BENCHMARK_MODES] for df in frames])
+    def metrics():
+        # Every simulated mode is summarized, so this stage covers the same runs as the simulation stage.
+        out = []
+        for df, per_mode in zip(frames, runs):
+            by_mode = []
+            for results in per_mode:
+                metrics_df = pd.DataFrame([r['metrics'] for r in results])
+                by_mode.append((metrics_df, max(range(len(results)), key=lambda k: results[k]['metrics']['Calmar Ratio'])))
+            out.append((by_mode, ib.calculate_benchmark_stats(df, ib.INITIAL_CAPITAL)))
+        return out
+    summaries = stage('metrics', metrics)
+    def reporting():
+        mode = BENCHMARK_MODES[0]
+        for f, df, (by_mode, bh_stats) in zip(files, frames, summaries):
+            ticker = os.path.basename(f).split('_')[0]
+            metrics_df, best = by_mode[0]
+            ib.generate_individual_report(ticker, metrics_df, metrics_df.iloc[best].to_dict(), bh_stats, report_dir, ma_period, len(df) / backtest_engine.bars_per_year(df.index),
+                                          df.index.min().strftime('%Y-%m-%d'), df.index.max().strftime('%Y-%m-%d'))
+            sl, pt = _grid_for_mode(mode)[best]
+            result = backtest_engine.run_backtest(df, mode, sl, pt, ib.INITIAL_CAPITAL, ib.COMMISSION_PCT, sma_col)
+            ib.generate_trade_chart(ticker, df, result['trades_log'], sma_col, report_dir, ma_period, mode, sl, pt, result['trailing_stop_series'])
+    stage('reporting', reporting)
+    return sum(len(df) * len(_grid_for_mode(mode)) for df in frames for mode in BENCHMARK_MODES)
+
+def _portfolio_pipeline(files, report_dir, ma_period, stage):
+    """Portfolio-backtester stages over the synthetic universe. Returns the number of simulated bar-combinations."""
+    df = stage('prepare', lambda: pb.prepare_all_data(files, ma_period))
+    panel = stage('panel', lambda: portfolio_engine.prepare_panel(df, ma_period))
+    grid = lambda mode: _grid_for_mode(mode, pb.STOP_LEVELS_PCT, pb.PROFIT_TARGETS_PCT)
+    results = stage('simulation', lambda: {mode: portfolio_engine.run_active_strategy_grid(df, mode, grid(mode), pb.INITIAL_PORTFOLIO_CAPITAL, ma_period, pb.MONEY_MARKET_RETURN_ANNUAL,
+                                                                                         pb.COMMISSION_PCT, panel=panel) for mode in BENCHMARK_MODES})
+    stage('benchmarks', lambda: (pb.run_rebalanced_benchmark(df, pb.INITIAL_PORTFOLIO_CAPITAL), pb.run_buy_and_forget_benchmark(df, pb.INITIAL_PORTFOLIO_CAPITAL)))
+    def reporting():
+        mode = BENCHMARK_MODES[0]
+        best = max(range(len(results[mode])), key=lambda k: results[mode][k]['Calmar'])
+        sl, pt = grid(mode)[best]
+        _, equity_curve, cash_curve = portfolio_engine.run_active_strategy(df, mode, sl, pt, pb.INITIAL_PORTFOLIO_CAPITAL, ma_period, pb.MONEY_MARKET_RETURN_ANNUAL, pb.COMMISSION_PCT, panel=panel)
+        pb.generate_equity_chart(df.index, equity_curve, cash_curve, report_dir, ma_period, mode)
+    stage('reporting', reporting)
+    return len(df) * sum(len(grid(mode)) for mode in BENCHMARK_MODES)
+
+def _measure(pipeline, files, work_dir, ma_period, memory):
+    timer = StageRecorder()
+    bar_combos = pipeline(files, work_dir, ma_period, timer)
+    stages = {name: {'seconds': seconds} for name, seconds in timer.values.items()}
+    if memory:
+        tracemalloc.start()
+        try:
+            tracer = StageRecorder(trace=True); pipeline(files, work_dir, ma_period, tracer)
+        finally: tracemalloc.stop()
+        for name, peak in tracer.values.items(): stages[name]['peak_mib'] = peak
+    sim_seconds = timer.values['simulation']
+    return {'stages': stages, 'total_seconds': sum(timer.values.values()), 'bar_combinations': bar_combos,
+            'bar_combinations_per_second': bar_combos / sim_seconds if sim_seconds > 0 else None}
+
+# --- Startup time ---
+
+_STARTUP_PROBE = """import sys, time
+start = time.perf_counter()
+if sys.argv[1]: __import__(sys.argv[1])
+print(time.perf_counter() - start, ','.join(m for m in sys.argv[2:] if m in sys.modules))"""
+
+def measure_startup(modules=STARTUP_MODULES, repeats=STARTUP_REPEATS):
+    """Wall time of a fresh interpreter that only imports each module, best of `repeats`, and the import time within
+    it; 'interpreter' is the bare interpreter for reference. Also lists the HEAVY_MODULES each import pulled in.
+    Returns {'stages': {module: {'seconds', 'import_seconds', 'heavy_modules'}}} so compare_to_baseline covers it."""
+    stages = {}
+    for module in ['', *modules]:
+        best = best_import = np.inf; heavy = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, '-c', _STARTUP_PROBE, module, *HEAVY_MODULES], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                 capture_output=True, text=True, check=True).stdout.split()
+            best = min(best, time.perf_counter() - start); best_import = min(best_import, float(out[0]))
+            heavy = out[1].split(',') if len(out) > 1 else []
+        stages[module or 'interpreter'] = {'seconds': best, 'import_seconds': best_import, 'heavy_modules': heavy}
+    return {'stages': stages}
+
+# --- Correctness cross-checks ---
+
+def cross_check_individual(files, ma_period):
+    """Engine vs run_backtest_reference on every SL/PT combination of every mode, and the one-pass grid vs single runs."""
+    sma_col = f'SMA_{ma_period}'
+    checked = mismatches = 0
+    for f in files:
+        df = ib.prepare_data(f, ma_period)
+        arrays = backtest_engine.prepare_arrays(df, sma_col)
+        for mode in BENCHMARK_MODES:
+            combos = _grid_for_mode(mode)
+            grid = backtest_engine.run_backtest_grid(df, mode, combos, ib.INITIAL_CAPITAL, ib.COMMISSION_PCT, sma_col, arrays=arrays)
+            for (sl, pt), from_grid in zip(combos, grid):
+                ref = ib.run_backtest_reference(df, mode, sl, pt, ib.INITIAL_CAPITAL, ib.COMMISSION_PCT, sma_col)
+                single = backtest_engine.run_backtest(df, mode, sl, pt, ib.INITIAL_CAPITAL, ib.COMMISSION_PCT, sma_col, arrays=arrays)
+                checked += 1; mismatches += not (results_match(ref, single) and results_match(ref, from_grid))
+    return {'runs': checked, 'mismatches': mismatches, 'passed': mismatches == 0}
+
+def cross_check_portfolio(files, ma_period, num_bars=CHECK_BARS):
+    """Panel engine vs run_active_strategy_reference (to rounding) on the last num_bars of the synthetic portfolio,
+    and the one-pass grid vs single runs, on every mode."""
+    df = pb.prepare_all_data(files, ma_period).iloc[-num_bars:]
+    checked = mismatches = 0
+    for mode in BENCHMARK_MODES:
+        combos = _grid_for_mode(mode, pb.STOP_LEVELS_PCT, pb.PROFIT_TARGETS_PCT)
+        grid = portfolio_engine.run_active_strategy_grid(df, mode, combos, pb.INITIAL_PORTFOLIO_CAPITAL, ma_period, pb.MONEY_MARKET_RETURN_ANNUAL, pb.COMMISSION_PCT)
+        for (sl, pt), from_grid in list(zip(combos, grid))[:2]:  # the reference loop is slow, so two combinations per mode
+            with contextlib.redirect_stdout(io.StringIO()):
+                ref, ref_equity, _ = pb.run_active_strategy_reference(df, mode, sl, pt, pb.INITIAL_PORTFOLIO_CAPITAL, ma_period, pb.MONEY_MARKET_RETURN_ANNUAL)
+            fast, fast_equity, _ = portfolio_engine.run_active_strategy(df, mode, sl, pt, pb.INITIAL_PORTFOLIO_CAPITAL, ma_period, pb.MONEY_MARKET_RETURN_ANNUAL, pb.COMMISSION_PCT)
+            ok = portfolio_metrics_match(ref, fast) and portfolio_metrics_match(fast, from_grid) and np.allclose(ref_equity, fast_equity, rtol=1e-9)
+            checked += 1; mismatches += not ok
+    return {'runs': checked, 'mismatches': mismatches, 'passed': mismatches == 0}
+
+# --- Suite ---
+
+def run_suite(num_bars=SYNTHETIC_BARS, num_tickers=SYNTHETIC_TICKERS, seed=SYNTHETIC_SEED, memory=True, checks=True, work_dir=None):
+    """Times every stage of both backtesters on a seeded synthetic universe, and their startup (measure_startup), and
+    cross-checks the engines against the reference implementations. Returns a JSON-serializable results dict (see compare_to_baseline)."""
+    results_store.STORE_ENABLED = False  # every run must simulate
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = work_dir or tmp
+        files = write_synthetic_universe(os.path.join(work_dir, 'data'), num_tickers, num_bars, seed)
+        for f in files: data_cache.load_price_frame(f)  # build the binary cache once, so the load stages are comparable
+        _warm_up_kernels()
+        results = {'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'), 'bars': num_bars, 'tickers': num_tickers, 'seed': seed,
+                            'ma_period': ib.MA_PERIOD, 'modes': BENCHMARK_MODES, 'numba': _numba_active(),
+                            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine()}}
+        results['individual'] = _measure(_individual_pipeline, files, os.path.join(work_dir, 'reports'), ib.MA_PERIOD, memory)
+        results['portfolio'] = _measure(_portfolio_pipeline, files, os.path.join(work_dir, 'reports'), pb.MA_PERIOD, memory)
+        results['startup'] = measure_startup()
+        if checks:
+            results['checks'] = {'individual': cross_check_individual(files[:CHECK_TICKERS], ib.MA_PERIOD),
+                                 'portfolio': cross_check_portfolio(files, pb.MA_PERIOD)}
+    return results
+
+def compare_to_baseline(current, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Per-stage comparison of two run_suite results. Returns a DataFrame with the time ratio of every stage and a
+    Regression flag for ratios above `tolerance` (and at least REGRESSION_MIN_SECONDS slower); stages missing
+    from either side are left out."""
+    rows = []
+    for section in ['individual', 'portfolio', 'startup']:
+        base_stages, cur_stages = baseline.get(section, {}).get('stages', {}), current.get(section, {}).get('stages', {})
+        for name in cur_stages:
+            if name not in base_stages: continue
+            base, cur = base_stages[name]['seconds'], cur_stages[name]['seconds']
+            ratio = cur / base if base > 0 else np.nan
+            rows.append({"Section": section, "Stage": name, "Baseline (s)": base, "Current (s)": cur, "Ratio": ratio,
+                         "Regression": bool(ratio > tolerance and cur - base >= REGRESSION_MIN_SECONDS)})
+    return pd.DataFrame(rows)
+
+def print_suite(results):
+    meta = results['meta']
+    print(f"Synthetic universe: {meta['tickers']} tickers x {meta['bars']} bars (seed {meta['seed']}), numba: {meta['numba']}\n")
+    for section in ['individual', 'portfolio']:
+        r = results[section]
+        table = pd.DataFrame([dict({"Stage": name}, **values) for name, values in r['stages'].items()])
+        print(f"--- {section.title()} backtester ({r['total_seconds']:.2f}s, {r['bar_combinations_per_second']:,.0f} bar-combinations/s in simulation) ---")
+        print(table.to_string(index=False, float_format=lambda x: f"{x:,.3f}") + "\n")
+    if 'startup' in results:
+        table = pd.DataFrame([{"Module": name, "Startup (s)": v['seconds'], "Import (s)": v['import_seconds'], "Heavy Modules": ', '.join(v['heavy_modules']) or '-'}
+                              for name, v in results['startup']['stages'].items()])
+        print(f"--- Startup (fresh interpreter, best of {STARTUP_REPEATS}) ---")
+        print(table.to_string(index=False, float_format=lambda x: f"{x:,.3f}") + "\n")
+    for section, check in results.get('checks', {}).items():
+        print(f"Cross-check {section}: {check['runs']} runs, {check['mismatches']} mismatches -> {'PASS' if check['passed'] else 'FAIL'}")
+
+def benchmark_individual_engine(stock_data_dir=BENCHMARK_DATA_DIR, ma_period=ib.MA_PERIOD, modes=BENCHMARK_MODES):
+    """Times the reference loop against the array engine over the full SL x PT grid of every mode, per ticker."""
+    sma_col = f'SMA_{ma_period}'
+    rows = []
+    for file_path in sorted(glob.glob(os.path.join(stock_data_dir, '*.csv'))):
+        ticker = os.path.basename(file_path).split('_')[0]
+        df = ib.prepare_data(file_path, ma_period)
+        if df is None or df.empty: continue
+        combos = [(mode, sl, pt) for mode in modes for sl, pt in _grid_for_mode(mode)]
+        start = time.perf_counter()
+        ref_results = [ib.run_backtest_reference(df, mode, sl, pt, ib.INITIAL_CAPITAL, ib.COMMISSION_PCT, sma_col) for mode, sl, pt in combos]
+        ref_time = time.perf_counter() - start
+        start = time.perf_counter()
+        arrays = backtest_engine.prepare_arrays(df, sma_col)
+        fast_results = [backtest_engine.run_backtest(df, mode, sl, pt, ib.INITIAL_CAPITAL, ib.COMMISSION_PCT, sma_col, arrays=arrays) for mode, sl, pt in combos]
+        fast_time = time.perf_counter() - start
+        identical = all(results_match(r, f) for r, f in zip(ref_results, fast_results))
+        rows.append({"Ticker": ticker, "Bars": len(df), "Runs": len(combos), "Reference (s)": ref_time,
+                     "Engine (s)": fast_time, "Speedup (x)": ref_time / fast_time if fast_time > 0 else np.nan, "Identical": identical})
+        print(f"  {ticker}: {ref_time:.2f}s -> {fast_time:.3f}s ({rows[-1]['Speedup (x)']:.1f}x), identical={identical}")
+    return pd.DataFrame(rows)
+
+def main(real_data=False, num_bars=SYNTHETIC_BARS, num_tickers=SYNTHETIC_TICKERS, seed=SYNTHETIC_SEED, output=SUITE_OUTPUT_PATH, baseline=None, memory=True, checks=True):
+    """Runs the synthetic suite, writes it to `output` as JSON and, given a baseline file, flags stage regressions
+    (exit status 1 on a regression, a failed cross-check or a HEAVY_MODULES import at startup). real_data=True instead prints the per-ticker speedup
+    of the array engine over the reference loop on BENCHMARK_DATA_DIR."""
+    if real_data:
+        print(f"Benchmarking single-asset engine on '{BENCHMARK_DATA_DIR}' (numba: {_numba_active()})...\n")
+        _warm_up_kernels()
+        results = benchmark_individual_engine()
+        if results.empty: print("Error: No CSV files found."); return 0
+        print("\n" + results.to_string(index=False, float_format=lambda x: f"{x:,.3f}"))
+        return 0 if results['Identical'].all() else 1
+    results = run_suite(num_bars, num_tickers, seed, memory, checks)
+    print_suite(results)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f: json.dump(results, f, indent=2)
+    print(f"\nResults saved to {output}")
+    failed = any(not check['passed'] for check in results.get('checks', {}).values())
+    eager = {name: v['heavy_modules'] for name, v in results['startup']['stages'].items() if v['heavy_modules']}
+    for name, heavy in eager.items(): print(f"  [Warning] Importing {name} loads {', '.join(heavy)}; it should be imported by the stage that needs it.")
+    failed |= bool(eager)
+    if baseline:
+        with open(baseline) as f: base = json.load(f)
+        if any(base['meta'].get(k) != results['meta'][k] for k in ['bars', 'tickers', 'seed']):
+            print(f"  [Warning] Baseline {baseline} was measured on a different synthetic universe; ratios are not comparable.")
+        comparison = compare_to_baseline(results, base)
+        print(f"\n--- Comparison with {baseline} (tolerance {REGRESSION_TOLERANCE:.2f}x) ---")
+        print(comparison.to_string(index=False, float_format=lambda x: f"{x:,.3f}"))
+        failed |= bool(comparison['Regression'].any()) if not comparison.empty else False
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark and profiling suite for the backtest engines.")
+    parser.add_argument('--bars', type=int, default=SYNTHETIC_BARS, help=f"Bars per synthetic ticker (default: {SYNTHETIC_BARS}).")
+    parser.add_argument('--tickers', type=int, default=SYNTHETIC_TICKERS, help=f"Synthetic universe size (default: {SYNTHETIC_TICKERS}).")
+    parser.add_argument('--seed', type=int, default=SYNTHETIC_SEED, help=f"Random seed of the synthetic prices (default: {SYNTHETIC_SEED}).")
+    parser.add_argument('--output', default=SUITE_OUTPUT_PATH, help=f"JSON results file (default: {SUITE_OUTPUT_PATH}).")
+    parser.add_argument('--baseline', help="Earlier results file to compare against; slower stages are flagged as regressions.")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the traced second pass that measures peak memory per stage.")
+    parser.add_argument('--no-checks', action='store_true', help="Skip the cross-checks against the reference implementations.")
+    parser.add_argument('--real-data', action='store_true', help=f"Time the reference loop against the engine per ticker of '{BENCHMARK_DATA_DIR}' instead.")
+    args = parser.parse_args()
+    sys.exit(main(args.real_data, args.bars, args.tickers, args.seed, args.output, args.baseline, not args.no_memory, not args.no_checks))
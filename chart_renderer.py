@@ -0,0 +1,142 @@
+import os
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Chart Rendering Configuration ---
+CHART_WORKERS = 1  # Processes drawing queued charts (--chart-workers); 1 draws them in the calling process
+SKIP_UNCHANGED_CHARTS = True  # Leave a PNG alone when the spec it was drawn from is unchanged (--rerender-charts turns this off)
+RENDER_VERSION = 1  # Bump whenever the drawing code changes, so every existing chart is drawn again once
+STYLE = 'seaborn-v0_8-whitegrid'
+DIGEST_KEY = 'Spec Digest'  # PNG text chunk holding the digest of the spec the image was drawn from
+
+def chart_prices(df, sma_cols):
+    """The dates, close and SMA arrays a ticker's trade charts draw. Build it once per ticker and pass it to every
+    trade_chart_spec: the specs then hold the same array objects, so pickling a list of them writes the arrays once."""
+    return {'dates': df.index.values, 'close': df['Close'].to_numpy(dtype=float), 'sma': {col: df[col].to_numpy(dtype=float) for col in sma_cols}}
+
+def trade_chart_spec(ticker, df, trades_log, sma_col, report_dir, ma_period, stop_loss_mode, stop_level_pct, pt_pct, trailing_stop_series, prices=None):
+    """Everything needed to draw one trade chart, as plain arrays and strings: cheap to pickle to a render process,
+    and free of the DataFrame. prices is the ticker's chart_prices, shared by its specs; built from df when omitted.
+    A trade still open at the end of the data gets its entry marker but no exit marker or lines."""
+    prices = prices if prices is not None else chart_prices(df, [sma_col])
+    sl_str = f"{stop_level_pct}%" if stop_level_pct is not None else "Struct"
+    pt_str = 'None' if pt_pct is None else str(pt_pct)
+    sl_filename_str = f"{stop_level_pct}" if stop_level_pct is not None else "Struct"
+    # Closed trades first, so a trade index into the exit arrays is also its index into the entry arrays.
+    trades = [t for t in trades_log if 'exit_date' in t]
+    entries = trades + [t for t in trades_log if 'exit_date' not in t]
+    entry_dates = pd.DatetimeIndex([t['entry_date'] for t in entries]).values
+    exit_dates = pd.DatetimeIndex([t['exit_date'] for t in trades]).values
+    pt_trades = [k for k, t in enumerate(trades) if t.get('pt_pct') is not None]
+    static_stops = stop_loss_mode in ('FIXED', 'PREVIOUS_YEAR_LOW')
+    return {
+        'ticker': ticker,
+        'path': os.path.join(report_dir, 'plots', 'individual', ticker, f"{ticker}_{ma_period}_{stop_loss_mode}_SL{sl_filename_str}_PT{pt_str}.png"),
+        'title': f"{ticker} Trades (MA:{ma_period}, Mode:{stop_loss_mode}, SL:{sl_str}, PT:{pt_str})",
+        'sma_label': f'SMA({ma_period})',
+        'dates': prices['dates'], 'close': prices['close'], 'sma': prices['sma'][sma_col],
+        'entry_dates': entry_dates, 'entry_prices': np.array([t['entry_price'] for t in entries], dtype=float),
+        'exit_dates': exit_dates, 'exit_prices': np.array([t['exit_price'] for t in trades], dtype=float),
+        # Horizontal lines from a trade's entry to its exit, as (trade index, price) rows.
+        'pt_lines': np.array([(k, trades[k]['entry_price'] * (1 + trades[k]['pt_pct'] / 100)) for k in pt_trades], dtype=float).reshape(-1, 2),
+        'sl_lines': np.array([(k, t['static_stop']) for k, t in enumerate(trades)] if static_stops else [], dtype=float).reshape(-1, 2),
+        'trailing_stop': np.asarray(trailing_stop_series, dtype=float) if stop_loss_mode == 'TRAILING' and trailing_stop_series is not None else None,
+        'has_pt_line': bool(pt_trades), 'has_sl_line': stop_loss_mode == 'TRAILING' or (static_stops and bool(trades)),
+    }
+
+def spec_digest(spec):
+    """Stable hash of a spec's content (array bytes, not object identity) plus RENDER_VERSION."""
+    h = hashlib.sha1(f"v{RENDER_VERSION}".encode())
+    for key, value in spec.items():
+        h.update(key.encode())
+        if isinstance(value, np.ndarray): h.update(f"{value.dtype.str}{value.shape}".encode()); h.update(np.ascontiguousarray(value).tobytes())
+        else: h.update(repr(value).encode())
+    return h.hexdigest()
+
+def _stored_digest(path):
+    try:
+        from PIL import Image
+        with Image.open(path) as image: return image.text.get(DIGEST_KEY)
+    except Exception: return None
+
+def _segments(lines, entry_dates, exit_dates):
+    """(trade index, price) rows -> LineCollection segments in matplotlib date units."""
+    import matplotlib.dates as mdates
+    lines = lines[np.isfinite(lines[:, 1])]
+    idx = lines[:, 0].astype(int)
+    x0, x1 = mdates.date2num(entry_dates[idx]), mdates.date2num(exit_dates[idx])
+    return np.stack([np.column_stack([x0, lines[:, 1]]), np.column_stack([x1, lines[:, 1]])], axis=1)
+
+def render_trade_chart(spec, skip_unchanged=False):
+    """Draws one trade chart on an Agg canvas: markers go in one scatter per side and the profit-target and stop
+    lines in one LineCollection each, instead of one artist per trade. Returns (path, rendered, draw seconds,
+    save seconds); with skip_unchanged=True an existing PNG drawn from an identical spec is left as it is."""
+    import matplotlib.style as mstyle
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    from matplotlib.lines import Line2D
+    path = spec['path']; digest = spec_digest(spec)
+    if skip_unchanged and os.path.exists(path) and _stored_digest(path) == digest: return path, False, 0.0, 0.0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    start = time.perf_counter()
+    with mstyle.context(STYLE):
+        fig = Figure(figsize=(16, 9)); FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.plot(spec['dates'], spec['close'], label='Close Price', color='black', linewidth=1)
+        ax.plot(spec['dates'], spec['sma'], label=spec['sma_label'], color='orange', linestyle='--', linewidth=1)
+        if len(spec['entry_dates']): ax.scatter(spec['entry_dates'], spec['entry_prices'], marker='^', color='g', s=100, zorder=3)
+        if len(spec['exit_dates']): ax.scatter(spec['exit_dates'], spec['exit_prices'], marker='v', color='r', s=100, zorder=3)
+        for lines, color in ((spec['pt_lines'], 'g'), (spec['sl_lines'], 'r')):
+            if len(lines): ax.add_collection(LineCollection(_segments(lines, spec['entry_dates'], spec['exit_dates']), colors=color, linestyles='--', linewidths=1.5))
+        if spec['trailing_stop'] is not None: ax.plot(spec['dates'], spec['trailing_stop'], color='r', linestyle='--', linewidth=1.5)
+        legend_elements = [
+            Line2D([0], [0], color='black', lw=1, label='Close Price'),
+            Line2D([0], [0], color='orange', linestyle='--', lw=1, label=spec['sma_label']),
+            Line2D([0], [0], marker='^', color='g', label='Buy', markersize=10, ls=''),
+            Line2D([0], [0], marker='v', color='r', label='Sell', markersize=10, ls='')]
+        if spec['has_pt_line']: legend_elements.append(Line2D([0], [0], color='g', linestyle='--', lw=1.5, label='Profit Target'))
+        if spec['has_sl_line']: legend_elements.append(Line2D([0], [0], color='r', linestyle='--', lw=1.5, label='Stop Loss'))
+        ax.set_title(spec['title'], fontsize=16)
+        ax.legend(handles=legend_elements)
+        ax.grid(True); fig.tight_layout()
+        drawn = time.perf_counter()
+        fig.savefig(path, dpi=100, metadata={DIGEST_KEY: digest})
+    return path, True, drawn - start, time.perf_counter() - drawn
+
+def _render_batch(specs, skip_unchanged):
+    return [(spec['ticker'],) + render_trade_chart(spec, skip_unchanged) for spec in specs]
+
+def _init_render_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+class RenderQueue:
+    """Chart rendering as its own stage. Simulations submit specs and carry on; with workers > 1 a process pool
+    on the Agg backend draws them meanwhile, otherwise they are drawn in this process. Each ticker's specs go out
+    in at most `workers` batches, so the chart_prices arrays their specs share are pickled once per batch, not per chart."""
+    def __init__(self, workers=CHART_WORKERS, skip_unchanged=SKIP_UNCHANGED_CHARTS):
+        self.workers, self.skip_unchanged = max(1, workers), skip_unchanged
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_render_worker) if self.workers > 1 else None
+        self.pending, self.done = [], []
+
+    def submit(self, specs):
+        if not specs: return
+        if self.executor is None: self.done.extend(_render_batch(specs, self.skip_unchanged)); return
+        size = -(-len(specs) // self.workers)
+        for i in range(0, len(specs), size): self.pending.append(self.executor.submit(_render_batch, specs[i:i + size], self.skip_unchanged))
+
+    def drain(self):
+        """Waits for every submitted chart and returns [(ticker, path, rendered, draw seconds, save seconds)] in submission order."""
+        for future in self.pending: self.done.extend(future.result())
+        self.pending, results, self.done = [], self.done, []
+        return results
+
+    def close(self):
+        if self.executor is not None: self.executor.shutdown()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close(); return False
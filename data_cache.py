@@ -0,0 +1,225 @@
+import io
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import instrumentation
+
+# --- Cache Configuration ---
+CACHE_ENABLED = True
+CACHE_DIR_NAME = '.cache'  # Created inside each data directory, next to the CSVs
+CACHE_FORMAT_VERSION = 2
+
+def _usecols(columns):
+    # The first column holds the timestamps: 'Date' for daily yfinance files, 'Datetime' for intraday ones.
+    return None if columns is None else (lambda col: col in ('Date', 'Datetime') or col in columns)
+
+def read_price_csv(file_path, columns=None):
+    """Parses a yfinance CSV and normalizes its timezone-aware dates to naive UTC timestamps. columns limits the parse to those columns."""
+    df = pd.read_csv(file_path, index_col=0, parse_dates=True, usecols=_usecols(columns))
+    df.index = pd.to_datetime(df.index, utc=True).tz_localize(None)
+    return df
+
+def read_price_chunks(file_path, chunk_bars, columns=None):
+    """read_price_csv for files too large to load at once: yields consecutive frames of at most chunk_bars rows."""
+    with pd.read_csv(file_path, index_col=0, parse_dates=True, usecols=_usecols(columns), chunksize=chunk_bars) as reader:
+        for df in reader:
+            df.index = pd.to_datetime(df.index, utc=True).tz_localize(None)
+            yield df
+
+def cache_dir_for(file_path):
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(os.path.dirname(file_path), CACHE_DIR_NAME, stem)
+
+def _file_sha1(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): digest.update(block)
+    return digest.hexdigest()
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_meta(cache_dir, meta):
+    tmp_path = os.path.join(cache_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f: json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(cache_dir, 'meta.json'))
+
+def _save_array(cache_dir, name, values):
+    tmp_path = os.path.join(cache_dir, f'{name}.tmp.npy')
+    np.save(tmp_path, np.ascontiguousarray(values))
+    os.replace(tmp_path, os.path.join(cache_dir, f'{name}.npy'))
+
+def _load_array(cache_dir, name):
+    # Copy-on-write mapping: pages are read lazily and in-place edits by pandas never reach the file.
+    return np.asarray(np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='c'))
+
+def _valid_meta(file_path, cache_dir):
+    """Returns the cache metadata if it still describes the source CSV, otherwise None.
+    A changed mtime/size alone triggers a hash comparison, so touching a file does not force a rebuild."""
+    meta = _read_meta(cache_dir)
+    if meta is None or meta.get('version') != CACHE_FORMAT_VERSION: return None
+    stat = os.stat(file_path)
+    if meta['source_mtime'] == stat.st_mtime_ns and meta['source_size'] == stat.st_size: return meta
+    if meta['source_size'] == stat.st_size and meta['source_sha1'] == _file_sha1(file_path):
+        meta['source_mtime'] = stat.st_mtime_ns
+        _write_meta(cache_dir, meta)
+        return meta
+    try:
+        return _append_new_rows(file_path, cache_dir, meta)
+    except (OSError, ValueError) as e:
+        print(f"  [Warning] Could not extend cache for {file_path}, rebuilding. Reason: {e}")
+        return None
+
+def _prefix_sha1(file_path, num_bytes):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        remaining = num_bytes
+        while remaining > 0:
+            block = f.read(min(1 << 20, remaining))
+            if not block: break
+            digest.update(block); remaining -= len(block)
+        f.seek(num_bytes - 1); last_byte = f.read(1)
+    return digest.hexdigest(), last_byte
+
+def _extend_indicator(name, old_df, new_df):
+    """Computes indicator `name` for the appended rows only, from the tail of the cached history:
+    the last period-1 closes for an SMA, the last two calendar years of lows for PrevYearLow."""
+    if name.startswith('SMA_'):
+        period = int(name[len('SMA_'):])
+        window = old_df['Close'].to_numpy(dtype=np.float64)[len(old_df) - (period - 1):] if period > 1 else np.empty(0)
+        combined = pd.Series(np.concatenate([window, new_df['Close'].to_numpy(dtype=np.float64)]))
+        return combined.rolling(period, min_periods=period).mean().to_numpy()[len(window):]
+    if name == 'PrevYearLow':
+        years = np.unique(old_df.index.year)
+        first_year = years[-2] if len(years) > 1 else years[-1]
+        tail = pd.concat([old_df.loc[old_df.index.year >= first_year, ['Low']], new_df[['Low']]])
+        tail['Year'] = tail.index.year
+        yearly_low = tail.groupby('Year')['Low'].min().shift(1)
+        return tail['Year'].map(yearly_low).to_numpy(dtype=np.float64)[len(tail) - len(new_df):]
+    return None
+
+def _append_new_rows(file_path, cache_dir, meta):
+    """Extends the cache in place when the CSV only had rows appended since it was built (the way the
+    downloader refreshes data): only the new bytes are parsed and only the new indicator values computed.
+    Returns the updated metadata, or None when the file was rewritten rather than appended to."""
+    stat = os.stat(file_path)
+    old_size = meta['source_size']
+    if stat.st_size <= old_size: return None
+    prefix_sha1, last_byte = _prefix_sha1(file_path, old_size)
+    if prefix_sha1 != meta['source_sha1'] or last_byte != b'\n': return None
+    with open(file_path, 'rb') as f:
+        f.seek(old_size); appended = f.read()
+    new_df = pd.read_csv(io.BytesIO(appended), header=None, names=meta['csv_header'], index_col=meta['index_name'], parse_dates=True)
+    new_df.index = pd.to_datetime(new_df.index, utc=True).tz_localize(None)
+    if list(new_df.columns) != meta['columns']: return None
+    old_df = _load_frame(cache_dir, meta)
+    if len(new_df) and len(old_df) and new_df.index[0] <= old_df.index[-1]: return None
+    indicators = {}
+    for name in meta['indicators']:
+        values = _extend_indicator(name, old_df, new_df)
+        if values is not None: indicators[name] = np.concatenate([_load_array(cache_dir, f'ind_{name}'), values])
+    columns = {col: np.concatenate([old_df[col].to_numpy(), new_df[col].to_numpy()]) for col in meta['columns']}
+    index = np.concatenate([old_df.index.to_numpy(), new_df.index.to_numpy()])
+    del old_df  # release the memory maps before the files underneath them are replaced
+    _save_array(cache_dir, 'index', index)
+    for col, values in columns.items(): _save_array(cache_dir, f'col_{col}', values)
+    for name, values in indicators.items(): _save_array(cache_dir, f'ind_{name}', values)
+    meta.update({'source_mtime': stat.st_mtime_ns, 'source_size': stat.st_size, 'source_sha1': _file_sha1(file_path), 'indicators': list(indicators)})
+    _write_meta(cache_dir, meta)
+    return meta
+
+def _build_cache(file_path, cache_dir):
+    df = read_price_csv(file_path)
+    with open(file_path) as f: csv_header = f.readline().strip().split(',')
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    _save_array(cache_dir, 'index', df.index.to_numpy())
+    for col in df.columns: _save_array(cache_dir, f'col_{col}', df[col].to_numpy())
+    stat = os.stat(file_path)
+    meta = {'version': CACHE_FORMAT_VERSION, 'source_mtime': stat.st_mtime_ns, 'source_size': stat.st_size,
+            'source_sha1': _file_sha1(file_path), 'index_name': df.index.name, 'csv_header': csv_header,
+            'columns': list(df.columns), 'indicators': []}
+    _write_meta(cache_dir, meta)
+    return df, meta
+
+def _load_frame(cache_dir, meta, columns=None):
+    index = pd.DatetimeIndex(_load_array(cache_dir, 'index'), name=meta['index_name'])
+    return pd.DataFrame({col: _load_array(cache_dir, f'col_{col}') for col in (meta['columns'] if columns is None else columns)}, index=index, copy=False)
+
+def load_price_frame(file_path, columns=None):
+    """Returns the parsed, tz-normalized OHLCV frame for a CSV, from the binary cache when it is up to date.
+    columns limits the frame to those columns; the others are then never read from the cache."""
+    if not CACHE_ENABLED: return read_price_csv(file_path, columns)
+    cache_dir = cache_dir_for(file_path)
+    meta = _valid_meta(file_path, cache_dir)
+    instrumentation.count('price cache hits' if meta is not None else 'price cache rebuilds')
+    if meta is None:
+        try:
+            df, _ = _build_cache(file_path, cache_dir)
+            return df if columns is None else df[list(columns)]
+        except OSError as e:
+            print(f"  [Warning] Could not write cache for {file_path}. Reason: {e}")
+            return read_price_csv(file_path, columns)
+    return _load_frame(cache_dir, meta, columns)
+
+def cached_indicator(file_path, name, compute):
+    """Returns indicator column `name` (e.g. 'SMA_52') for a CSV, calling compute() and storing the result
+    only when it is not cached yet. Entries are extended when rows are appended to the CSV and dropped when it is rewritten."""
+    if not CACHE_ENABLED: return compute()
+    cache_dir = cache_dir_for(file_path)
+    meta = _valid_meta(file_path, cache_dir)
+    if meta is not None and name in meta['indicators']:
+        return _load_array(cache_dir, f'ind_{name}')
+    values = np.asarray(compute())
+    if meta is not None:
+        try:
+            _save_array(cache_dir, f'ind_{name}', values)
+            meta['indicators'].append(name)
+            _write_meta(cache_dir, meta)
+        except OSError as e:
+            print(f"  [Warning] Could not cache {name} for {file_path}. Reason: {e}")
+    return values
+
+def sma_matrix(close, periods):
+    """Simple moving averages of `close` for every period in `periods` as an (bars x periods) array, all taken from
+    one shared cumulative-sum array: SMA_p[i] = (csum[i+1] - csum[i+1-p]) / p. Bars before a full window are NaN."""
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full((len(close), len(periods)), np.nan)
+    if np.isnan(close).any():  # a NaN would poison the running sum, so gaps fall back to per-period windows
+        for j, p in enumerate(periods): out[:, j] = pd.Series(close).rolling(p, min_periods=p).mean().to_numpy()
+        return out
+    csum = np.concatenate([[0.0], np.cumsum(close)])
+    for j, p in enumerate(periods):
+        if 0 < p <= len(close): out[p - 1:, j] = (csum[p:] - csum[:-p]) / p
+    return out
+
+def add_smas(df, file_path, ma_periods):
+    """Adds an SMA_<p> column for every p in ma_periods. Whatever is not cached yet is computed in a single
+    sma_matrix pass over the closes."""
+    ma_periods = list(ma_periods)
+    shared = {}
+    def column(j):
+        def compute():
+            if 'values' not in shared: shared['values'] = sma_matrix(df['Close'].to_numpy(), ma_periods)
+            return shared['values'][:, j]
+        return compute
+    for j, period in enumerate(ma_periods):
+        df[f'SMA_{period}'] = cached_indicator(file_path, f'SMA_{period}', column(j))
+    return df
+
+def add_indicators(df, file_path, ma_period, extra_ma_periods=()):
+    """Adds the SMA, Year and PrevYearLow columns used by both backtesters, reusing cached values when possible.
+    extra_ma_periods adds further SMA columns, computed in the same pass."""
+    add_smas(df, file_path, [ma_period, *extra_ma_periods])
+    df['Year'] = df.index.year
+    def prev_year_low():
+        yearly_low = df.groupby('Year')['Low'].min().shift(1)
+        return df['Year'].map(yearly_low).to_numpy(dtype=np.float64)
+    df['PrevYearLow'] = cached_indicator(file_path, 'PrevYearLow', prev_year_low)
+    return df
@@ -1,52 +1,183 @@
-import yfinance as yf
-import pandas as pd
+import io
 import os
+import time
+import shutil
+import argparse
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
 
 # --- Step 1: Define Tickers and Parameters ---
 #tickers = ['SPY', 'AGG', 'GLD', 'QQQ', 'EFA', 'AAPL', 'MSFT']
 public_tickers = ['TQQQ']
-# We need a reference index for our custom funds, so we'll grab it from AGG.
-reference_index = None
-end_date = datetime.today()
-start_date = end_date - timedelta(days=30 * 365)
+history_years = 30  # Window pulled for a ticker that has no CSV yet; existing CSVs only fetch the missing range
 interval = '1d'
 output_dir = 'stockData'
 
-# --- Step 2: Create Directory ---
-try:
-    os.makedirs(output_dir, exist_ok=True)
-    print(f"Directory '{output_dir}' created or already exists.")
-except Exception as e:
-    print(f"Error creating directory: {e}")
-    exit()
-
-# --- Step 3: Download Data with the Explicit Fix ---
-print("\nStarting data download...")
-
-for ticker in public_tickers:
-    print(f"Processing {ticker}...")
-    try:
-        ticker_obj = yf.Ticker(ticker)
-        data = ticker_obj.history(start=start_date, end=end_date, interval=interval, auto_adjust=True)
-        
-        # <<< FIX #1: REMOVE TIMEZONE INFORMATION >>>
-        # This makes the index 'timezone-naive' so it can match our generated files.
-        data.index = data.index.tz_localize(None)
-
-        if not data.empty:
-            if reference_index is None:
-                reference_index = data.index # Save the clean index from the first successful download
-            
-            columns_to_drop = ['Dividends', 'Stock Splits', 'Capital Gains']
-            data = data.drop(columns=[col for col in columns_to_drop if col in data.columns], errors='ignore')
-            file_path = os.path.join(output_dir, f"{ticker}_{interval}.csv")
-            data.to_csv(file_path)
-        print(f"\nSuccessfully saved data for {ticker} to {file_path}")
-
-    except Exception as e:
-        print(f"An error occurred while processing {ticker}: {e}")
-
-print("\n------------------------------------")
-print("All downloads complete.")
-print("------------------------------------")
\ No newline at end of file
+# --- Download Configuration ---
+MAX_WORKERS = 8  # Tickers fetched concurrently
+MAX_RETRIES = 3  # Extra attempts per ticker after a failed request
+BACKOFF_SECONDS = 1.0  # Wait before the first retry, doubled on each further retry
+COLUMNS_TO_DROP = ['Dividends', 'Stock Splits', 'Capital Gains']
+ACTION_COLUMNS = ['Dividends', 'Stock Splits']  # A non-zero value in a fetched bar moves the adjustment basis of all earlier bars
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+OVERLAP_RTOL = 1e-4  # Re-fetched last stored bar must match the CSV this closely, or the full history is rewritten
+
+class YahooProvider:
+    """Network layer: fetches OHLCV history from Yahoo Finance. Any object with the same history()
+    method can be passed to refresh_tickers instead, e.g. StaticProvider for offline runs."""
+    def history(self, ticker, start, end, interval):
+        import yfinance as yf
+        return yf.Ticker(ticker).history(start=start, end=end, interval=interval, auto_adjust=True)
+
+class StaticProvider:
+    """Serves canned frames ({ticker: DataFrame}) sliced to the requested [start, end) range, without touching the network."""
+    def __init__(self, frames):
+        self.frames = frames
+        self.requests = []
+
+    def history(self, ticker, start, end, interval):
+        self.requests.append((ticker, start, end, interval))
+        df = self.frames[ticker]
+        naive_index = df.index.tz_localize(None) if df.index.tz is not None else df.index
+        return df[(naive_index >= pd.Timestamp(start)) & (naive_index < pd.Timestamp(end))]
+
+def csv_path_for(ticker, data_dir=output_dir, bar_interval=interval):
+    return os.path.join(data_dir, f"{ticker}_{bar_interval}.csv")
+
+def read_last_row(file_path):
+    """Returns (header columns, last stored row as strings) of a CSV by reading only its first line and its tail,
+    or None when the file has no data rows."""
+    with open(file_path, 'rb') as f:
+        header = f.readline().decode().strip().split(',')
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        tail = b''
+        while size > 0 and tail.strip().count(b'\n') < 1:
+            step = min(4096, size); size -= step
+            f.seek(size); tail = f.read(step) + tail
+    rows = [line for line in tail.decode().strip().splitlines() if line]
+    if len(rows) < 1 or rows[-1].split(',') == header: return None
+    return header, rows[-1].split(',')
+
+def fetch_with_retry(provider, ticker, start, end, bar_interval, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    """Calls provider.history, retrying failed requests with exponential backoff before giving up."""
+    for attempt in range(retries + 1):
+        try:
+            return provider.history(ticker, start, end, bar_interval)
+        except Exception:
+            if attempt == retries: raise
+            time.sleep(backoff * 2 ** attempt)
+
+def check_columns(data, header):
+    """Raises when fetched bars lack a column the CSV stores, instead of writing made-up values for it."""
+    missing = [col for col in header[1:] if col not in data.columns]
+    if missing: raise ValueError(f"provider returned no {', '.join(missing)} column(s)")
+
+def _format_rows(data, header, keep_tz):
+    """Renders new bars as CSV text in the column order and date style of an existing file (no header)."""
+    data = data.copy()
+    if not keep_tz and data.index.tz is not None: data.index = data.index.tz_localize(None)
+    data.index.name = header[0]
+    data = data[header[1:]]
+    buffer = io.StringIO()
+    data.to_csv(buffer, header=False)
+    return buffer.getvalue()
+
+def append_rows_atomically(file_path, text):
+    """Appends `text` to a CSV by writing the extended file next to it and swapping it in, so readers never
+    see a partial append. The original bytes are kept unchanged, which lets the data cache extend itself in place."""
+    tmp_path = file_path + '.tmp'
+    with open(file_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+        if dst.tell() > 0:
+            src.seek(-1, os.SEEK_END)
+            if src.read(1) != b'\n': dst.write(b'\n')
+        dst.write(text.encode())
+    os.replace(tmp_path, file_path)
+
+def write_csv_atomically(file_path, data):
+    tmp_path = file_path + '.tmp'
+    data.to_csv(tmp_path)
+    os.replace(tmp_path, file_path)
+
+def download_full_history(ticker, provider, start_date, end_date, file_path, bar_interval=interval):
+    """Fetches [start_date, end_date) and writes it as a fresh CSV. Returns the number of bars written (0 if none)."""
+    data = fetch_with_retry(provider, ticker, start_date, end_date, bar_interval)
+    if data is None or data.empty: return 0
+    # Remove timezone information so the index matches our generated files.
+    if data.index.tz is not None: data.index = data.index.tz_localize(None)
+    data = data.drop(columns=[col for col in COLUMNS_TO_DROP if col in data.columns], errors='ignore')
+    write_csv_atomically(file_path, data)
+    return len(data)
+
+def overlap_matches(stored_row, header, fetched_bar):
+    """True when the re-fetched copy of the last stored bar has the stored prices, i.e. the provider's adjustment
+    basis has not moved (no split or dividend) since the CSV was written."""
+    for col in PRICE_COLUMNS:
+        if col not in header: continue
+        if not np.isclose(float(stored_row[header.index(col)]), float(fetched_bar[col]), rtol=OVERLAP_RTOL): return False
+    return True
+
+def refresh_ticker(ticker, provider, end_date, data_dir=output_dir, bar_interval=interval, years=history_years):
+    """Brings one ticker's CSV up to end_date: fetches only the range from its last stored bar on, or the full
+    history window when there is no CSV yet. The last stored bar is fetched again as an overlap: prices are
+    adjusted for splits and dividends, so when it no longer matches the CSV, or a fetched bar carries a corporate
+    action, the whole history is rewritten on the new basis instead of appended to. Returns a one-line status message."""
+    file_path = csv_path_for(ticker, data_dir, bar_interval)
+    last_row = read_last_row(file_path) if os.path.exists(file_path) else None
+    if last_row is None:
+        num_bars = download_full_history(ticker, provider, end_date - timedelta(days=years * 365), end_date, file_path, bar_interval)
+        return f"{ticker}: downloaded {num_bars} bars to {file_path}" if num_bars else f"{ticker}: no data returned"
+    header, stored_row = last_row
+    last_date_str = stored_row[0]
+    last_date = pd.to_datetime(last_date_str, utc=True).tz_localize(None)
+    daily = bar_interval.endswith(('d', 'wk', 'mo'))
+    next_start = last_date.normalize() + timedelta(days=1) if daily else last_date
+    if next_start >= end_date: return f"{ticker}: already up to date ({last_date_str})"
+    data = fetch_with_retry(provider, ticker, last_date.normalize() if daily else last_date, end_date, bar_interval)
+    if data is None or data.empty: return f"{ticker}: already up to date ({last_date_str})"
+    check_columns(data, header)
+    keep_tz = len(last_date_str) > 19  # stored dates carry a UTC offset, e.g. '1980-12-12 00:00:00-05:00'
+    if data.index.tz is None: new_dates = data.index
+    else: new_dates = (data.index.tz_convert('UTC') if keep_tz else data.index).tz_localize(None)
+    overlap, data = data[new_dates == last_date], data[new_dates > last_date]
+    if data.empty: return f"{ticker}: already up to date ({last_date_str})"
+    actions = data.reindex(columns=[col for col in ACTION_COLUMNS if col in data.columns]).fillna(0.0)
+    if overlap.empty or not overlap_matches(stored_row, header, overlap.iloc[-1]) or (actions != 0).any().any():
+        first_date = pd.to_datetime(pd.read_csv(file_path, index_col=0, nrows=1).index[0], utc=True).tz_localize(None)
+        num_bars = download_full_history(ticker, provider, first_date.normalize(), end_date, file_path, bar_interval)
+        if not num_bars: return f"{ticker}: [Error] adjustment basis changed but the full re-download returned no data"
+        return f"{ticker}: adjustment basis changed (split or dividend), rewrote {num_bars} bars to {file_path}"
+    append_rows_atomically(file_path, _format_rows(data, header, keep_tz))
+    return f"{ticker}: appended {len(data)} new bars to {file_path}"
+
+def refresh_tickers(tickers, provider=None, end_date=None, data_dir=output_dir, bar_interval=interval, workers=MAX_WORKERS):
+    """Refreshes every ticker through a bounded thread pool. Statuses come back in ticker order, and a ticker
+    that still fails after its retries is reported without stopping the others."""
+    provider = provider if provider is not None else YahooProvider()
+    end_date = end_date if end_date is not None else pd.Timestamp(datetime.today()).normalize() + timedelta(days=1)
+    os.makedirs(data_dir, exist_ok=True)
+    def run(ticker):
+        try:
+            return refresh_ticker(ticker, provider, end_date, data_dir, bar_interval)
+        except Exception as e:
+            return f"{ticker}: [Error] {e}"
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(run, tickers))
+
+def main(tickers=public_tickers, workers=MAX_WORKERS):
+    print(f"Refreshing {len(tickers)} tickers in '{output_dir}' ({interval}, {workers} workers)...\n")
+    for status in refresh_tickers(tickers, workers=workers):
+        print(f"  {status}")
+    print("\n------------------------------------")
+    print("All downloads complete.")
+    print("------------------------------------")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental Yahoo Finance downloader.")
+    parser.add_argument('tickers', nargs='*', default=public_tickers, help="Tickers to refresh (default: public_tickers).")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help=f"Number of concurrent downloads (default: {MAX_WORKERS}).")
+    args = parser.parse_args()
+    main(args.tickers, workers=args.workers)
@@ -1,10 +1,22 @@
 import pandas as pd
-import pandas_ta as ta
 import os
+import io
 import glob
+import argparse
+import contextlib
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
+import backtest_engine
+import chart_renderer
+import data_cache
+import results_store
+import instrumentation
+import metrics
+import position_sizing
+import robustness
+import streaming
+import walk_forward
 
 # --- Configuration Parameters ---
 STOCK_DATA_DIR = 'stockData'
@@ -19,21 +31,74 @@ STOP_LOSS_MODE = 'PREVIOUS_YEAR_LOW' # Options: 'TRAILING', 'FIXED', 'PREVIOUS_Y
 # --- <<< CHOOSE YOUR PLOTTING MODE HERE >>> ---
 PLOT_ONLY_OPTIMAL_STRATEGY = True # Set to False to generate a chart for every single combination
 
+# --- <<< CHOOSE YOUR ENGINE MODE HERE >>> ---
+GRID_MODE = True # Simulate the whole SL x PT grid in one pass over the data; False runs each combination separately
+INCREMENTAL_MODE = False # Resume each ticker's grid from its saved end-of-data checkpoint and simulate only new bars (needs GRID_MODE)
+CHECKPOINT_DIR = os.path.join(REPORTS_DIR, 'checkpoints')
+
 # These lists are used for 'TRAILING' and 'FIXED' modes
 STOP_LEVELS_PCT = [10, 15, 20, 25, 30]
 PROFIT_TARGETS_PCT = [None, 50, 100, 150, 200]
 
-def prepare_data(file_path, ma_period):
-    """Loads data and calculates indicators, including previous year's low."""
+# --- <<< RANKING (--rank-by) >>> ---
+RANK_METRIC = 'Calmar' # Ratio the optimal combination is chosen by: 'Calmar', 'Sharpe' or 'Sortino'
+
+# --- <<< MA SWEEP (--ma-periods) >>> ---
+MA_SWEEP_PERIODS = [] # e.g. [20, 50, 200]: simulate the full MA x SL x PT surface in one pass instead of MA_PERIOD alone
+
+# --- <<< WALK-FORWARD MODE (--walk-forward) >>> ---
+WALK_FORWARD_MA_PERIODS = [20, 50, 200] # MA periods optimized alongside SL/PT on each training window
+WALK_FORWARD_TRAIN_YEARS = 10
+WALK_FORWARD_TEST_YEARS = 2
+
+# --- <<< ROBUSTNESS ANALYSIS (--robustness N) >>> ---
+ROBUSTNESS_PATHS = 0 # e.g. 10000: resample the optimal combination this many times and add confidence intervals to its report
+ROBUSTNESS_METHOD = 'block' # 'block' (daily-return blocks), 'trades' (trades drawn with replacement) or 'shuffle' (trade order permuted)
+ROBUSTNESS_WORKERS = 1 # Processes sharing each ticker's resampled paths (--robustness-workers)
+
+# --- <<< STREAMING MODE (--stream) >>> ---
+STREAM_MODE = False # Read each CSV in chunks and carry indicators and simulation across them, for intraday files too large to load at once
+STREAM_CHUNK_BARS = streaming.CHUNK_BARS # Rows per chunk (--chunk-bars)
+
+# --- <<< POSITION SIZING (--sizing) >>> ---
+SIZING_MODEL = 'EQUAL' # Options: 'EQUAL' (all equity into each trade), 'FIXED_FRACTIONAL', 'VOL_TARGET' (see position_sizing)
+SIZING_FRACTION = position_sizing.FRACTION # 'FIXED_FRACTIONAL': share of equity per trade (--sizing-fraction)
+SIZING_TARGET_VOL = position_sizing.TARGET_VOL # 'VOL_TARGET': annualized volatility each trade is scaled to (--target-vol)
+
+def configure(data_dir=None, reports_dir=None, ma_period=None, stop_loss_mode=None, sizing_model=None, sizing_fraction=None, target_vol=None):
+    """Overrides STOCK_DATA_DIR, REPORTS_DIR (and CHECKPOINT_DIR inside it), MA_PERIOD, STOP_LOSS_MODE and the SIZING_*
+    settings for this process, so a run is chosen from the command line or by batch_runner instead of by editing them.
+    None keeps a value."""
+    global STOCK_DATA_DIR, REPORTS_DIR, CHECKPOINT_DIR, MA_PERIOD, STOP_LOSS_MODE, SIZING_MODEL, SIZING_FRACTION, SIZING_TARGET_VOL
+    if data_dir is not None: STOCK_DATA_DIR = data_dir
+    if reports_dir is not None: REPORTS_DIR = reports_dir; CHECKPOINT_DIR = os.path.join(reports_dir, 'checkpoints')
+    if ma_period is not None: MA_PERIOD = ma_period
+    if stop_loss_mode is not None: STOP_LOSS_MODE = stop_loss_mode
+    if sizing_model is not None: SIZING_MODEL = sizing_model
+    if sizing_fraction is not None: SIZING_FRACTION = sizing_fraction
+    if target_vol is not None: SIZING_TARGET_VOL = target_vol
+
+def _settings():
+    """The configure() arguments that reproduce this process's settings, for pool workers that do not inherit them."""
+    return {'data_dir': STOCK_DATA_DIR, 'reports_dir': REPORTS_DIR, 'ma_period': MA_PERIOD, 'stop_loss_mode': STOP_LOSS_MODE,
+            'sizing_model': SIZING_MODEL, 'sizing_fraction': SIZING_FRACTION, 'target_vol': SIZING_TARGET_VOL}
+
+def _configure_worker(settings):
+    # Pool initializer: a spawned worker re-imports this module with its defaults, so the parent's settings are applied again.
+    configure(**settings)
+
+def sizing_spec():
+    """The position_sizing spec of the SIZING_* settings."""
+    return position_sizing.spec(SIZING_MODEL, fraction=SIZING_FRACTION, target_vol=SIZING_TARGET_VOL)
+
+def prepare_data(file_path, ma_period, extra_ma_periods=()):
+    """Loads data and calculates indicators, including previous year's low. extra_ma_periods adds further SMA columns."""
+    ticker = os.path.basename(file_path).split('_')[0]
     try:
-        df = pd.read_csv(file_path, index_col='Date', parse_dates=True)
-        df.index = pd.to_datetime(df.index, utc=True).tz_localize(None)
+        with instrumentation.stage('load', ticker): df = data_cache.load_price_frame(file_path)
         if not all(col in df.columns for col in ['Open', 'High', 'Low', 'Close']):
             raise ValueError("Data file must contain Open, High, Low, Close columns.")
-        df.ta.sma(length=ma_period, append=True, col_names=(f'SMA_{ma_period}',))
-        df['Year'] = df.index.year
-        yearly_low = df.groupby('Year')['Low'].min().shift(1)
-        df['PrevYearLow'] = df['Year'].map(yearly_low)
+        with instrumentation.stage('indicators', ticker, bars=len(df)): data_cache.add_indicators(df, file_path, ma_period, extra_ma_periods)
         df.ffill(inplace=True)
         df.dropna(inplace=True)
         return df
@@ -41,34 +106,35 @@ def prepare_data(file_path, ma_period):
         print(f"  [Error] Could not process {file_path}. Reason: {e}")
         return None
 
+BENCHMARK_METRICS = backtest_engine.BENCHMARK_METRICS
+
 def calculate_benchmark_stats(df, start_capital):
     # This function is correct
-    if df.empty or start_capital <= 0: return {"P&L ($)": 0, "CAGR (%)": 0, "Max Drawdown (%)": 0, "Calmar Ratio": 0}
+    if df.empty or start_capital <= 0: return dict.fromkeys(BENCHMARK_METRICS, 0)
     start_price = df['Open'].iloc[0]
-    if start_price <= 0: return {"P&L ($)": 0, "CAGR (%)": 0, "Max Drawdown (%)": 0, "Calmar Ratio": 0}
-    end_price = df['Close'].iloc[-1]
-    num_shares = start_capital / start_price
-    final_equity = num_shares * end_price
-    equity_curve = (start_capital / start_price) * df['Close']
-    peak = equity_curve.expanding(min_periods=1).max()
-    drawdown = (equity_curve - peak) / peak
-    max_drawdown = abs(drawdown.min()) * 100
-    num_years = len(df) / 252 
-    cagr = ((final_equity / start_capital) ** (1 / num_years) - 1) * 100 if num_years > 0 else 0
-    calmar = cagr / max_drawdown if max_drawdown > 0 else 0
-    return { "P&L ($)": final_equity - start_capital, "CAGR (%)": cagr, "Max Drawdown (%)": max_drawdown, "Calmar Ratio": calmar }
-
-def run_backtest(df, stop_loss_mode, stop_level_pct, profit_target_pct, initial_capital, commission_pct, sma_col):
-    # This function is correct
+    if start_price <= 0: return dict.fromkeys(BENCHMARK_METRICS, 0)
+    equity_curve = (start_capital / start_price) * df['Close'].to_numpy(dtype=np.float64)
+    year_bars = backtest_engine.bars_per_year(df.index)
+    return backtest_engine.buy_and_hold_summary(equity_curve[-1], metrics.curve_stats(equity_curve, year_bars), start_capital, len(df), year_bars)
+
+def run_backtest(df, stop_loss_mode, stop_level_pct, profit_target_pct, initial_capital, commission_pct, sma_col, arrays=None):
+    """Runs one SL/PT combination on the array engine, or fetches it from the results store when the data and
+    parameters were seen before. Trades are identical to run_backtest_reference, metrics to within rounding."""
+    return results_store.backtest_run(df, stop_loss_mode, stop_level_pct, profit_target_pct, initial_capital, commission_pct, sma_col, arrays=arrays)
+
+def run_backtest_reference(df, stop_loss_mode, stop_level_pct, profit_target_pct, initial_capital, commission_pct, sma_col, sizing=None):
+    """Original bar-by-bar implementation, kept as the correctness reference for the array engine.
+    sizing is a position_sizing spec; by default every entry puts all cash into the position."""
+    weight = position_sizing.entry_weights(sizing, df['High'], df['Low'], df['Close'], backtest_engine.bars_per_year(df.index))
     in_position = False; entry_price = 0; peak_price_since_entry = 0; num_shares = 0
     static_stop_price = 0
     cash = initial_capital
-    equity_curve = [initial_capital]
+    equity_curve = [initial_capital]; invested_curve = [0.0]
     trades_log = []
     trailing_stop_series = [np.nan] * len(df)
     for i in range(1, len(df)):
         current_equity = (num_shares * df['Close'].iloc[i-1] if in_position else 0) + cash
-        equity_curve.append(current_equity)
+        equity_curve.append(current_equity); invested_curve.append(num_shares * df['Close'].iloc[i-1] if in_position else 0.0)
         if in_position:
             exit_price = -1; exit_reason = ""
             if stop_loss_mode == 'TRAILING':
@@ -93,11 +159,12 @@ def run_backtest(df, stop_loss_mode, stop_level_pct, profit_target_pct, initial_
             prev_prev_close, prev_prev_sma = df['Close'].iloc[i-2], df[sma_col].iloc[i-2]
             if prev_prev_close <= prev_prev_sma and prev_close > prev_sma:
                 entry_price_candidate = df['Open'].iloc[i]
-                if entry_price_candidate > 0:
+                if entry_price_candidate > 0 and weight[i] > 0:
                     entry_price = entry_price_candidate
                     peak_price_since_entry = entry_price
-                    num_shares = (cash * (1-commission_pct)) / entry_price
-                    cash = 0
+                    invested = cash * weight[i]
+                    num_shares = (invested * (1-commission_pct)) / entry_price
+                    cash -= invested
                     in_position = True
                     if stop_loss_mode == 'FIXED': static_stop_price = entry_price * (1 - stop_level_pct / 100)
                     elif stop_loss_mode == 'PREVIOUS_YEAR_LOW': static_stop_price = df['PrevYearLow'].iloc[i]
@@ -106,76 +173,29 @@ def run_backtest(df, stop_loss_mode, stop_level_pct, profit_target_pct, initial_
         final_equity = (num_shares * df['Close'].iloc[-1]) + cash
         trades_log[-1].update({ 'exit_date': df.index[-1], 'exit_price': df['Close'].iloc[-1], 'reason': 'End of Data', 'static_stop': static_stop_price})
     else: final_equity = equity_curve[-1]
-    final_pnl = final_equity - initial_capital
-    num_years = len(df) / 252
-    cagr = ((final_equity / initial_capital) ** (1 / num_years) - 1) * 100 if num_years > 0 else 0
-    eq_series = pd.Series(equity_curve)
-    peak = eq_series.expanding(min_periods=1).max()
-    drawdown = (eq_series - peak) / peak
-    max_drawdown = abs(drawdown.min()) * 100
-    calmar = cagr / max_drawdown if max_drawdown > 0 else 0
-    wins = sum(1 for t in trades_log if t.get('exit_price', 0) > t.get('entry_price', 0))
-    percent_profitable = (wins / len(trades_log) * 100) if trades_log else 0
+    year_bars = backtest_engine.bars_per_year(df.index)
+    stats = metrics.curve_stats(equity_curve, year_bars, invested=invested_curve)
     return {
-        "metrics": {
-            "Stop Level (%)": stop_level_pct if stop_level_pct is not None else "N/A", 
-            "Profit Target (%)": "None" if profit_target_pct is None else profit_target_pct,
-            "P&L ($)": final_pnl, "CAGR (%)": cagr, "Max Drawdown (%)": max_drawdown, 
-            "Calmar Ratio": calmar, "Total Trades": len(trades_log), "% Profitable": percent_profitable,
-        }, "trades_log": trades_log, "trailing_stop_series": trailing_stop_series }
-
-def generate_trade_chart(ticker, df, trades_log, sma_col, report_dir, ma_period, stop_loss_mode, stop_level_pct, pt_pct, trailing_stop_series):
-    # This function is correct
-    plot_dir = os.path.join(report_dir, 'plots', 'individual', ticker)
-    os.makedirs(plot_dir, exist_ok=True)
-    plt.style.use('seaborn-v0_8-whitegrid')
-    fig, ax = plt.subplots(figsize=(16, 9))
-    ax.plot(df.index, df['Close'], label='Close Price', color='black', linewidth=1)
-    ax.plot(df.index, df[sma_col], label=f'SMA({ma_period})', color='orange', linestyle='--', linewidth=1)
-    has_pt_line, has_sl_line = False, False
-    for trade in trades_log:
-        try:
-            ax.plot(trade['entry_date'], trade['entry_price'], '^', color='g', markersize=10)
-            ax.plot(trade['exit_date'], trade['exit_price'], 'v', color='r', markersize=10)
-            if trade.get('pt_pct') is not None:
-                pt_price = trade['entry_price'] * (1 + trade['pt_pct'] / 100)
-                ax.hlines(y=pt_price, xmin=trade['entry_date'], xmax=trade['exit_date'], color='g', linestyle='--', linewidth=1.5)
-                has_pt_line = True
-            if stop_loss_mode == 'FIXED' or stop_loss_mode == 'PREVIOUS_YEAR_LOW':
-                sl_price = trade['static_stop']
-                ax.hlines(y=sl_price, xmin=trade['entry_date'], xmax=trade['exit_date'], color='r', linestyle='--', linewidth=1.5)
-                has_sl_line = True
-        except Exception as e: print(f"    - Warning: Could not plot trade due to error: {e}")
-    if stop_loss_mode == 'TRAILING':
-        ax.plot(df.index, trailing_stop_series, color='r', linestyle='--', linewidth=1.5)
-        has_sl_line = True
-    sl_str = f"{stop_level_pct}%" if stop_level_pct is not None else "Struct"
-    pt_str = 'None' if pt_pct is None else str(pt_pct)
-    title = f"{ticker} Trades (MA:{ma_period}, Mode:{stop_loss_mode}, SL:{sl_str}, PT:{pt_str})"
-    sl_filename_str = f"{stop_level_pct}" if stop_level_pct is not None else "Struct"
-    filename = f"{ticker}_{ma_period}_{stop_loss_mode}_SL{sl_filename_str}_PT{pt_str}.png"
-    chart_filename = os.path.join(plot_dir, filename)
-    legend_elements = [
-        Line2D([0], [0], color='black', lw=1, label='Close Price'),
-        Line2D([0], [0], color='orange', linestyle='--', lw=1, label=f'SMA({ma_period})'),
-        Line2D([0], [0], marker='^', color='g', label='Buy', markersize=10, ls=''),
-        Line2D([0], [0], marker='v', color='r', label='Sell', markersize=10, ls='')]
-    if has_pt_line: legend_elements.append(Line2D([0], [0], color='g', linestyle='--', lw=1.5, label='Profit Target'))
-    if has_sl_line: legend_elements.append(Line2D([0], [0], color='r', linestyle='--', lw=1.5, label='Stop Loss'))
-    ax.set_title(title, fontsize=16)
-    ax.legend(handles=legend_elements)
-    ax.grid(True); fig.tight_layout()
-    plt.savefig(chart_filename, dpi=100); plt.close(fig)
-    print(f"  - Chart saved: {os.path.basename(chart_filename)}")
-
-def generate_individual_report(ticker, results_df, sweet_spot, bh_stats, report_dir, ma_period, num_years, start_date, end_date):
-    """Generates a detailed individual report with the new directory structure."""
+        "metrics": backtest_engine.summarize_backtest(len(df), stats, final_equity, trades_log, stop_level_pct, profit_target_pct, initial_capital, commission_pct, year_bars),
+        "trades_log": trades_log, "trailing_stop_series": trailing_stop_series }
+
+def generate_trade_chart(ticker, df, trades_log, sma_col, report_dir, ma_period, stop_loss_mode, stop_level_pct, pt_pct, trailing_stop_series, skip_unchanged=False):
+    """Draws one trade chart right away, in this process. The backtest pipelines queue specs on a RenderQueue instead."""
+    spec = chart_renderer.trade_chart_spec(ticker, df, trades_log, sma_col, report_dir, ma_period, stop_loss_mode, stop_level_pct, pt_pct, trailing_stop_series)
+    path, rendered, _, _ = chart_renderer.render_trade_chart(spec, skip_unchanged)
+    print(f"  - Chart {'saved' if rendered else 'unchanged'}: {os.path.basename(path)}")
+
+def generate_individual_report(ticker, results_df, sweet_spot, bh_stats, report_dir, ma_period, num_years, start_date, end_date, robustness_md=None, rank_by=RANK_METRIC):
+    """Generates a detailed individual report with the new directory structure. ma_period may be a list for an MA sweep;
+    robustness_md is the optimal combination's Monte Carlo section, when one was run. rank_by names the ratio the
+    optimal combination was chosen by."""
+    ma_periods = ma_period if isinstance(ma_period, (list, tuple)) else [ma_period]
     # <<< THE FIX: Create a ticker-specific subdirectory for the report >>>
     report_subdir = os.path.join(report_dir, 'individual', ticker)
     os.makedirs(report_subdir, exist_ok=True)
     
     display_df = results_df.copy()
-    for col in ['P&L ($)', 'CAGR (%)', 'Max Drawdown (%)', '% Profitable', 'Calmar Ratio']:
+    for col in ['P&L ($)', 'CAGR (%)', 'Max Drawdown (%)', '% Profitable', 'Calmar Ratio', 'Sharpe Ratio', 'Sortino Ratio', 'Ulcer Index', 'Exposure (%)', 'Avg Trade (%)']:
         display_df[col] = display_df[col].apply(lambda x: f"{x:,.2f}")
     
     md_content = f"# Backtest Report (Individual Asset Focus) for {ticker.upper()}\n\n"
@@ -183,84 +203,385 @@ def generate_individual_report(ticker, results_df, sweet_spot, bh_stats, report_
     md_content += "## Backtest Configuration\n"
     md_content += f"- **Universe:** This asset ONLY.\n"
     md_content += f"- **Starting Capital:** `${INITIAL_CAPITAL:,.2f}`\n"
-    md_content += f"- **Position Sizing:** Each trade uses **100%** of available equity (compounding).\n"
-    md_content += f"- **Strategy:** Buy on Close crossing above the **{ma_period}-period SMA**.\n"
+    if SIZING_MODEL == 'EQUAL': md_content += f"- **Position Sizing:** Each trade uses **100%** of available equity (compounding).\n"
+    else: md_content += f"- **Position Sizing:** {position_sizing.describe(sizing_spec())}; the rest of equity stays in cash.\n"
+    md_content += f"- **Strategy:** Buy on Close crossing above the **{'/'.join(str(p) for p in ma_periods)}-period SMA**.\n"
     md_content += f"- **Stop Loss Mode:** `{STOP_LOSS_MODE}`\n"
     md_content += f"- **Analysis Period:** {start_date} to {end_date} ({num_years:.1f} years)\n\n"
     md_content += "## Performance Summary\n"
-    md_content += "_This table provides an 'apples-to-apples' comparison of the strategy against a Buy & Hold benchmark. Use the **Calmar Ratio** to determine the best risk-adjusted performance._\n\n"
+    md_content += f"_This table provides an 'apples-to-apples' comparison of the strategy against a Buy & Hold benchmark. Use the **{rank_by} Ratio** to determine the best risk-adjusted performance; the optimal combination is the one ranked highest by it._\n\n"
     md_content += "| Metric                  | Strategy (Optimal) | Buy & Hold |\n"
     md_content += "|:------------------------|:-------------------|:-----------|\n"
-    md_content += f"| **Optimal Combination**     | SL: `{sweet_spot['Stop Level (%)']}`, PT: `{sweet_spot['Profit Target (%)']}` | N/A        |\n"
+    ma_str = f"MA: `{sweet_spot['MA Period']}`, " if 'MA Period' in sweet_spot else ""
+    md_content += f"| **Optimal Combination**     | {ma_str}SL: `{sweet_spot['Stop Level (%)']}`, PT: `{sweet_spot['Profit Target (%)']}` | N/A        |\n"
     md_content += f"| **Final P&L ($)**           | `${sweet_spot['P&L ($)']:,.2f}`         | `${bh_stats['P&L ($)']:,.2f}`  |\n"
     md_content += f"| **CAGR (%)**              | `{sweet_spot['CAGR (%)']:.2f}`%                | `${bh_stats['CAGR (%)']:.2f}`%     |\n"
     md_content += f"| **Max Drawdown (%)**      | `{sweet_spot['Max Drawdown (%)']:.2f}`%           | `${bh_stats['Max Drawdown (%)']:.2f}`%|\n"
-    md_content += f"| **Calmar Ratio**          | `{sweet_spot['Calmar Ratio']:.2f}`                  | `{bh_stats['Calmar Ratio']:.2f}`     |\n\n"
+    md_content += f"| **Calmar Ratio**          | `{sweet_spot['Calmar Ratio']:.2f}`                  | `{bh_stats['Calmar Ratio']:.2f}`     |\n"
+    md_content += f"| **Sharpe Ratio**          | `{sweet_spot['Sharpe Ratio']:.2f}`                  | `{bh_stats['Sharpe Ratio']:.2f}`     |\n"
+    md_content += f"| **Sortino Ratio**         | `{sweet_spot['Sortino Ratio']:.2f}`                  | `{bh_stats['Sortino Ratio']:.2f}`     |\n"
+    md_content += f"| **Ulcer Index**           | `{sweet_spot['Ulcer Index']:.2f}`                  | `{bh_stats['Ulcer Index']:.2f}`     |\n"
+    md_content += f"| **Max DD Duration (bars)** | `{sweet_spot['Max DD Duration (bars)']:,}`                  | `{bh_stats['Max DD Duration (bars)']:,}`     |\n"
+    md_content += f"| **Exposure (%)**          | `{sweet_spot['Exposure (%)']:.2f}`%                  | `{bh_stats['Exposure (%)']:.2f}`%     |\n"
+    md_content += f"| **Avg Trade (%)**         | `{sweet_spot['Avg Trade (%)']:.2f}`%                  | N/A        |\n\n"
+    if robustness_md: md_content += robustness_md + "\n"
     md_content += f"## Full Optimization Grid\n"
     md_content += display_df.to_markdown(index=False)
     
     # <<< THE FIX: Save the report in the new subdirectory >>>
-    report_filename = f"{ticker}_{ma_period}_{STOP_LOSS_MODE}.md"
+    report_filename = f"{ticker}_{'-'.join(str(p) for p in ma_periods)}_{STOP_LOSS_MODE}.md"
     report_path = os.path.join(report_subdir, report_filename)
     
     with open(report_path, 'w') as f: f.write(md_content)
     print(f"  - Report saved: {os.path.basename(report_path)}")
 
-def main():
-    """Main function for multi-mode deep-dive analysis."""
-    os.makedirs(REPORTS_DIR, exist_ok=True)
-    stock_files = glob.glob(os.path.join(STOCK_DATA_DIR, '*.csv'))
-    if not stock_files: print("Error: No CSV files found."); return
+def _chart(ticker, df, result, sma_col, ma_period, stop_level_pct, pt_pct, charts=None, prices=None):
+    """Queues the chart's spec on `charts` for the render stage; without a list the chart is drawn right here.
+    prices is the ticker's chart_renderer.chart_prices, so its queued specs share one set of price arrays."""
+    if charts is None:
+        with instrumentation.stage('chart', ticker):
+            generate_trade_chart(ticker, df, result['trades_log'], sma_col, REPORTS_DIR, ma_period, STOP_LOSS_MODE, stop_level_pct, pt_pct, result['trailing_stop_series'])
+        return
+    charts.append(chart_renderer.trade_chart_spec(ticker, df, result['trades_log'], sma_col, REPORTS_DIR, ma_period, STOP_LOSS_MODE, stop_level_pct, pt_pct, result['trailing_stop_series'], prices))
 
-    print(f"Starting Individual Asset Analysis (Mode: {STOP_LOSS_MODE}, Plotting: {'Optimal Only' if PLOT_ONLY_OPTIMAL_STRATEGY else 'All Combinations'})...\n")
-    
+def _robustness(ticker, a, trades_log, monte_carlo):
+    """Resamples the optimal run for its report. monte_carlo is a (num_paths, method, workers) tuple; None or 0 paths skips it."""
+    if not monte_carlo or not monte_carlo[0]: return None
+    num_paths, method, workers = monte_carlo
+    returns = robustness.backtest_returns(a, trades_log, INITIAL_CAPITAL, COMMISSION_PCT, method)
+    with instrumentation.stage('robustness', ticker, bars=len(returns), combinations=num_paths):
+        robustness_md, table = robustness.robustness_report(returns, len(a['close']) / backtest_engine.bars_per_year(a['index']), method, num_paths, workers=workers)
+    if table is None: return None
+    calmar = table.set_index('Metric').loc['Calmar Ratio']
+    ci = f"{robustness.CONFIDENCE_PCT:g}% CI"
+    print(f"  - Robustness: {num_paths:,} {method} paths, Calmar {calmar['Observed']:.2f} ({ci} {calmar[f'{ci} Low']:.2f} to {calmar[f'{ci} High']:.2f})")
+    return robustness_md
+
+def process_ticker(file_path, incremental=INCREMENTAL_MODE, charts=None, monte_carlo=None, rank_by=RANK_METRIC, df=None):
+    """Runs the full pipeline for one ticker: load, prepare, sweep, write report, draw chart.
+    With incremental=True the grid resumes from the ticker's checkpoint, so only bars added since the last run are simulated.
+    Given a list as charts, chart specs are appended to it for a RenderQueue instead of being drawn inline.
+    monte_carlo=(num_paths, method, workers) adds a resampled robustness section for the optimal combination,
+    which is the one with the best rank_by ratio ('Calmar', 'Sharpe' or 'Sortino'). df is the ticker's prepare_data
+    frame when the caller already has it (batch_runner shares them across jobs); otherwise file_path is loaded."""
     if STOP_LOSS_MODE in ['TRAILING', 'FIXED']:
         stop_levels_to_test = STOP_LEVELS_PCT
     else: stop_levels_to_test = [None] 
 
-    for file_path in stock_files:
-        ticker = os.path.basename(file_path).split('_')[0]
-        print(f"--- Processing {ticker.upper()} ---")
-        df = prepare_data(file_path, MA_PERIOD)
-        if df is None or df.empty:
-            print("  DataFrame is empty after preparation. Skipping.")
-            continue
-        
-        start_date_str = df.index.min().strftime('%Y-%m-%d'); end_date_str = df.index.max().strftime('%Y-%m-%d')
-        num_years = len(df) / 252.0
-        buy_and_hold_stats = calculate_benchmark_stats(df, INITIAL_CAPITAL)
-        sma_col = f'SMA_{MA_PERIOD}'
-        all_run_results = []
-        
-        for sl_pct in stop_levels_to_test:
-            for pt_pct in PROFIT_TARGETS_PCT:
-                if not PLOT_ONLY_OPTIMAL_STRATEGY:
-                    print(f"  - Testing SL: {sl_pct or STOP_LOSS_MODE}, PT: {pt_pct or 'None'}")
-                result = run_backtest(df, STOP_LOSS_MODE, sl_pct, pt_pct, INITIAL_CAPITAL, COMMISSION_PCT, sma_col)
-                all_run_results.append(result)
-                if not PLOT_ONLY_OPTIMAL_STRATEGY and result['trades_log']:
-                    generate_trade_chart(ticker, df, result['trades_log'], sma_col, REPORTS_DIR, MA_PERIOD, STOP_LOSS_MODE, sl_pct, pt_pct, result['trailing_stop_series'])
-        
-        if not all_run_results: continue
-        metrics_df = pd.DataFrame([res['metrics'] for res in all_run_results])
-        if metrics_df.empty or metrics_df['Calmar Ratio'].isnull().all() or (metrics_df['Calmar Ratio'] <= 0).all():
-            print("  No profitable results to create a summary report.")
-            continue
-
-        best_run = max(all_run_results, key=lambda x: x['metrics']['Calmar Ratio'])
-        sweet_spot_metrics = best_run['metrics']
-        
-        generate_individual_report(ticker, metrics_df, sweet_spot_metrics, buy_and_hold_stats, REPORTS_DIR, MA_PERIOD, num_years, start_date_str, end_date_str)
-        
-        if PLOT_ONLY_OPTIMAL_STRATEGY and best_run['trades_log']:
-            print("  - Generating chart for optimal strategy...")
-            best_sl = sweet_spot_metrics['Stop Level (%)']
-            if best_sl == "N/A": best_sl = None
-            best_pt_str = sweet_spot_metrics['Profit Target (%)']
-            best_pt = None if best_pt_str == "None" else int(best_pt_str)
-            generate_trade_chart(ticker, df, best_run['trades_log'], sma_col, REPORTS_DIR, MA_PERIOD, STOP_LOSS_MODE, best_sl, best_pt, best_run['trailing_stop_series'])
+    ticker = os.path.basename(file_path).split('_')[0]
+    print(f"--- Processing {ticker.upper()} ---")
+    if df is None: df = prepare_data(file_path, MA_PERIOD)
+    if df is None or df.empty:
+        print("  DataFrame is empty after preparation. Skipping.")
+        return
+    
+    start_date_str = df.index.min().strftime('%Y-%m-%d'); end_date_str = df.index.max().strftime('%Y-%m-%d')
+    num_years = len(df) / backtest_engine.bars_per_year(df.index)
+    buy_and_hold_stats = calculate_benchmark_stats(df, INITIAL_CAPITAL)
+    sma_col = f'SMA_{MA_PERIOD}'
+    arrays = backtest_engine.prepare_arrays(df, sma_col, sizing_spec())
+    prices = chart_renderer.chart_prices(df, [sma_col])
+    all_run_results = []
+    
+    combos = [(sl_pct, pt_pct) for sl_pct in stop_levels_to_test for pt_pct in PROFIT_TARGETS_PCT]
+    instrumentation.count('combinations', len(combos))
+    if GRID_MODE and incremental:
+        checkpoint_path = os.path.join(CHECKPOINT_DIR, f"{ticker}_{MA_PERIOD}_{STOP_LOSS_MODE}.pkl")
+        with instrumentation.stage('simulation', ticker, bars=len(df), combinations=len(combos)):
+            all_run_results, checkpoint = backtest_engine.run_backtest_grid(df, STOP_LOSS_MODE, combos, INITIAL_CAPITAL, COMMISSION_PCT, sma_col, arrays=arrays, record_stops=not PLOT_ONLY_OPTIMAL_STRATEGY,
+                                                                            checkpoint=backtest_engine.load_checkpoint(checkpoint_path), return_checkpoint=True)
+        if checkpoint['resumed_from'] is None: print("  - No usable checkpoint, simulated the full history")
+        else: print(f"  - Resumed from checkpoint, simulated {len(df) - checkpoint['resumed_from']} new bar(s)")
+        backtest_engine.save_checkpoint(checkpoint_path, checkpoint)
+    elif GRID_MODE:
+        with instrumentation.stage('simulation', ticker, bars=len(df), combinations=len(combos)):
+            all_run_results = results_store.backtest_grid(df, STOP_LOSS_MODE, combos, INITIAL_CAPITAL, COMMISSION_PCT, sma_col, arrays=arrays, record_stops=not PLOT_ONLY_OPTIMAL_STRATEGY)
+    for idx, (sl_pct, pt_pct) in enumerate(combos):
+        if not PLOT_ONLY_OPTIMAL_STRATEGY:
+            print(f"  - Testing SL: {sl_pct or STOP_LOSS_MODE}, PT: {pt_pct or 'None'}")
+        if GRID_MODE: result = all_run_results[idx]
+        else:
+            with instrumentation.stage('simulation', ticker, bars=len(df), combinations=1):
+                result = run_backtest(df, STOP_LOSS_MODE, sl_pct, pt_pct, INITIAL_CAPITAL, COMMISSION_PCT, sma_col, arrays=arrays)
+            all_run_results.append(result)
+        if not PLOT_ONLY_OPTIMAL_STRATEGY and result['trades_log']:
+            if result['trailing_stop_series'] is None:  # resumed grid runs do not carry the stop series
+                result = run_backtest(df, STOP_LOSS_MODE, sl_pct, pt_pct, INITIAL_CAPITAL, COMMISSION_PCT, sma_col, arrays=arrays)
+            _chart(ticker, df, result, sma_col, MA_PERIOD, sl_pct, pt_pct, charts, prices)
+    
+    if not all_run_results: return
+    metrics_df = pd.DataFrame([res['metrics'] for res in all_run_results])
+    rank_col = f"{rank_by} Ratio"
+    if metrics_df.empty or metrics_df[rank_col].isnull().all() or (metrics_df[rank_col] <= 0).all():
+        print("  No profitable results to create a summary report.")
+        return
+
+    best_run = max(all_run_results, key=lambda x: x['metrics'][rank_col])
+    sweet_spot_metrics = best_run['metrics']
+    robustness_md = _robustness(ticker, arrays, best_run['trades_log'], monte_carlo)
+    
+    with instrumentation.stage('report', ticker):
+        generate_individual_report(ticker, metrics_df, sweet_spot_metrics, buy_and_hold_stats, REPORTS_DIR, MA_PERIOD, num_years, start_date_str, end_date_str, robustness_md, rank_by)
+    
+    if PLOT_ONLY_OPTIMAL_STRATEGY and best_run['trades_log']:
+        print("  - Generating chart for optimal strategy...")
+        best_sl = sweet_spot_metrics['Stop Level (%)']
+        if best_sl == "N/A": best_sl = None
+        best_pt_str = sweet_spot_metrics['Profit Target (%)']
+        best_pt = None if best_pt_str == "None" else int(best_pt_str)
+        if best_run['trailing_stop_series'] is None:
+            best_run = run_backtest(df, STOP_LOSS_MODE, best_sl, best_pt, INITIAL_CAPITAL, COMMISSION_PCT, sma_col, arrays=arrays)
+        _chart(ticker, df, best_run, sma_col, MA_PERIOD, best_sl, best_pt, charts, prices)
+
+def process_ticker_sweep(file_path, ma_periods, incremental=INCREMENTAL_MODE, charts=None, monte_carlo=None, rank_by=RANK_METRIC):
+    """MA-sweep pipeline for one ticker: the whole MA x SL x PT surface in one pass over the data, one report, optimal chart."""
+    if STOP_LOSS_MODE in ['TRAILING', 'FIXED']:
+        stop_levels_to_test = STOP_LEVELS_PCT
+    else: stop_levels_to_test = [None]
+    ticker = os.path.basename(file_path).split('_')[0]
+    print(f"--- Processing {ticker.upper()} (MA sweep: {ma_periods}) ---")
+    df = prepare_data(file_path, ma_periods[0], extra_ma_periods=ma_periods[1:])
+    if df is None or df.empty:
+        print("  DataFrame is empty after preparation. Skipping.")
+        return
+    start_date_str = df.index.min().strftime('%Y-%m-%d'); end_date_str = df.index.max().strftime('%Y-%m-%d')
+    num_years = len(df) / backtest_engine.bars_per_year(df.index)
+    buy_and_hold_stats = calculate_benchmark_stats(df, INITIAL_CAPITAL)
+    arrays = backtest_engine.prepare_sweep_arrays(df, ma_periods, sizing_spec())
+    combos = [(sl_pct, pt_pct) for sl_pct in stop_levels_to_test for pt_pct in PROFIT_TARGETS_PCT]
+    instrumentation.count('combinations', len(ma_periods) * len(combos))
+    if incremental:
+        checkpoint_path = os.path.join(CHECKPOINT_DIR, f"{ticker}_{'-'.join(str(p) for p in ma_periods)}_{STOP_LOSS_MODE}.pkl")
+        with instrumentation.stage('simulation', ticker, bars=len(df), combinations=len(ma_periods) * len(combos)):
+            all_run_results, checkpoint = backtest_engine.run_backtest_sweep(df, STOP_LOSS_MODE, ma_periods, combos, INITIAL_CAPITAL, COMMISSION_PCT, arrays=arrays,
+                                                                             checkpoint=backtest_engine.load_checkpoint(checkpoint_path), return_checkpoint=True)
+        if checkpoint['resumed_from'] is None: print("  - No usable checkpoint, simulated the full history")
+        else: print(f"  - Resumed from checkpoint, simulated {len(df) - checkpoint['resumed_from']} new bar(s)")
+        backtest_engine.save_checkpoint(checkpoint_path, checkpoint)
+    else:
+        with instrumentation.stage('simulation', ticker, bars=len(df), combinations=len(ma_periods) * len(combos)):
+            all_run_results = results_store.backtest_sweep(df, STOP_LOSS_MODE, ma_periods, combos, INITIAL_CAPITAL, COMMISSION_PCT, arrays=arrays)
+    print(f"  - Simulated {len(all_run_results)} MA/SL/PT combinations in a single pass")
+
+    metrics_df = pd.DataFrame([res['metrics'] for res in all_run_results])
+    rank_col = f"{rank_by} Ratio"
+    if metrics_df.empty or metrics_df[rank_col].isnull().all() or (metrics_df[rank_col] <= 0).all():
+        print("  No profitable results to create a summary report.")
+        return
+    best_idx = max(range(len(all_run_results)), key=lambda k: all_run_results[k]['metrics'][rank_col])
+    robustness_md = _robustness(ticker, arrays, all_run_results[best_idx]['trades_log'], monte_carlo)
+    with instrumentation.stage('report', ticker):
+        generate_individual_report(ticker, metrics_df, all_run_results[best_idx]['metrics'], buy_and_hold_stats, REPORTS_DIR, ma_periods, num_years, start_date_str, end_date_str, robustness_md, rank_by)
+
+    # Charts need the trailing stop series, which the sweep does not keep, so charted runs are re-simulated on their own MA.
+    charted = [best_idx] if PLOT_ONLY_OPTIMAL_STRATEGY else range(len(all_run_results))
+    prices = chart_renderer.chart_prices(df, [f'SMA_{p}' for p in ma_periods])
+    if PLOT_ONLY_OPTIMAL_STRATEGY and all_run_results[best_idx]['trades_log']: print("  - Generating chart for optimal strategy...")
+    for k in charted:
+        if not all_run_results[k]['trades_log']: continue
+        ma_row = k // len(combos); ma_period = ma_periods[ma_row]; sl_pct, pt_pct = combos[k % len(combos)]
+        sma_col = f'SMA_{ma_period}'
+        result = run_backtest(df, STOP_LOSS_MODE, sl_pct, pt_pct, INITIAL_CAPITAL, COMMISSION_PCT, sma_col, arrays=dict(arrays, sma=arrays['sma'][:, ma_row], signal=arrays['signal'][:, ma_row]))
+        _chart(ticker, df, result, sma_col, ma_period, sl_pct, pt_pct, charts, prices)
+
+def process_ticker_stream(file_path, chunk_bars=STREAM_CHUNK_BARS, rank_by=RANK_METRIC):
+    """Streaming pipeline for one ticker: the SL x PT grid over the CSV read chunk_bars rows at a time
+    (streaming.stream_backtest_grid), then the report. Charts need the whole series in memory and are skipped."""
+    if STOP_LOSS_MODE in ['TRAILING', 'FIXED']:
+        stop_levels_to_test = STOP_LEVELS_PCT
+    else: stop_levels_to_test = [None]
+    ticker = os.path.basename(file_path).split('_')[0]
+    print(f"--- Processing {ticker.upper()} (streaming, {chunk_bars:,}-bar chunks) ---")
+    combos = [(sl_pct, pt_pct) for sl_pct in stop_levels_to_test for pt_pct in PROFIT_TARGETS_PCT]
+    instrumentation.count('combinations', len(combos))
+    with instrumentation.stage('simulation', ticker, combinations=len(combos)):
+        output = streaming.stream_backtest_grid(file_path, STOP_LOSS_MODE, combos, INITIAL_CAPITAL, COMMISSION_PCT, MA_PERIOD, chunk_bars, sizing_spec())
+    if output is None:
+        print("  Too few bars after the indicator warm-up. Skipping.")
+        return
+    all_run_results, info = output
+    print(f"  - Streamed {info['bars']:,} bars ({info['bars_per_year']:,.0f} per year)")
+    metrics_df = pd.DataFrame([res['metrics'] for res in all_run_results])
+    rank_col = f"{rank_by} Ratio"
+    if metrics_df[rank_col].isnull().all() or (metrics_df[rank_col] <= 0).all():
+        print("  No profitable results to create a summary report.")
+        return
+    best_run = max(all_run_results, key=lambda x: x['metrics'][rank_col])
+    with instrumentation.stage('report', ticker):
+        generate_individual_report(ticker, metrics_df, best_run['metrics'], info['buy_and_hold'], REPORTS_DIR, MA_PERIOD, info['bars'] / info['bars_per_year'],
+                                   info['first_date'].strftime('%Y-%m-%d'), info['last_date'].strftime('%Y-%m-%d'), rank_by=rank_by)
+    print("  - Charts are not drawn in streaming mode")
+
+def generate_walk_forward_report(ticker, windows_df, wf_metrics, bh_stats, report_dir, start_date, end_date):
+    """Writes the per-window choices and the stitched out-of-sample performance of a walk-forward run."""
+    report_subdir = os.path.join(report_dir, 'individual', ticker)
+    os.makedirs(report_subdir, exist_ok=True)
+    display_df = windows_df.copy()
+    for col in ['IS Calmar', 'OOS Return (%)', 'OOS Max Drawdown (%)']:
+        display_df[col] = display_df[col].apply(lambda x: f"{x:,.2f}")
+    md_content = f"# Walk-Forward Report for {ticker.upper()}\n\n"
+    md_content += "## Walk-Forward Configuration\n"
+    md_content += f"- **Starting Capital:** `${INITIAL_CAPITAL:,.2f}`\n"
+    md_content += f"- **Stop Loss Mode:** `{STOP_LOSS_MODE}`\n"
+    md_content += f"- **MA Periods Searched:** {', '.join(str(p) for p in WALK_FORWARD_MA_PERIODS)}\n"
+    md_content += f"- **Windows:** {WALK_FORWARD_TRAIN_YEARS}-year training, {WALK_FORWARD_TEST_YEARS}-year out-of-sample test, rolled forward by the test length\n"
+    md_content += f"- **Out-of-Sample Period:** {start_date} to {end_date}\n\n"
+    md_content += "## Stitched Out-of-Sample Performance\n"
+    md_content += "_Each test window is traded with the combination that had the best Calmar Ratio on the window before it, so no result below was fitted to the data it is measured on. Buy & Hold covers the same out-of-sample period._\n\n"
+    md_content += "| Metric                  | Walk-Forward | Buy & Hold |\n"
+    md_content += "|:------------------------|:-------------|:-----------|\n"
+    md_content += f"| **Final P&L ($)**           | `${wf_metrics['P&L']:,.2f}` | `${bh_stats['P&L ($)']:,.2f}` |\n"
+    md_content += f"| **CAGR (%)**              | `{wf_metrics['CAGR']:.2f}`% | `{bh_stats['CAGR (%)']:.2f}`% |\n"
+    md_content += f"| **Max Drawdown (%)**      | `{wf_metrics['Max Drawdown']:.2f}`% | `{bh_stats['Max Drawdown (%)']:.2f}`% |\n"
+    md_content += f"| **Calmar Ratio**          | `{wf_metrics['Calmar']:.2f}` | `{bh_stats['Calmar Ratio']:.2f}` |\n"
+    md_content += f"| **Sharpe Ratio**          | `{wf_metrics['Sharpe']:.2f}` | `{bh_stats['Sharpe Ratio']:.2f}` |\n"
+    md_content += f"| **Sortino Ratio**         | `{wf_metrics['Sortino']:.2f}` | `{bh_stats['Sortino Ratio']:.2f}` |\n"
+    md_content += f"| **Ulcer Index**           | `{wf_metrics['Ulcer Index']:.2f}` | `{bh_stats['Ulcer Index']:.2f}` |\n\n"
+    md_content += "## Windows\n"
+    md_content += display_df.to_markdown(index=False)
+    report_path = os.path.join(report_subdir, f"{ticker}_{STOP_LOSS_MODE}_walkforward.md")
+    with open(report_path, 'w') as f: f.write(md_content)
+    print(f"  - Report saved: {os.path.basename(report_path)}")
+
+def process_ticker_walk_forward(file_path, workers=1):
+    """Walk-forward pipeline for one ticker: rolling in-sample optimization of MA/SL/PT, out-of-sample stitching, report."""
+    if STOP_LOSS_MODE in ['TRAILING', 'FIXED']:
+        stop_levels_to_test = STOP_LEVELS_PCT
+    else: stop_levels_to_test = [None]
+    ticker = os.path.basename(file_path).split('_')[0]
+    print(f"--- Walk-forward {ticker.upper()} ---")
+    df = prepare_data(file_path, WALK_FORWARD_MA_PERIODS[0], extra_ma_periods=WALK_FORWARD_MA_PERIODS[1:])
+    if df is None or df.empty:
+        print("  DataFrame is empty after preparation. Skipping.")
+        return
+    combos = [(sl_pct, pt_pct) for sl_pct in stop_levels_to_test for pt_pct in PROFIT_TARGETS_PCT]
+    year_bars = backtest_engine.bars_per_year(df.index)
+    result = walk_forward.walk_forward_individual(df, STOP_LOSS_MODE, combos, WALK_FORWARD_MA_PERIODS, INITIAL_CAPITAL, COMMISSION_PCT,
+                                                  int(WALK_FORWARD_TRAIN_YEARS * year_bars), int(WALK_FORWARD_TEST_YEARS * year_bars), workers=workers, sizing=sizing_spec())
+    if result is None:
+        print(f"  History is shorter than one {WALK_FORWARD_TRAIN_YEARS}-year training window. Skipping.")
+        return
+    windows_df, oos_equity, wf_metrics = result
+    bh_stats = calculate_benchmark_stats(df.loc[oos_equity.index[0]:], INITIAL_CAPITAL)
+    generate_walk_forward_report(ticker, windows_df, wf_metrics, bh_stats, REPORTS_DIR, oos_equity.index[0].strftime('%Y-%m-%d'), oos_equity.index[-1].strftime('%Y-%m-%d'))
+
+def _process_ticker_isolated(file_path, incremental=INCREMENTAL_MODE, ma_periods=None, use_store=True, instrument=False, profile_dir=None, monte_carlo=None, chunk_bars=None,
+                             rank_by=RANK_METRIC, df=None):
+    """Worker entry point: runs process_ticker with its console output captured, so one failing ticker
+    cannot take down the pool and the parent can print every ticker's log in a deterministic order.
+    Returns (log, instrumentation records, chart specs); with profile_dir set the ticker's cProfile stats are dumped there."""
+    results_store.STORE_ENABLED = use_store
+    instrumentation.ENABLED = instrument
+    ticker = os.path.basename(file_path).split('_')[0]
+    buffer = io.StringIO(); charts = []
+    with contextlib.redirect_stdout(buffer), instrumentation.profiled(os.path.join(profile_dir, f"{ticker}.prof") if profile_dir else None):
+        try:
+            if chunk_bars: process_ticker_stream(file_path, chunk_bars, rank_by)
+            elif ma_periods and len(ma_periods) > 1: process_ticker_sweep(file_path, list(ma_periods), incremental, charts, monte_carlo, rank_by)
+            else: process_ticker(file_path, incremental, charts, monte_carlo, rank_by, df)
+            instrumentation.count('tickers processed')
+        except Exception as e:
+            print(f"  [Error] Could not complete {file_path}. Reason: {e}")
+            instrumentation.count('tickers failed')
+    return buffer.getvalue(), instrumentation.collect(), charts
+
+def _render_charts(render_queue):
+    """The chart stage: waits for the queued charts and reports what was drawn and what was already up to date."""
+    with instrumentation.stage('chart rendering'): rendered = render_queue.drain()
+    if not rendered: return
+    print(f"\n--- Charts ({render_queue.workers} render worker(s)) ---")
+    for ticker, path, drawn, draw_seconds, save_seconds in rendered:
+        print(f"  - Chart {'saved' if drawn else 'unchanged'}: {os.path.basename(path)}")
+        if drawn:
+            instrumentation.record('chart', draw_seconds + save_seconds, ticker); instrumentation.record('savefig', save_seconds, ticker)
+    drawn_count = sum(1 for r in rendered if r[2])
+    instrumentation.count('charts rendered', drawn_count); instrumentation.count('charts unchanged', len(rendered) - drawn_count)
+    print(f"  {drawn_count} chart(s) rendered, {len(rendered) - drawn_count} unchanged since the last render")
+
+def main(workers=1, incremental=INCREMENTAL_MODE, walk_forward_mode=False, ma_periods=MA_SWEEP_PERIODS, use_store=True, instrument=False, profile=False,
+         chart_workers=chart_renderer.CHART_WORKERS, skip_unchanged_charts=chart_renderer.SKIP_UNCHANGED_CHARTS,
+         robustness_paths=ROBUSTNESS_PATHS, robustness_method=ROBUSTNESS_METHOD, robustness_workers=ROBUSTNESS_WORKERS, stream=STREAM_MODE, chunk_bars=STREAM_CHUNK_BARS,
+         rank_by=RANK_METRIC):
+    """Main function for multi-mode deep-dive analysis. With workers > 1, tickers are spread across a process pool;
+    with incremental=True each ticker's grid resumes from its checkpoint. walk_forward_mode=True runs the walk-forward
+    analysis instead, ticker by ticker, with the workers spread across each ticker's windows. Two or more ma_periods
+    turn on the MA sweep, which reports the full MA x SL x PT surface per ticker. Unless use_store=False, full-history
+    runs are memoized in the results store, so unchanged tickers are served without simulating.
+    instrument=True times every stage per ticker and writes a timing_individual_*.md summary to REPORTS_DIR;
+    profile=True dumps one cProfile file per ticker into REPORTS_DIR/profiles. Charts are drawn in a separate stage by
+    chart_workers render processes, while later tickers simulate; skip_unchanged_charts leaves PNGs whose inputs are unchanged.
+    robustness_paths > 0 resamples each ticker's optimal combination that many times (robustness_method, spread over
+    robustness_workers processes) and adds confidence intervals of its CAGR, drawdown and Calmar to the report.
+    stream=True reads every CSV chunk_bars rows at a time (process_ticker_stream), for intraday histories too large to load.
+    rank_by picks the ratio ('Calmar', 'Sharpe' or 'Sortino') each ticker's optimal combination is chosen by."""
+    results_store.STORE_ENABLED = use_store
+    instrumentation.ENABLED = instrument; instrumentation.reset()
+    wall_start = time.perf_counter()
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    stock_files = sorted(glob.glob(os.path.join(STOCK_DATA_DIR, '*.csv')))
+    if not stock_files: print("Error: No CSV files found."); return
+
+    if walk_forward_mode:
+        print(f"Starting Walk-Forward Analysis (Mode: {STOP_LOSS_MODE}, MA: {WALK_FORWARD_MA_PERIODS}, Workers: {workers})...\n")
+        for file_path in stock_files:
+            try:
+                with instrumentation.stage('walk-forward', os.path.basename(file_path).split('_')[0]): process_ticker_walk_forward(file_path, workers)
+            except Exception as e:
+                print(f"  [Error] Could not complete {file_path}. Reason: {e}")
+        print("\n--- All walk-forward analyses complete! ---")
+        if instrument: print(f"Timing summary saved to {instrumentation.write_report(REPORTS_DIR, f'individual_walk_forward_{STOP_LOSS_MODE}', time.perf_counter() - wall_start)}")
+        return
+
+    print(f"Starting Individual Asset Analysis (Mode: {STOP_LOSS_MODE}, Plotting: {'Optimal Only' if PLOT_ONLY_OPTIMAL_STRATEGY else 'All Combinations'}, Workers: {workers}, Incremental: {incremental})...\n")
+
+    profile_dir = os.path.join(REPORTS_DIR, 'profiles') if profile else None
+    options = (incremental, ma_periods, use_store, instrument, profile_dir, (robustness_paths, robustness_method, robustness_workers), chunk_bars if stream else None, rank_by)
+    with chart_renderer.RenderQueue(chart_workers, skip_unchanged_charts) as render_queue:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_configure_worker, initargs=(_settings(),)) as executor:
+                # map() yields in submission order, so the log reads the same however the work was scheduled.
+                outputs = executor.map(_process_ticker_isolated, stock_files, *[[option] * len(stock_files) for option in options])
+                for ticker_log, recorded, charts in outputs:
+                    print(ticker_log, end=''); instrumentation.merge(recorded); render_queue.submit(charts)
+        else:
+            for file_path in stock_files:
+                ticker_log, recorded, charts = _process_ticker_isolated(file_path, *options)
+                print(ticker_log, end=''); instrumentation.merge(recorded); render_queue.submit(charts)
+        _render_charts(render_queue)
 
     print("\n--- All individual backtests and plotting complete! ---")
+    if instrument:
+        ma_label = '-'.join(str(p) for p in ma_periods) if ma_periods and len(ma_periods) > 1 else MA_PERIOD
+        print(f"Timing summary saved to {instrumentation.write_report(REPORTS_DIR, f'individual_{ma_label}_{STOP_LOSS_MODE}', time.perf_counter() - wall_start)}")
+    if profile: print(f"cProfile stats saved to {profile_dir}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Individual asset SMA crossover backtester.")
+    parser.add_argument('--data-dir', default=STOCK_DATA_DIR, help=f"Directory of price CSVs to analyze (default: {STOCK_DATA_DIR}).")
+    parser.add_argument('--reports-dir', default=REPORTS_DIR, help=f"Directory the reports and charts are written to (default: {REPORTS_DIR}).")
+    parser.add_argument('--ma-period', type=int, default=MA_PERIOD, help=f"SMA period of the crossover (default: {MA_PERIOD}).")
+    parser.add_argument('--stop-loss-mode', choices=['TRAILING', 'FIXED', 'PREVIOUS_YEAR_LOW', 'NONE'], default=STOP_LOSS_MODE, help=f"Stop-loss mode to test (default: {STOP_LOSS_MODE}).")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes to spread tickers across (default: 1).")
+    parser.add_argument('--incremental', action='store_true', default=INCREMENTAL_MODE, help="Resume each ticker from its saved checkpoint and simulate only new bars.")
+    parser.add_argument('--ma-periods', type=int, nargs='+', default=MA_SWEEP_PERIODS, help="Sweep these MA periods together with SL/PT in one pass (e.g. --ma-periods 20 50 200).")
+    parser.add_argument('--walk-forward', action='store_true', help="Run the rolling in-sample/out-of-sample walk-forward analysis instead of the full-history grid.")
+    parser.add_argument('--no-store', action='store_true', help="Ignore the results store and simulate every combination.")
+    parser.add_argument('--instrument', action='store_true', help="Time every stage per ticker and write a timing summary to the reports directory.")
+    parser.add_argument('--profile', action='store_true', help="Dump cProfile stats for every ticker into the reports' profiles directory.")
+    parser.add_argument('--chart-workers', type=int, default=chart_renderer.CHART_WORKERS, help=f"Number of processes rendering charts alongside the simulations (default: {chart_renderer.CHART_WORKERS}).")
+    parser.add_argument('--rerender-charts', action='store_true', help="Redraw every chart, even when its inputs are unchanged since the last render.")
+    parser.add_argument('--robustness', type=int, default=ROBUSTNESS_PATHS, metavar='N', help="Resample each ticker's optimal combination N times and report confidence intervals (e.g. --robustness 10000).")
+    parser.add_argument('--robustness-method', choices=robustness.METHODS, default=ROBUSTNESS_METHOD, help=f"How the robustness paths are resampled (default: {ROBUSTNESS_METHOD}).")
+    parser.add_argument('--robustness-workers', type=int, default=ROBUSTNESS_WORKERS, help=f"Number of processes sharing each ticker's robustness paths (default: {ROBUSTNESS_WORKERS}).")
+    parser.add_argument('--rank-by', choices=metrics.RANK_METRICS, default=RANK_METRIC, help=f"Ratio the optimal combination is chosen by (default: {RANK_METRIC}).")
+    parser.add_argument('--stream', action='store_true', default=STREAM_MODE, help="Read each CSV in chunks instead of whole, for intraday files too large to load at once.")
+    parser.add_argument('--chunk-bars', type=int, default=STREAM_CHUNK_BARS, help=f"Rows per chunk with --stream (default: {STREAM_CHUNK_BARS:,}).")
+    parser.add_argument('--sizing', choices=position_sizing.MODELS, default=SIZING_MODEL, help=f"Position-sizing model of the trades (default: {SIZING_MODEL}).")
+    parser.add_argument('--sizing-fraction', type=float, default=SIZING_FRACTION, help=f"FIXED_FRACTIONAL share of equity per trade (default: {SIZING_FRACTION}).")
+    parser.add_argument('--target-vol', type=float, default=SIZING_TARGET_VOL, help=f"VOL_TARGET annualized volatility per trade (default: {SIZING_TARGET_VOL}).")
+    args = parser.parse_args()
+    configure(args.data_dir, args.reports_dir, args.ma_period, args.stop_loss_mode, args.sizing, args.sizing_fraction, args.target_vol)
+    main(workers=args.workers, incremental=args.incremental, walk_forward_mode=args.walk_forward, ma_periods=args.ma_periods, use_store=not args.no_store,
+         instrument=args.instrument, profile=args.profile, chart_workers=args.chart_workers, skip_unchanged_charts=not args.rerender_charts,
+         robustness_paths=args.robustness, robustness_method=args.robustness_method, robustness_workers=args.robustness_workers,
+         stream=args.stream, chunk_bars=args.chunk_bars, rank_by=args.rank_by)
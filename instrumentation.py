@@ -0,0 +1,104 @@
+import os
+import time
+import cProfile
+import contextlib
+import pandas as pd
+
+# --- Instrumentation Configuration ---
+ENABLED = False  # Switched on by --instrument; while off, stage() and count() return immediately
+
+_records = []  # (stage, ticker, seconds, bars, combinations)
+_counters = {}
+_NULL_STAGE = contextlib.nullcontext()
+
+class _Stage:
+    __slots__ = ('name', 'ticker', 'bars', 'combinations', 'start')
+    def __init__(self, name, ticker, bars, combinations):
+        self.name, self.ticker, self.bars, self.combinations = name, ticker, bars, combinations
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _records.append((self.name, self.ticker, time.perf_counter() - self.start, self.bars, self.combinations))
+        return False
+
+def stage(name, ticker=None, bars=None, combinations=None):
+    """Context manager timing one stage. bars and combinations, when given, feed the throughput columns
+    (a grid pass over 5000 bars with 25 combinations counts 125,000 bar-combinations)."""
+    if not ENABLED: return _NULL_STAGE
+    return _Stage(name, ticker, bars, combinations)
+
+def record(name, seconds, ticker=None, bars=None, combinations=None):
+    """Adds a stage that was timed elsewhere, such as a chart drawn in a render process."""
+    if ENABLED: _records.append((name, ticker, seconds, bars, combinations))
+
+def count(name, n=1):
+    if ENABLED: _counters[name] = _counters.get(name, 0) + n
+
+def reset():
+    _records.clear(); _counters.clear()
+
+def collect():
+    """Takes everything recorded in this process so far (a picklable pair) and clears it, for handing back from a
+    pool worker. Run in the parent process, merging the pair straight back in loses and duplicates nothing."""
+    recorded = (list(_records), dict(_counters))
+    reset()
+    return recorded
+
+def merge(recorded):
+    records, counters = recorded
+    _records.extend(records)
+    for name, n in counters.items(): _counters[name] = _counters.get(name, 0) + n
+
+def summary_frame():
+    """One row per stage: calls, total and mean seconds, and throughput. Stages may nest (savefig inside chart)."""
+    if not _records: return pd.DataFrame()
+    df = pd.DataFrame(_records, columns=['Stage', 'Ticker', 'Seconds', 'Bars', 'Combinations'])
+    df['Bar-Combinations'] = df['Bars'] * df['Combinations'].fillna(1)
+    rows = []
+    for name, g in df.groupby('Stage', sort=False):
+        seconds = g['Seconds'].sum(); timed = g[g['Bars'].notna()]
+        row = {"Stage": name, "Calls": len(g), "Total (s)": seconds, "Mean (s)": seconds / len(g)}
+        row["Bars/s"] = timed['Bars'].sum() / timed['Seconds'].sum() if len(timed) and timed['Seconds'].sum() > 0 else None
+        row["Bar-Combinations/s"] = timed['Bar-Combinations'].sum() / timed['Seconds'].sum() if len(timed) and timed['Seconds'].sum() > 0 else None
+        row["Per Combination (ms)"] = seconds / g['Combinations'].sum() * 1000 if g['Combinations'].notna().any() else None
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def ticker_frame():
+    """Seconds per ticker (rows) and stage (columns) for the stages that were recorded per ticker."""
+    df = pd.DataFrame(_records, columns=['Stage', 'Ticker', 'Seconds', 'Bars', 'Combinations'])
+    df = df[df['Ticker'].notna()]
+    if df.empty: return df
+    table = df.pivot_table(index='Ticker', columns='Stage', values='Seconds', aggfunc='sum', sort=False).fillna(0)
+    table['Total'] = table.sum(axis=1)
+    return table.sort_values('Total', ascending=False).reset_index()
+
+def write_report(report_dir, name, wall_seconds=None):
+    """Writes the stage summary, per-ticker timings and counters as timing_<name>.md into report_dir. Returns the path."""
+    fmt = lambda df: df.astype(object).where(df.notna(), '').to_markdown(index=False, floatfmt=",.3f")
+    md_content = f"# Timing Summary: {name}\n\n"
+    if wall_seconds is not None: md_content += f"- **Wall Time:** {wall_seconds:,.2f}s\n"
+    md_content += f"- **Tickers Timed:** {len({r[1] for r in _records if r[1] is not None})}\n\n"
+    md_content += "## Stages\n\n" + fmt(summary_frame()) + "\n\n"
+    tickers = ticker_frame()
+    if not tickers.empty: md_content += "## Per Ticker (s)\n\n" + fmt(tickers) + "\n\n"
+    if _counters: md_content += "## Counters\n\n" + fmt(pd.DataFrame(list(_counters.items()), columns=['Counter', 'Count'])) + "\n"
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"timing_{name}.md")
+    with open(report_path, 'w') as f: f.write(md_content)
+    return report_path
+
+@contextlib.contextmanager
+def profiled(path):
+    """Runs the block under cProfile and dumps the stats to `path` (inspect with pstats or snakeviz). No-op for path=None."""
+    if path is None: yield; return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try: yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        profiler.dump_stats(path)
@@ -0,0 +1,87 @@
+import numpy as np
+
+# --- Metrics Configuration ---
+RANK_METRICS = ('Calmar', 'Sharpe', 'Sortino')  # Ratios the optimal combination can be chosen by (--rank-by); higher is better for each
+FLAT_STD = 1e-12  # Return dispersion below this counts as a flat curve, whose Sharpe and Sortino are reported as 0
+
+# Running sums every curve statistic is finished from (summarize_sums). curve_sums builds them from equity arrays; the
+# engines' grid kernels keep the same sums per combination bar by bar, so a grid gets every statistic without ever
+# storing an equity curve, and checkpointed or streamed runs simply carry them on.
+SUM_FIELDS = ('last', 'peak', 'min_dd', 'dd_bars', 'max_dd_bars', 'dd_sq', 'ret_sum', 'ret_sq', 'down_sq', 'exposure')
+
+def new_sums(shape=()):
+    """Running sums of a curve (or a batch of curves of the given shape) that has no bars yet."""
+    sums = {k: np.zeros(shape) for k in SUM_FIELDS}
+    sums['last'][...] = np.nan; sums['peak'][...] = -np.inf
+    return sums
+
+def curve_sums(equity, invested=None, sums=None):
+    """Adds the bars of an equity curve, or of a batch of curves (one per row of a 2-D array), to running sums in one
+    pass over the bars: the running peak gives drawdown depth, the underwater streak and the squared drawdown, the bar
+    returns their sum, square and downside square. `invested` (same shape) is the capital held in positions, for the
+    exposure; without it the curve counts as fully invested. Pass the sums of an earlier segment to continue a curve."""
+    equity = np.asarray(equity, dtype=np.float64)
+    sums = {k: np.array(v, dtype=np.float64) for k, v in (sums if sums is not None else new_sums(equity.shape[:-1])).items()}
+    peak = np.maximum.accumulate(np.concatenate([sums['peak'][..., None], equity], axis=-1), axis=-1)[..., 1:]
+    drawdown = (equity - peak) / peak
+    # Bars since the last peak: the running max of the bar numbers at which the curve stood at its peak, seeded with
+    # the streak the previous segment ended on.
+    bar = np.arange(equity.shape[-1])
+    last_peak = np.maximum.accumulate(np.where(drawdown < 0, -1 - sums['dd_bars'][..., None], bar), axis=-1)
+    streak = bar - last_peak
+    returns = np.nan_to_num(equity / np.concatenate([sums['last'][..., None], equity[..., :-1]], axis=-1) - 1)  # a curve's first bar has no return
+    sums['min_dd'] = np.minimum(sums['min_dd'], drawdown.min(axis=-1))
+    sums['dd_bars'] = streak[..., -1].astype(np.float64); sums['max_dd_bars'] = np.maximum(sums['max_dd_bars'], streak.max(axis=-1))
+    sums['dd_sq'] += ((drawdown * 100) ** 2).sum(axis=-1)
+    sums['ret_sum'] += returns.sum(axis=-1); sums['ret_sq'] += (returns ** 2).sum(axis=-1); sums['down_sq'] += (np.minimum(returns, 0) ** 2).sum(axis=-1)
+    sums['exposure'] += equity.shape[-1] if invested is None else (np.asarray(invested, dtype=np.float64) / equity).sum(axis=-1)
+    sums['last'] = equity[..., -1]; sums['peak'] = peak[..., -1]
+    return sums
+
+def _ratio(numerator, denominator, floor=0.0):
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, dtype=np.float64), np.asarray(denominator, dtype=np.float64))
+    return np.divide(numerator, denominator, out=np.zeros(numerator.shape), where=denominator > floor)
+
+def _scalar(x):
+    return float(x) if np.ndim(x) == 0 else x
+
+def summarize_sums(sums, num_bars, bars_per_year):
+    """Statistics of a curve of num_bars bars from its running sums: max drawdown (%), longest underwater streak (bars),
+    Ulcer index (root mean square drawdown, %), annualized Sharpe and Sortino ratios of the bar returns at a zero
+    risk-free rate, and exposure (% of bars, weighted by the invested share of equity). Any mapping holding the
+    SUM_FIELDS it reads will do, such as a kernel's state; batches come back as arrays, one value per curve."""
+    num_returns = max(num_bars - 1, 1)
+    mean = np.asarray(sums['ret_sum']) / num_returns
+    std = np.sqrt(np.maximum(np.asarray(sums['ret_sq']) / num_returns - mean ** 2, 0)); downside = np.sqrt(np.asarray(sums['down_sq']) / num_returns)
+    annual_mean = mean * np.sqrt(bars_per_year)
+    stats = {'max_drawdown': np.abs(sums['min_dd']) * 100, 'max_dd_bars': np.asarray(sums['max_dd_bars']), 'ulcer': np.sqrt(np.asarray(sums['dd_sq']) / num_bars),
+             'sharpe': _ratio(annual_mean, std, FLAT_STD), 'sortino': _ratio(annual_mean, downside, FLAT_STD), 'exposure': np.asarray(sums['exposure']) / num_bars * 100}
+    return {k: _scalar(v) for k, v in stats.items()}
+
+def curve_stats(equity, bars_per_year, invested=None):
+    """summarize_sums of an equity curve, or of every row of a 2-D batch of curves."""
+    equity = np.asarray(equity, dtype=np.float64)
+    return summarize_sums(curve_sums(equity, invested), equity.shape[-1], bars_per_year)
+
+def max_drawdown_pct(equity_curve):
+    """Max peak-to-trough decline of an equity curve, in percent; one value per row for a 2-D batch."""
+    equity_curve = np.asarray(equity_curve, dtype=np.float64)
+    peak = np.maximum.accumulate(equity_curve, axis=-1)
+    return _scalar(np.abs(((equity_curve - peak) / peak).min(axis=-1)) * 100)
+
+def cagr_pct(final_equity, initial_capital, num_bars, bars_per_year):
+    """Compound annual growth rate in percent over num_bars bars, bars_per_year of which make a year."""
+    num_years = num_bars / bars_per_year
+    return _scalar(((np.asarray(final_equity, dtype=np.float64) / initial_capital) ** (1 / num_years) - 1) * 100) if num_years > 0 else 0
+
+def calmar(cagr, max_drawdown):
+    return _scalar(_ratio(cagr, max_drawdown))
+
+def trade_returns(trades_log, commission_pct):
+    """Net return of every closed trade in a run_backtest trade log, commission charged as in equity_curve_from_trades."""
+    return np.array([(1 - commission_pct) * t['exit_price'] / t['entry_price'] * (1 if t['reason'] == 'End of Data' else 1 - commission_pct) - 1
+                     for t in trades_log if 'exit_price' in t], dtype=np.float64)
+
+def average_trade_pct(trades_log, commission_pct):
+    returns = trade_returns(trades_log, commission_pct)
+    return float(returns.mean()) * 100 if len(returns) else 0.0
@@ -1,10 +1,20 @@
 import pandas as pd
-import pandas_ta as ta
 import os
 import glob
+import argparse
+import time
+import tempfile
 import numpy as np
-import matplotlib.pyplot as plt
 from datetime import datetime
+import backtest_engine
+import portfolio_engine
+import data_cache
+import results_store
+import instrumentation
+import metrics
+import position_sizing
+import robustness
+import walk_forward
 
 # --- Configuration Parameters ---
 STOCK_DATA_DIR = 'stockData'
@@ -13,6 +23,7 @@ INITIAL_PORTFOLIO_CAPITAL = 100000
 COMMISSION_PCT = 0.0005
 MA_PERIOD = 20
 MONEY_MARKET_RETURN_ANNUAL = 0.02
+CASH_RATE_FILE = None # e.g. 'rates/tbill.csv': date,rate rows of annual cash rates, each in force until the next (--cash-rate-file); overrides the constant above
 
 # --- <<< CHOOSE YOUR STRATEGY HERE >>> ---
 STOP_LOSS_MODE = 'NONE'  # Options: 'TRAILING', 'FIXED', 'PREVIOUS_YEAR_LOW', 'NONE'
@@ -21,22 +32,91 @@ STOP_LOSS_MODE = 'NONE'  # Options: 'TRAILING', 'FIXED', 'PREVIOUS_YEAR_LOW', 'N
 STOP_LEVELS_PCT = [15, 20, 25, 30, 50, 60]
 PROFIT_TARGETS_PCT = [None, 100, 200]
 
-def prepare_all_data(stock_files, ma_period):
-    """Loads, aligns, and calculates indicators for all tickers."""
+# --- <<< CHOOSE YOUR BENCHMARK REBALANCING HERE >>> ---
+REBALANCE_FREQUENCY = 'ANNUAL' # Options: 'ANNUAL', 'QUARTERLY', 'MONTHLY', 'DRIFT'
+REBALANCE_DRIFT_PCT = 25 # 'DRIFT' rebalances once any asset's weight is this many percent above or below its 1/N target
+
+# --- <<< CHOOSE YOUR ENGINE MODE HERE >>> ---
+GRID_MODE = True # Simulate the whole SL x PT grid in one pass over the data; False runs each combination separately
+INCREMENTAL_MODE = False # Resume the grid from its saved end-of-data checkpoint and simulate only new bars (needs GRID_MODE)
+CHECKPOINT_DIR = os.path.join(REPORTS_DIR, 'checkpoints')
+
+# --- <<< RANKING (--rank-by) >>> ---
+RANK_METRIC = 'Calmar' # Ratio the optimal strategy is chosen by: 'Calmar', 'Sharpe' or 'Sortino'
+
+# --- <<< MA SWEEP (--ma-periods) >>> ---
+MA_SWEEP_PERIODS = [] # e.g. [20, 50, 200]: simulate the full MA x SL x PT surface in one pass instead of MA_PERIOD alone
+
+# --- <<< WALK-FORWARD MODE (--walk-forward) >>> ---
+WALK_FORWARD_MA_PERIODS = [20, 50, 200] # MA periods optimized alongside SL/PT on each training window
+WALK_FORWARD_TRAIN_YEARS = 10
+WALK_FORWARD_TEST_YEARS = 2
+
+# --- <<< DATE WINDOW (--start / --end) >>> ---
+START_DATE = None # e.g. '2010-01-01': simulate only from this date on; indicators still see the full history
+END_DATE = None
+
+# --- <<< LARGE-UNIVERSE MODE (--low-memory) >>> ---
+LOW_MEMORY_MODE = False # Build the panel ticker by ticker from the price columns alone, instead of one wide all-column frame
+PANEL_DTYPE = 'float32' # Storage type of the low-memory panel; crossover signals are still decided in float64
+PANEL_MEMMAP_DIR = None # e.g. '.cache/panel': back the low-memory panel with a .npy file there instead of RAM (--memmap DIR)
+PANEL_PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+# --- <<< ROBUSTNESS ANALYSIS (--robustness N) >>> ---
+ROBUSTNESS_PATHS = 0 # e.g. 10000: block-bootstrap the optimal strategy's daily returns this many times and add confidence intervals to the report
+
+# --- <<< POSITION SIZING (--sizing) >>> ---
+SIZING_MODEL = 'EQUAL' # Options: 'EQUAL' (1/N of equity per entry), 'FIXED_FRACTIONAL', 'VOL_TARGET' (see position_sizing)
+SIZING_FRACTION = position_sizing.FRACTION # 'FIXED_FRACTIONAL': share of equity per new position (--sizing-fraction)
+SIZING_TARGET_VOL = position_sizing.TARGET_VOL # 'VOL_TARGET': annualized portfolio volatility, split evenly over the universe (--target-vol)
+
+def configure(data_dir=None, reports_dir=None, ma_period=None, stop_loss_mode=None, sizing_model=None, sizing_fraction=None, target_vol=None):
+    """Overrides STOCK_DATA_DIR, REPORTS_DIR (and CHECKPOINT_DIR inside it), MA_PERIOD, STOP_LOSS_MODE and the SIZING_*
+    settings for this process, so a run is chosen from the command line or by batch_runner instead of by editing them.
+    None keeps a value."""
+    global STOCK_DATA_DIR, REPORTS_DIR, CHECKPOINT_DIR, MA_PERIOD, STOP_LOSS_MODE, SIZING_MODEL, SIZING_FRACTION, SIZING_TARGET_VOL
+    if data_dir is not None: STOCK_DATA_DIR = data_dir
+    if reports_dir is not None: REPORTS_DIR = reports_dir; CHECKPOINT_DIR = os.path.join(reports_dir, 'checkpoints')
+    if ma_period is not None: MA_PERIOD = ma_period
+    if stop_loss_mode is not None: STOP_LOSS_MODE = stop_loss_mode
+    if sizing_model is not None: SIZING_MODEL = sizing_model
+    if sizing_fraction is not None: SIZING_FRACTION = sizing_fraction
+    if target_vol is not None: SIZING_TARGET_VOL = target_vol
+
+def sizing_spec():
+    """The position_sizing spec of the SIZING_* settings."""
+    return position_sizing.spec(SIZING_MODEL, fraction=SIZING_FRACTION, target_vol=SIZING_TARGET_VOL)
+
+def load_cash_rates(file_path):
+    """Annual cash rates from a CSV of date,rate rows (a header row, the dates in the first column and the rates, as
+    fractions, in the second) as a date-indexed Series for portfolio_engine.cash_rates."""
+    rates = pd.read_csv(file_path, index_col=0).iloc[:, 0].astype(float).dropna()
+    rates.index = pd.to_datetime(rates.index, utc=True).tz_localize(None).normalize()
+    return rates.sort_index()
+
+def cash_return_label(cash_return):
+    """Report line value for a constant rate or a rate series."""
+    if np.ndim(cash_return) == 0: return f"{cash_return*100:.2f}%"
+    return (f"{cash_return.iloc[0]*100:.2f}% to {cash_return.iloc[-1]*100:.2f}% (series of {len(cash_return)} rates, "
+            f"{cash_return.index[0].strftime('%Y-%m-%d')} to {cash_return.index[-1].strftime('%Y-%m-%d')})")
+
+def prepare_all_data(stock_files, ma_period, extra_ma_periods=()):
+    """Loads, aligns, and calculates indicators for all tickers. extra_ma_periods adds further SMA columns."""
     all_dfs = {}
     for file_path in stock_files:
         ticker = os.path.basename(file_path).split('_')[0]
         try:
-            df = pd.read_csv(file_path, index_col='Date', parse_dates=True)
-            df.index = pd.to_datetime(df.index, utc=True).tz_localize(None)
-            df.ta.sma(length=ma_period, append=True, col_names=(f'SMA_{ma_period}',))
-            df['Year'] = df.index.year
-            yearly_low = df.groupby('Year')['Low'].min().shift(1)
-            df['PrevYearLow'] = df['Year'].map(yearly_low)
+            with instrumentation.stage('load', ticker): df = data_cache.load_price_frame(file_path)
+            with instrumentation.stage('indicators', ticker, bars=len(df)): data_cache.add_indicators(df, file_path, ma_period, extra_ma_periods)
             df.ffill(inplace=True)
             all_dfs[ticker] = df
         except Exception as e:
             print(f"  [Error] Could not process {file_path}. Reason: {e}")
+    return align_all_data(all_dfs)
+
+def align_all_data(all_dfs):
+    """Joins per-ticker indicator frames ({ticker: frame}, each forward-filled) into the wide portfolio frame, starting
+    at the first date on which every ticker has all its columns."""
     if not all_dfs: return pd.DataFrame()
     combined_df = pd.concat(all_dfs.values(), keys=all_dfs.keys(), axis=1)
     first_valid_date = combined_df.dropna().index.min()
@@ -44,49 +124,102 @@ def prepare_all_data(stock_files, ma_period):
     combined_df.ffill(inplace=True)
     return combined_df
 
-def run_rebalanced_benchmark(df, initial_capital):
-    # This function is correct
-    num_assets = len(df.columns.levels[0])
-    equity_curve = []
-    rebalance_year = -1
-    positions = {ticker: 0 for ticker in df.columns.levels[0]}
-    for i in range(len(df)):
-        current_date = df.index[i]
-        current_value = sum(positions[ticker] * df[(ticker, 'Close')].iloc[i] for ticker in positions)
-        if i == 0: current_value = initial_capital
-        equity_curve.append(current_value)
-        if current_date.year != rebalance_year:
-            rebalance_year = current_date.year
-            allocation_per_asset = current_value / num_assets
-            for ticker in positions:
-                price = df[(ticker, 'Close')].iloc[i]
-                if price > 0: positions[ticker] = allocation_per_asset / price
-    return calculate_performance_metrics("Rebalanced B&H", equity_curve, initial_capital, len(df))
-
-def run_buy_and_forget_benchmark(df, initial_capital):
-    # This function is correct
-    num_assets = len(df.columns.levels[0])
-    equity_curve = []
-    allocation_per_asset = initial_capital / num_assets
-    positions = {}
-    for ticker in df.columns.levels[0]:
-        price = df[(ticker, 'Close')].iloc[0]
-        if price > 0: positions[ticker] = allocation_per_asset / price
-    for i in range(len(df)):
-        current_value = sum(positions[ticker] * df[(ticker, 'Close')].iloc[i] for ticker in positions)
-        equity_curve.append(current_value)
-    return calculate_performance_metrics("Buy & Forget B&H", equity_curve, initial_capital, len(df))
+def _load_panel_ticker(file_path, ma_periods):
+    """One ticker's price columns and indicators, forward-filled, as prepare_all_data sees them before alignment."""
+    ticker = os.path.basename(file_path).split('_')[0]
+    with instrumentation.stage('load', ticker): df = data_cache.load_price_frame(file_path, columns=PANEL_PRICE_COLUMNS)
+    with instrumentation.stage('indicators', ticker, bars=len(df)): data_cache.add_indicators(df, file_path, ma_periods[0], ma_periods[1:])
+    df = df[PANEL_PRICE_COLUMNS + [f'SMA_{m}' for m in ma_periods] + ['PrevYearLow']].ffill()
+    return ticker, df
+
+def _memmap_path(memmap_dir, prefix):
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix='.npy', dir=memmap_dir)
+    os.close(fd)
+    return path
+
+def remove_panel_files(panel):
+    """Deletes the memory-mapped files behind a prepare_panel_low_memory panel once the run is done with it. A file
+    that is still mapped elsewhere and cannot be removed (Windows) is left behind; its name is unique to the run."""
+    for values in (panel['values'], panel['weight']):
+        if isinstance(values, np.memmap) and values.filename:
+            try: os.remove(values.filename)
+            except OSError: pass
+
+def prepare_panel_low_memory(stock_files, ma_periods, start=START_DATE, end=END_DATE, dtype=PANEL_DTYPE, memmap_dir=PANEL_MEMMAP_DIR, sizing=None):
+    """Memory-bounded replacement for prepare_all_data + prepare_panel, for universes of thousands of tickers.
+    Reads only the price columns, one ticker at a time, in two passes: the first collects the union calendar and the
+    first bar on which every ticker is fully valid, the second writes each ticker's forward-filled bars of the
+    start..end window straight into a (bars x tickers x fields) array of `dtype`, memory-mapped under memmap_dir
+    when given, in files named for this run so that runs sharing the directory never overwrite each other's panel
+    (remove_panel_files deletes them). Only one ticker's history is ever held as a frame. Signals and `sizing` entry weights are computed in
+    float64 before the downcast.
+    Returns a prepare_panel dict (prepare_sweep_panel for several ma_periods), or None when nothing could be aligned."""
+    ma_periods = list(ma_periods)
+    files, calendar, common = [], None, None
+    for file_path in stock_files:
+        try: ticker, df = _load_panel_ticker(file_path, ma_periods)
+        except Exception as e: print(f"  [Error] Could not process {file_path}. Reason: {e}"); continue
+        dates = df.index.to_numpy(); valid_dates = dates[df.notna().all(axis=1).to_numpy()]
+        calendar = dates if calendar is None else np.union1d(calendar, dates)
+        common = valid_dates if common is None else np.intersect1d(common, valid_dates, assume_unique=True)
+        files.append((ticker, file_path))
+    if not files or not len(common): return None
+    window = pd.DatetimeIndex(calendar[calendar >= common[0]])
+    if start: window = window[window >= pd.Timestamp(start)]
+    if end: window = window[window <= pd.Timestamp(end)]
+    if len(window) < 3: return None
+    shape = (len(window), len(files), 6)
+    if memmap_dir:
+        os.makedirs(memmap_dir, exist_ok=True)
+        values = np.lib.format.open_memmap(_memmap_path(memmap_dir, 'panel_values_'), mode='w+', dtype=dtype, shape=shape)
+        weight = np.lib.format.open_memmap(_memmap_path(memmap_dir, 'panel_weight_'), mode='w+', dtype=dtype, shape=shape[:2])
+    else: values = np.empty(shape, dtype=dtype); weight = np.empty(shape[:2], dtype=dtype)
+    year_bars = backtest_engine.bars_per_year(window)
+    signal = np.zeros((len(window), len(files)) + ((len(ma_periods),) if len(ma_periods) > 1 else ()), dtype=np.bool_)
+    for t, (ticker, file_path) in enumerate(files):
+        _, df = _load_panel_ticker(file_path, ma_periods)
+        aligned = df.reindex(window, method='ffill')
+        close = aligned['Close'].to_numpy(dtype=np.float64)
+        sma = aligned[[f'SMA_{m}' for m in ma_periods]].to_numpy(dtype=np.float64)
+        signal[:, t] = portfolio_engine.crossover_signal(close[:, None], sma) if len(ma_periods) > 1 else portfolio_engine.crossover_signal(close, sma[:, 0])
+        weight[:, t] = position_sizing.entry_weights(sizing, aligned['High'].to_numpy(dtype=np.float64), aligned['Low'].to_numpy(dtype=np.float64), close, year_bars, len(files))
+        for f, col in enumerate(PANEL_PRICE_COLUMNS + [f'SMA_{ma_periods[0]}', 'PrevYearLow']): values[:, t, f] = aligned[col].to_numpy()
+        del df, aligned
+    if memmap_dir: values.flush(); weight.flush()
+    return {'index': window, 'tickers': [ticker for ticker, _ in files], 'values': values, 'signal': signal, 'weight': weight, 'sizing': sizing or position_sizing.EQUAL}
 
-def run_active_strategy(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return):
-    # This function is correct
-    num_assets = len(df.columns.levels[0])
+def run_rebalanced_benchmark(df, initial_capital, frequency=REBALANCE_FREQUENCY, drift_pct=REBALANCE_DRIFT_PCT, panel=None):
+    """Equal-weight benchmark reset to 1/N on each rebalance (see portfolio_engine.rebalanced_equity).
+    Given a panel, its Close field is used and df may be None."""
+    close, index = (portfolio_engine.close_matrix(df), df.index) if panel is None else (panel['values'][:, :, portfolio_engine.F_CLOSE], panel['index'])
+    equity_curve, _ = portfolio_engine.rebalanced_equity(close, index, initial_capital, frequency, drift_pct / 100)
+    label = f"Drift {drift_pct:g}%" if frequency == 'DRIFT' else frequency.title()
+    return calculate_performance_metrics("Rebalanced B&H" if frequency == 'ANNUAL' else f"Rebalanced B&H ({label})", equity_curve, initial_capital, len(index),
+                                        backtest_engine.bars_per_year(index))
+
+def run_buy_and_forget_benchmark(df, initial_capital, panel=None):
+    """Equal-weight purchase on the first bar, never rebalanced. Given a panel, df may be None."""
+    close, index = (portfolio_engine.close_matrix(df), df.index) if panel is None else (panel['values'][:, :, portfolio_engine.F_CLOSE], panel['index'])
+    equity_curve = portfolio_engine.buy_and_forget_equity(close, initial_capital)
+    return calculate_performance_metrics("Buy & Forget B&H", equity_curve, initial_capital, len(close), backtest_engine.bars_per_year(index))
+
+def run_active_strategy(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return, panel=None):
+    """Runs one SL/PT combination on the dense-panel engine, or fetches it and its curves from the results store when
+    the data and parameters were seen before. Matches run_active_strategy_reference to within rounding."""
+    return results_store.portfolio_run(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return, COMMISSION_PCT, panel=panel)
+
+def run_active_strategy_reference(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return, sizing=None):
+    """Original dict-of-positions implementation, kept as the correctness reference for the panel engine."""
+    tickers = list(df.columns.levels[0])
     sma_col = f'SMA_{ma_period}'
-    daily_cash_rate = (1 + annual_cash_return)**(1/252) - 1
+    bar_cash_rate = portfolio_engine.cash_rates(df.index, annual_cash_return, backtest_engine.bars_per_year(df.index))
+    weight = position_sizing.entry_weights(sizing, *(np.column_stack([df[(ticker, field)].to_numpy(dtype=np.float64) for ticker in tickers]) for field in ['High', 'Low', 'Close']),
+                                           backtest_engine.bars_per_year(df.index), len(tickers))
     cash = initial_capital
     positions = {ticker: {'shares': 0, 'entry_price': 0, 'peak_price': 0, 'static_stop': 0} for ticker in df.columns.levels[0]}
-    equity_curve = []; cash_curve = []; total_trades = 0
+    equity_curve = []; cash_curve = []; total_trades = 0; total_trade_return = 0.0
     for i in range(len(df)):
-        if i > 0: cash *= (1 + daily_cash_rate)
+        if i > 0: cash *= (1 + bar_cash_rate[i])
         invested_capital = 0
         if i > 1:
             for ticker in positions:
@@ -105,16 +238,16 @@ def run_active_strategy(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capi
                     if exit_price != -1:
                         exit_value = positions[ticker]['shares'] * exit_price
                         cash += exit_value * (1 - COMMISSION_PCT)
+                        total_trade_return += portfolio_engine.trade_return(positions[ticker]['entry_price'], exit_price, COMMISSION_PCT)
                         positions[ticker] = {'shares': 0, 'entry_price': 0, 'peak_price': 0, 'static_stop': 0}
             invested_capital = sum(positions[ticker]['shares'] * df[(ticker, 'Close')].iloc[i] for ticker in positions)
             current_equity = cash + invested_capital
-            max_allocation_per_asset = current_equity / num_assets
-            for ticker in positions:
+            for t, ticker in enumerate(positions):
                 prev_close = df[(ticker, 'Close')].iloc[i-1]; prev_sma = df[(ticker, sma_col)].iloc[i-1]
                 prev_prev_close = df[(ticker, 'Close')].iloc[i-2]; prev_prev_sma = df[(ticker, sma_col)].iloc[i-2]
                 if positions[ticker]['shares'] == 0 and (prev_prev_close <= prev_prev_sma and prev_close > prev_sma):
                     current_investment_in_ticker = positions[ticker]['shares'] * df[(ticker, 'Close')].iloc[i]
-                    position_size_dollars = min(max_allocation_per_asset - current_investment_in_ticker, cash)
+                    position_size_dollars = min(current_equity * weight[i, t] - current_investment_in_ticker, cash)
                     if position_size_dollars > 1:
                         entry_price = df[(ticker, 'Open')].iloc[i]
                         if entry_price > 0:
@@ -130,69 +263,191 @@ def run_active_strategy(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capi
         equity_curve.append(cash + final_invested_capital)
         cash_curve.append(cash)
     name = f"Active Strategy (SL:{stop_level_pct or 'Struct'}, PT:{pt_pct or 'None'})"
-    metrics = calculate_performance_metrics(name, equity_curve, initial_capital, len(df))
-    metrics["Total Trades"] = total_trades
-    return metrics, equity_curve, cash_curve
-
-def calculate_performance_metrics(name, equity_curve, initial_capital, num_days):
-    """Calculates final performance metrics from an equity curve."""
-    final_equity = equity_curve[-1]
-    final_pnl = final_equity - initial_capital
-    num_years = num_days / 252.0
-    cagr = ((final_equity / initial_capital) ** (1 / num_years) - 1) * 100 if num_years > 0 else 0
-    eq_series = pd.Series(equity_curve)
-    peak = eq_series.expanding(min_periods=1).max()
-    drawdown = (eq_series - peak) / peak
-    max_drawdown = abs(drawdown.min()) * 100
-    calmar = cagr / max_drawdown if max_drawdown > 0 else 0
-    return { "Name": name, "Final Value": final_equity, "P&L": final_pnl, "CAGR": cagr, "Max Drawdown": max_drawdown, "Calmar": calmar }
+    summary = calculate_performance_metrics(name, equity_curve, initial_capital, len(df), backtest_engine.bars_per_year(df.index), cash_curve)
+    summary["Total Trades"] = total_trades
+    last_close = np.array([df[(ticker, 'Close')].iloc[-1] for ticker in positions])
+    summary["Avg Trade"] = float(portfolio_engine.average_trade_pct(total_trade_return, total_trades, np.array([positions[ticker]['shares'] for ticker in positions]),
+                                                                    np.array([positions[ticker]['entry_price'] for ticker in positions]), last_close, COMMISSION_PCT))
+    return summary, equity_curve, cash_curve
+
+def calculate_performance_metrics(name, equity_curve, initial_capital, num_days, bars_per_year=backtest_engine.TRADING_DAYS_PER_YEAR, cash_curve=None):
+    """Calculates final performance metrics from an equity curve of num_days bars. Exposure counts the capital outside
+    cash_curve as invested; without a cash curve (the benchmarks) the portfolio is fully invested throughout."""
+    equity_curve = np.asarray(equity_curve, dtype=np.float64)
+    invested = None if cash_curve is None else equity_curve - np.asarray(cash_curve, dtype=np.float64)
+    return portfolio_engine.performance_summary(name, equity_curve[-1], metrics.curve_stats(equity_curve, bars_per_year, invested), initial_capital, num_days, bars_per_year)
 
 def generate_equity_chart(dates, equity_curve, cash_curve, report_dir, ma_period, stop_loss_mode):
-    # This function is correct
+    """Draws the optimal strategy's cash and invested capital on an Agg canvas. matplotlib is imported here rather
+    than with the module, and without pyplot, so runs that never reach the chart do not pay for it at startup."""
+    import matplotlib.style as mstyle
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.ticker import FuncFormatter
     plot_dir = os.path.join(report_dir, 'plots')
     os.makedirs(plot_dir, exist_ok=True)
     equity_curve = np.array(equity_curve); cash_curve = np.array(cash_curve)
     invested_curve = equity_curve - cash_curve
-    plt.style.use('seaborn-v0_8-whitegrid')
-    fig, ax = plt.subplots(figsize=(12, 8))
-    ax.stackplot(dates, cash_curve, invested_curve, labels=['Cash (earning interest)', 'Invested Capital'], colors=['#ADD8E6', '#4682B4'], alpha=0.8)
-    ax.plot(dates, equity_curve, color='black', linewidth=1.5, label='Total Equity')
-    ax.set_title(f'Portfolio Equity Over Time (MA: {ma_period}, SL Mode: {stop_loss_mode})', fontsize=16)
-    ax.set_ylabel('Portfolio Value ($)'); ax.set_xlabel('Date')
-    ax.legend(loc='upper left'); ax.grid(True)
-    ax.get_yaxis().set_major_formatter(plt.FuncFormatter(lambda x, p: format(int(x), ',')))
-    fig.tight_layout()
-    chart_filename = os.path.join(plot_dir, f'equity_curve_{ma_period}_{stop_loss_mode}.png')
-    plt.savefig(chart_filename, dpi=150); plt.close()
+    with mstyle.context('seaborn-v0_8-whitegrid'):
+        fig = Figure(figsize=(12, 8)); FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.stackplot(dates, cash_curve, invested_curve, labels=['Cash (earning interest)', 'Invested Capital'], colors=['#ADD8E6', '#4682B4'], alpha=0.8)
+        ax.plot(dates, equity_curve, color='black', linewidth=1.5, label='Total Equity')
+        ax.set_title(f'Portfolio Equity Over Time (MA: {ma_period}, SL Mode: {stop_loss_mode})', fontsize=16)
+        ax.set_ylabel('Portfolio Value ($)'); ax.set_xlabel('Date')
+        ax.legend(loc='upper left'); ax.grid(True)
+        ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
+        fig.tight_layout()
+        chart_filename = os.path.join(plot_dir, f'equity_curve_{ma_period}_{stop_loss_mode}.png')
+        with instrumentation.stage('savefig'): fig.savefig(chart_filename, dpi=150)
     print(f"\nEquity chart saved to {chart_filename}")
 
-def main():
-    """Main function to run all simulations and generate the final, reproducible comparison report."""
+def run_walk_forward(stock_files, workers=1, rebalance=REBALANCE_FREQUENCY, cash_return=MONEY_MARKET_RETURN_ANNUAL):
+    """Walk-forward analysis of the portfolio: rolling in-sample optimization of MA/SL/PT and a stitched
+    out-of-sample equity curve, compared against the benchmarks over the same out-of-sample period."""
+    asset_universe = [os.path.basename(f).split('_')[0] for f in stock_files]
+    portfolio_df = prepare_all_data(stock_files, WALK_FORWARD_MA_PERIODS[0], extra_ma_periods=WALK_FORWARD_MA_PERIODS[1:])
+    if portfolio_df.empty: print("Could not create portfolio DataFrame."); return
+    if STOP_LOSS_MODE in ['TRAILING', 'FIXED']: stop_levels_to_test = STOP_LEVELS_PCT
+    else: stop_levels_to_test = [None]
+    combos = [(sl_pct, pt_pct) for sl_pct in stop_levels_to_test for pt_pct in PROFIT_TARGETS_PCT]
+    print(f"\n--- Running Walk-Forward Analysis (Mode: {STOP_LOSS_MODE}, MA: {WALK_FORWARD_MA_PERIODS}, Workers: {workers}) ---")
+    year_bars = backtest_engine.bars_per_year(portfolio_df.index)
+    result = walk_forward.walk_forward_portfolio(portfolio_df, STOP_LOSS_MODE, combos, WALK_FORWARD_MA_PERIODS, INITIAL_PORTFOLIO_CAPITAL, cash_return,
+                                                 COMMISSION_PCT, int(WALK_FORWARD_TRAIN_YEARS * year_bars), int(WALK_FORWARD_TEST_YEARS * year_bars), workers=workers,
+                                                 sizing=sizing_spec())
+    if result is None: print(f"History is shorter than one {WALK_FORWARD_TRAIN_YEARS}-year training window."); return
+    windows_df, oos_equity, wf_metrics = result
+    oos_df = portfolio_df.loc[oos_equity.index[0]:]
+    float_cols = ['Final Value', 'P&L', 'CAGR', 'Max Drawdown', 'Calmar', 'Sharpe', 'Sortino', 'Ulcer Index']
+    walk_forward_results = dict({"Name": "Walk-Forward Strategy"}, **{k: wf_metrics[k] for k in float_cols + ['Max DD Duration']})
+    report_df = pd.DataFrame([walk_forward_results, run_rebalanced_benchmark(oos_df, INITIAL_PORTFOLIO_CAPITAL, rebalance), run_buy_and_forget_benchmark(oos_df, INITIAL_PORTFOLIO_CAPITAL)])
+    report_df = report_df[list(walk_forward_results)]
+    for col in float_cols:
+        report_df[col] = report_df[col].apply(lambda x: f"{x:,.2f}")
+    windows_display = windows_df.copy()
+    for col in ['IS Calmar', 'OOS Return (%)', 'OOS Max Drawdown (%)']:
+        windows_display[col] = windows_display[col].apply(lambda x: f"{x:,.2f}")
+    print(report_df.to_string(index=False))
+
+    md_content = f"# Walk-Forward Portfolio Analysis\n\n"
+    md_content += f"- **Date of Analysis:** {datetime.now().strftime('%Y-%m-%d')}\n"
+    md_content += f"- **Out-of-Sample Period:** {oos_equity.index[0].strftime('%Y-%m-%d')} to {oos_equity.index[-1].strftime('%Y-%m-%d')}\n"
+    md_content += f"- **Portfolio Universe ({len(asset_universe)} assets):** {', '.join(asset_universe)}\n\n"
+    md_content += "## Walk-Forward Configuration\n"
+    md_content += f"- **Initial Capital:** ${INITIAL_PORTFOLIO_CAPITAL:,.2f}\n"
+    md_content += f"- **MA Periods Searched:** {', '.join(str(p) for p in WALK_FORWARD_MA_PERIODS)}\n"
+    md_content += f"- **Stop Loss Mode:** {STOP_LOSS_MODE}\n"
+    md_content += f"- **Windows:** {WALK_FORWARD_TRAIN_YEARS}-year training, {WALK_FORWARD_TEST_YEARS}-year out-of-sample test, rolled forward by the test length\n"
+    md_content += f"- **Commission (% per side):** {COMMISSION_PCT*100:.3f}%\n"
+    md_content += f"- **Position Sizing:** {position_sizing.describe(sizing_spec())}\n"
+    md_content += f"- **Cash Return (Annual):** {cash_return_label(cash_return)}\n\n"
+    md_content += "## Stitched Out-of-Sample Performance\n\n"
+    md_content += report_df.to_markdown(index=False)
+    md_content += "\n\n## Windows\n\n"
+    md_content += windows_display.to_markdown(index=False)
+    report_path = os.path.join(REPORTS_DIR, f'final_portfolio_walkforward_{STOP_LOSS_MODE}.md')
+    with open(report_path, 'w') as f: f.write(md_content)
+    print(f"\nReport saved to {report_path}")
+
+def main(incremental=INCREMENTAL_MODE, walk_forward_mode=False, workers=1, ma_periods=MA_SWEEP_PERIODS, use_store=True, rebalance=REBALANCE_FREQUENCY, instrument=False,
+         low_memory=LOW_MEMORY_MODE, memmap_dir=PANEL_MEMMAP_DIR, start=START_DATE, end=END_DATE, robustness_paths=ROBUSTNESS_PATHS,
+         rank_by=RANK_METRIC, portfolio_df=None, cash_rate_file=CASH_RATE_FILE):
+    """Main function to run all simulations and generate the final, reproducible comparison report.
+    With incremental=True the grid resumes from its checkpoint, so only bars added since the last run are simulated.
+    walk_forward_mode=True runs the walk-forward analysis instead, with its windows spread across `workers` processes.
+    Two or more ma_periods turn on the MA sweep: the whole MA x SL x PT surface is simulated in one pass.
+    Unless use_store=False, full-history runs are memoized in the results store and served from it when nothing changed.
+    rebalance sets the rebalanced benchmark's schedule ('ANNUAL', 'QUARTERLY', 'MONTHLY' or 'DRIFT').
+    instrument=True times every stage and writes a timing_portfolio_*.md summary next to the report.
+    low_memory=True builds the panel with prepare_panel_low_memory (PANEL_DTYPE, memory-mapped under memmap_dir when
+    given) and never creates the wide frame. start/end restrict the simulated window in either mode.
+    robustness_paths > 0 block-bootstraps the optimal strategy's daily returns that many times, across `workers`
+    processes, and adds confidence intervals of its CAGR, drawdown and Calmar to the report.
+    rank_by picks the ratio ('Calmar', 'Sharpe' or 'Sortino') the optimal strategy is chosen by.
+    portfolio_df is the prepare_all_data frame when the caller already has it (batch_runner shares the loaded data
+    across jobs); otherwise STOCK_DATA_DIR is loaded.
+    cash_rate_file replaces MONEY_MARKET_RETURN_ANNUAL with the dated rate series in that CSV (see load_cash_rates).
+    Entries are sized by the SIZING_* settings."""
+    results_store.STORE_ENABLED = use_store
+    instrumentation.ENABLED = instrument; instrumentation.reset()
+    wall_start = time.perf_counter()
     os.makedirs(REPORTS_DIR, exist_ok=True)
     stock_files = glob.glob(os.path.join(STOCK_DATA_DIR, '*.csv'))
     if not stock_files: print("Error: No CSV files found."); return
+    cash_return = load_cash_rates(cash_rate_file) if cash_rate_file else MONEY_MARKET_RETURN_ANNUAL
+    sizing = sizing_spec()
+    if walk_forward_mode: run_walk_forward(stock_files, workers, rebalance, cash_return); return
     
     asset_universe = [os.path.basename(f).split('_')[0] for f in stock_files]
     print(f"Found {len(asset_universe)} assets: {', '.join(asset_universe)}. Preparing portfolio data...\n")
     
-    portfolio_df = prepare_all_data(stock_files, MA_PERIOD)
-    if portfolio_df.empty: print("Could not create portfolio DataFrame."); return
+    sweep = len(ma_periods) > 1
+    ma_label = '-'.join(str(p) for p in ma_periods) if sweep else MA_PERIOD
+    if low_memory:
+        loaded_panel = prepare_panel_low_memory(stock_files, ma_periods if sweep else [MA_PERIOD], start, end, PANEL_DTYPE, memmap_dir, sizing)
+        if loaded_panel is None: print("Could not create portfolio panel."); return
+        portfolio_df, dates = None, loaded_panel['index']
+        asset_universe = loaded_panel['tickers']
+        print(f"Low-memory panel: {len(dates)} bars x {len(asset_universe)} tickers, {loaded_panel['values'].nbytes / 2**20:,.1f} MiB ({PANEL_DTYPE}{', memory-mapped' if memmap_dir else ''})")
+    else:
+        if portfolio_df is None and sweep: portfolio_df = prepare_all_data(stock_files, ma_periods[0], extra_ma_periods=ma_periods[1:])
+        elif portfolio_df is None: portfolio_df = prepare_all_data(stock_files, MA_PERIOD)
+        if not portfolio_df.empty and (start or end): portfolio_df = portfolio_df.loc[start:end]
+        if portfolio_df.empty: print("Could not create portfolio DataFrame."); return
+        loaded_panel, dates = None, portfolio_df.index
     
-    rebalanced_results = run_rebalanced_benchmark(portfolio_df, INITIAL_PORTFOLIO_CAPITAL)
-    buy_and_forget_results = run_buy_and_forget_benchmark(portfolio_df, INITIAL_PORTFOLIO_CAPITAL)
+    with instrumentation.stage('benchmarks', bars=len(dates)):
+        rebalanced_results = run_rebalanced_benchmark(portfolio_df, INITIAL_PORTFOLIO_CAPITAL, rebalance, panel=loaded_panel)
+        buy_and_forget_results = run_buy_and_forget_benchmark(portfolio_df, INITIAL_PORTFOLIO_CAPITAL, panel=loaded_panel)
     
     print(f"\n--- Running Active Strategy Grid Search (Mode: {STOP_LOSS_MODE}) ---")
     if STOP_LOSS_MODE in ['TRAILING', 'FIXED']: stop_levels_to_test = STOP_LEVELS_PCT
     else: stop_levels_to_test = [None] 
 
-    active_strategy_results = []
-    for sl_pct in stop_levels_to_test:
-        for pt_pct in PROFIT_TARGETS_PCT:
+    combos = [(sl_pct, pt_pct) for sl_pct in stop_levels_to_test for pt_pct in PROFIT_TARGETS_PCT]
+    if low_memory:
+        if sweep: sweep_panel = loaded_panel
+        else: panel = loaded_panel
+    else:
+        with instrumentation.stage('panel', bars=len(dates)):
+            if sweep: sweep_panel = portfolio_engine.prepare_sweep_panel(portfolio_df, ma_periods, sizing)
+            else: panel = portfolio_engine.prepare_panel(portfolio_df, MA_PERIOD, sizing)
+    simulation = instrumentation.stage('simulation', bars=len(dates), combinations=len(ma_periods) * len(combos) if sweep else len(combos))
+    instrumentation.count('combinations', len(ma_periods) * len(combos) if sweep else len(combos))
+    if sweep and incremental:
+        print(f"  Testing {len(ma_periods) * len(combos)} MA/SL/PT combinations (MA: {ma_periods}) in a single pass, resuming from checkpoint...")
+        checkpoint_path = os.path.join(CHECKPOINT_DIR, f'portfolio_{ma_label}_{STOP_LOSS_MODE}.pkl')
+        with simulation:
+            active_strategy_results, checkpoint = portfolio_engine.run_active_strategy_sweep(portfolio_df, STOP_LOSS_MODE, ma_periods, combos, INITIAL_PORTFOLIO_CAPITAL, cash_return, COMMISSION_PCT, panel=sweep_panel,
+                                                                                             checkpoint=backtest_engine.load_checkpoint(checkpoint_path), return_checkpoint=True)
+        if checkpoint['resumed_from'] is None: print("  No usable checkpoint, simulated the full history")
+        else: print(f"  Simulated {len(dates) - checkpoint['resumed_from']} new bar(s)")
+        backtest_engine.save_checkpoint(checkpoint_path, checkpoint)
+    elif sweep:
+        print(f"  Testing {len(ma_periods) * len(combos)} MA/SL/PT combinations (MA: {ma_periods}) in a single pass...")
+        with simulation: active_strategy_results = results_store.portfolio_sweep(portfolio_df, STOP_LOSS_MODE, ma_periods, combos, INITIAL_PORTFOLIO_CAPITAL, cash_return, COMMISSION_PCT, panel=sweep_panel)
+    elif GRID_MODE and incremental:
+        print(f"  Testing {len(combos)} SL/PT combinations in a single pass, resuming from checkpoint...")
+        checkpoint_path = os.path.join(CHECKPOINT_DIR, f'portfolio_{MA_PERIOD}_{STOP_LOSS_MODE}.pkl')
+        with simulation:
+            active_strategy_results, checkpoint = portfolio_engine.run_active_strategy_grid(portfolio_df, STOP_LOSS_MODE, combos, INITIAL_PORTFOLIO_CAPITAL, MA_PERIOD, cash_return, COMMISSION_PCT, panel=panel,
+                                                                                            checkpoint=backtest_engine.load_checkpoint(checkpoint_path), return_checkpoint=True)
+        if checkpoint['resumed_from'] is None: print("  No usable checkpoint, simulated the full history")
+        else: print(f"  Simulated {len(dates) - checkpoint['resumed_from']} new bar(s)")
+        backtest_engine.save_checkpoint(checkpoint_path, checkpoint)
+    elif GRID_MODE:
+        print(f"  Testing {len(combos)} SL/PT combinations in a single pass...")
+        with simulation: active_strategy_results = results_store.portfolio_grid(portfolio_df, STOP_LOSS_MODE, combos, INITIAL_PORTFOLIO_CAPITAL, MA_PERIOD, cash_return, COMMISSION_PCT, panel=panel)
+    else:
+        active_strategy_results = []
+        for sl_pct, pt_pct in combos:
             print(f"  Testing SL: {sl_pct or 'Struct'}, PT: {pt_pct or 'None'}...")
-            result, _, _ = run_active_strategy(portfolio_df, STOP_LOSS_MODE, sl_pct, pt_pct, INITIAL_PORTFOLIO_CAPITAL, MA_PERIOD, MONEY_MARKET_RETURN_ANNUAL)
+            with instrumentation.stage('simulation', bars=len(dates), combinations=1):
+                result, _, _ = run_active_strategy(portfolio_df, STOP_LOSS_MODE, sl_pct, pt_pct, INITIAL_PORTFOLIO_CAPITAL, MA_PERIOD, cash_return, panel=panel)
             active_strategy_results.append(result)
 
-    optimal_strategy_metrics = max(active_strategy_results, key=lambda x: x['Calmar'])
+    optimal_strategy_metrics = max(active_strategy_results, key=lambda x: x[rank_by])
     
     print("\n--- Re-running optimal strategy to generate equity chart ---")
     name_parts = optimal_strategy_metrics['Name'].replace(')','').replace('(','').split(' ')
@@ -200,40 +455,90 @@ def main():
     pt_part = [p for p in name_parts if 'PT:' in p][0].split(':')[1].replace(',', '')
     optimal_sl = None if sl_part == 'Struct' else int(sl_part)
     optimal_pt = None if pt_part == 'None' else int(pt_part)
-    _, optimal_equity_curve, optimal_cash_curve = run_active_strategy(portfolio_df, STOP_LOSS_MODE, optimal_sl, optimal_pt, INITIAL_PORTFOLIO_CAPITAL, MA_PERIOD, MONEY_MARKET_RETURN_ANNUAL)
+    optimal_ma = optimal_strategy_metrics.get('MA Period', MA_PERIOD)
+    if sweep: panel = dict(sweep_panel, signal=sweep_panel['signal'][:, :, ma_periods.index(optimal_ma)])
+    with instrumentation.stage('optimal rerun', bars=len(dates), combinations=1):
+        _, optimal_equity_curve, optimal_cash_curve = run_active_strategy(portfolio_df, STOP_LOSS_MODE, optimal_sl, optimal_pt, INITIAL_PORTFOLIO_CAPITAL, optimal_ma, cash_return, panel=panel)
     
+    robustness_md = None
+    if robustness_paths > 0:
+        returns = robustness.daily_returns(optimal_equity_curve)
+        with instrumentation.stage('robustness', bars=len(returns), combinations=robustness_paths):
+            robustness_md, _ = robustness.robustness_report(returns, len(dates) / backtest_engine.bars_per_year(dates), 'block', robustness_paths, workers=workers)
+        print(f"  Resampled the optimal strategy {robustness_paths:,} times")
+
     all_results = [optimal_strategy_metrics, rebalanced_results, buy_and_forget_results]
     report_df_raw = pd.DataFrame(all_results)
     
     report_df_formatted = report_df_raw.copy()
     report_df_formatted['Total Trades'] = report_df_formatted['Total Trades'].fillna(0).astype(int)
-    float_cols = ['Final Value', 'P&L', 'CAGR', 'Max Drawdown', 'Calmar']
+    if sweep: report_df_formatted['MA Period'] = report_df_formatted['MA Period'].apply(lambda x: '' if pd.isna(x) else int(x))
+    float_cols = ['Final Value', 'P&L', 'CAGR', 'Max Drawdown', 'Calmar', 'Sharpe', 'Sortino', 'Ulcer Index', 'Exposure', 'Avg Trade']
     for col in float_cols:
-        report_df_formatted[col] = report_df_formatted[col].apply(lambda x: f"{x:,.2f}")
+        report_df_formatted[col] = report_df_formatted[col].apply(lambda x: '' if pd.isna(x) else f"{x:,.2f}")
 
     print("\n\n--- FINAL PORTFOLIO COMPARISON REPORT ---")
-    print(f"Analysis Period: {portfolio_df.index.min().strftime('%Y-%m-%d')} to {portfolio_df.index.max().strftime('%Y-%m-%d')}")
+    print(f"Analysis Period: {dates.min().strftime('%Y-%m-%d')} to {dates.max().strftime('%Y-%m-%d')}")
     print(report_df_formatted.to_string(index=False))
     
     # <<< NEW: Create the comprehensive report header >>>
     md_content = f"# Final Portfolio Analysis\n\n"
     md_content += f"- **Date of Analysis:** {datetime.now().strftime('%Y-%m-%d')}\n"
-    md_content += f"- **Analysis Period:** {portfolio_df.index.min().strftime('%Y-%m-%d')} to {portfolio_df.index.max().strftime('%Y-%m-%d')}\n"
+    md_content += f"- **Analysis Period:** {dates.min().strftime('%Y-%m-%d')} to {dates.max().strftime('%Y-%m-%d')}\n"
     md_content += f"- **Portfolio Universe ({len(asset_universe)} assets):** {', '.join(asset_universe)}\n\n"
     md_content += "## Strategy Configuration\n"
     md_content += f"- **Initial Capital:** ${INITIAL_PORTFOLIO_CAPITAL:,.2f}\n"
-    md_content += f"- **MA Period:** {MA_PERIOD}\n"
+    md_content += f"- **MA Period:** {'/'.join(str(p) for p in ma_periods) if sweep else MA_PERIOD}\n"
     md_content += f"- **Stop Loss Mode:** {STOP_LOSS_MODE}\n"
     md_content += f"- **Commission (% per side):** {COMMISSION_PCT*100:.3f}%\n"
-    md_content += f"- **Cash Return (Annual):** {MONEY_MARKET_RETURN_ANNUAL*100:.2f}%\n\n"
+    md_content += f"- **Position Sizing:** {position_sizing.describe(sizing)}\n"
+    md_content += f"- **Cash Return (Annual):** {cash_return_label(cash_return)}\n"
+    md_content += f"- **Optimal Strategy Ranked By:** {rank_by} Ratio\n"
+    md_content += f"- **Benchmark Rebalancing:** {rebalance.title() if rebalance != 'DRIFT' else f'Drift > {REBALANCE_DRIFT_PCT}% of target weight'}\n\n"
     md_content += "## Final Performance Comparison\n\n"
     md_content += report_df_formatted.to_markdown(index=False)
+    if robustness_md: md_content += "\n\n" + robustness_md
+    if sweep:
+        surface_df = pd.DataFrame(active_strategy_results)
+        for col in float_cols: surface_df[col] = surface_df[col].apply(lambda x: f"{x:,.2f}")
+        md_content += "\n\n## MA x SL x PT Surface\n\n"
+        md_content += surface_df.to_markdown(index=False)
     
-    report_path = os.path.join(REPORTS_DIR, f'final_portfolio_report_{MA_PERIOD}_{STOP_LOSS_MODE}.md')
+    report_path = os.path.join(REPORTS_DIR, f'final_portfolio_report_{ma_label}_{STOP_LOSS_MODE}.md')
     with open(report_path, 'w') as f: f.write(md_content)
     print(f"\nReport saved to {report_path}")
 
-    generate_equity_chart(portfolio_df.index, optimal_equity_curve, optimal_cash_curve, REPORTS_DIR, MA_PERIOD, STOP_LOSS_MODE)
+    with instrumentation.stage('chart'): generate_equity_chart(dates, optimal_equity_curve, optimal_cash_curve, REPORTS_DIR, optimal_ma, STOP_LOSS_MODE)
+    if instrument: print(f"Timing summary saved to {instrumentation.write_report(REPORTS_DIR, f'portfolio_{ma_label}_{STOP_LOSS_MODE}', time.perf_counter() - wall_start)}")
+    if loaded_panel is not None and memmap_dir: remove_panel_files(loaded_panel)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Multi-asset portfolio SMA crossover backtester.")
+    parser.add_argument('--data-dir', default=STOCK_DATA_DIR, help=f"Directory of price CSVs forming the universe (default: {STOCK_DATA_DIR}).")
+    parser.add_argument('--reports-dir', default=REPORTS_DIR, help=f"Directory the report and equity chart are written to (default: {REPORTS_DIR}).")
+    parser.add_argument('--ma-period', type=int, default=MA_PERIOD, help=f"SMA period of the crossover (default: {MA_PERIOD}).")
+    parser.add_argument('--stop-loss-mode', choices=['TRAILING', 'FIXED', 'PREVIOUS_YEAR_LOW', 'NONE'], default=STOP_LOSS_MODE, help=f"Stop-loss mode to test (default: {STOP_LOSS_MODE}).")
+    parser.add_argument('--incremental', action='store_true', default=INCREMENTAL_MODE, help="Resume the grid from its saved checkpoint and simulate only new bars.")
+    parser.add_argument('--ma-periods', type=int, nargs='+', default=MA_SWEEP_PERIODS, help="Sweep these MA periods together with SL/PT in one pass (e.g. --ma-periods 20 50 200).")
+    parser.add_argument('--walk-forward', action='store_true', help="Run the rolling in-sample/out-of-sample walk-forward analysis instead of the full-history grid.")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes to spread walk-forward windows or robustness paths across (default: 1).")
+    parser.add_argument('--no-store', action='store_true', help="Ignore the results store and simulate every combination.")
+    parser.add_argument('--rebalance', choices=['ANNUAL', 'QUARTERLY', 'MONTHLY', 'DRIFT'], default=REBALANCE_FREQUENCY, help=f"Rebalancing schedule of the equal-weight benchmark (default: {REBALANCE_FREQUENCY}).")
+    parser.add_argument('--instrument', action='store_true', help="Time every stage and write a timing summary next to the report.")
+    parser.add_argument('--profile', action='store_true', help="Dump cProfile stats for the whole run into the reports' profiles directory.")
+    parser.add_argument('--low-memory', action='store_true', default=LOW_MEMORY_MODE, help=f"Build the panel ticker by ticker from the price columns only, as {PANEL_DTYPE}, for very large universes.")
+    parser.add_argument('--memmap', metavar='DIR', default=PANEL_MEMMAP_DIR, help="With --low-memory, back the panel with a memory-mapped file in DIR instead of RAM.")
+    parser.add_argument('--start', default=START_DATE, help="Simulate only from this date on (YYYY-MM-DD).")
+    parser.add_argument('--end', default=END_DATE, help="Simulate only up to this date (YYYY-MM-DD).")
+    parser.add_argument('--rank-by', choices=metrics.RANK_METRICS, default=RANK_METRIC, help=f"Ratio the optimal strategy is chosen by (default: {RANK_METRIC}).")
+    parser.add_argument('--robustness', type=int, default=ROBUSTNESS_PATHS, metavar='N', help="Block-bootstrap the optimal strategy N times and report confidence intervals (e.g. --robustness 10000).")
+    parser.add_argument('--sizing', choices=position_sizing.MODELS, default=SIZING_MODEL, help=f"Position-sizing model of the entries (default: {SIZING_MODEL}).")
+    parser.add_argument('--sizing-fraction', type=float, default=SIZING_FRACTION, help=f"FIXED_FRACTIONAL share of equity per position (default: {SIZING_FRACTION}).")
+    parser.add_argument('--target-vol', type=float, default=SIZING_TARGET_VOL, help=f"VOL_TARGET annualized portfolio volatility (default: {SIZING_TARGET_VOL}).")
+    parser.add_argument('--cash-rate-file', default=CASH_RATE_FILE, help="CSV of date,annual rate rows replacing the constant cash return.")
+    args = parser.parse_args()
+    configure(args.data_dir, args.reports_dir, args.ma_period, args.stop_loss_mode, args.sizing, args.sizing_fraction, args.target_vol)
+    with instrumentation.profiled(os.path.join(REPORTS_DIR, 'profiles', 'portfolio.prof') if args.profile else None):
+        main(incremental=args.incremental, walk_forward_mode=args.walk_forward, workers=args.workers, ma_periods=args.ma_periods, use_store=not args.no_store,
+             rebalance=args.rebalance, instrument=args.instrument, low_memory=args.low_memory, memmap_dir=args.memmap, start=args.start, end=args.end,
+             robustness_paths=args.robustness, rank_by=args.rank_by, cash_rate_file=args.cash_rate_file)
\ No newline at end of file
@@ -0,0 +1,407 @@
+import hashlib
+import numpy as np
+import metrics
+import position_sizing
+from backtest_engine import CHECKPOINT_VERSION, STOP_MODE_CODES, TRADING_DAYS_PER_YEAR, bars_per_year, compile_kernel, select_kernel
+
+# Field axis of the (bars x tickers x fields) panel array.
+F_OPEN, F_HIGH, F_LOW, F_CLOSE, F_SMA, F_PREV_YEAR_LOW = range(6)
+
+def crossover_signal(close, sma):
+    """Entry signal on bar i: close crossed above the SMA between bars i-2 and i-1. Bars run along axis 0; sma may
+    carry an extra trailing axis (one column per MA period) when close is broadcast against it."""
+    signal = np.zeros(np.broadcast_shapes(close.shape, sma.shape), dtype=np.bool_)
+    signal[2:] = (close[:-2] <= sma[:-2]) & (close[1:-1] > sma[1:-1])
+    return signal
+
+def prepare_panel(df, ma_period, sizing=None):
+    """Converts the MultiIndex-column frame from prepare_all_data into one dense (bars x tickers x fields) float64
+    array, so each bar's prices for the whole universe are a single contiguous (tickers x fields) slice. 'weight'
+    holds the (bars x tickers) entry weights of the position_sizing spec `sizing` (default: 1/N each), 'sizing' the spec."""
+    tickers = list(df.columns.levels[0])
+    columns = ['Open', 'High', 'Low', 'Close', f'SMA_{ma_period}', 'PrevYearLow']
+    values = np.empty((len(df), len(tickers), len(columns)))
+    for t, ticker in enumerate(tickers):
+        for f, col in enumerate(columns): values[:, t, f] = df[(ticker, col)].to_numpy(dtype=np.float64)
+    weight = position_sizing.entry_weights(sizing, values[:, :, F_HIGH], values[:, :, F_LOW], values[:, :, F_CLOSE], bars_per_year(df.index), len(tickers))
+    return {'index': df.index, 'tickers': tickers, 'values': values, 'signal': crossover_signal(values[:, :, F_CLOSE], values[:, :, F_SMA]),
+            'weight': weight, 'sizing': sizing or position_sizing.EQUAL}
+
+def prepare_sweep_panel(df, ma_periods, sizing=None):
+    """prepare_panel for several MA periods at once: 'signal' becomes a (bars x tickers x periods) boolean array whose
+    last axis follows ma_periods, precomputed once so the sweep kernel only indexes into it."""
+    p = prepare_panel(df, ma_periods[0], sizing)
+    close = p['values'][:, :, F_CLOSE][:, :, None]
+    sma = np.stack([np.column_stack([df[(ticker, f'SMA_{m}')].to_numpy(dtype=np.float64) for ticker in p['tickers']]) for m in ma_periods], axis=2)
+    p['signal'] = crossover_signal(close, sma)
+    return p
+
+def slice_panel(p, start, stop):
+    """Bars start..stop-1 of a prepare_panel dict, as views; indicator and signal values come from the full history."""
+    return {'index': p['index'][start:stop], 'tickers': p['tickers'], 'values': p['values'][start:stop], 'signal': p['signal'][start:stop],
+            'weight': p['weight'][start:stop], 'sizing': p['sizing']}
+
+def daily_rate(annual_cash_return, bars_per_year=TRADING_DAYS_PER_YEAR):
+    """Cash return per bar; per trading day for daily bars."""
+    return (1 + annual_cash_return)**(1/bars_per_year) - 1
+
+def cash_rates(index, annual_cash_return, bars_per_year=TRADING_DAYS_PER_YEAR):
+    """Cash return of every bar of `index`. annual_cash_return is a constant or a pandas Series of annual rates by
+    date, each in force from its date until the next; bars before the first date take the first rate."""
+    if np.ndim(annual_cash_return) == 0: annual = np.full(len(index), float(annual_cash_return))
+    else:
+        in_force = np.searchsorted(annual_cash_return.index.values, index.values, side='right') - 1
+        annual = annual_cash_return.to_numpy(dtype=np.float64)[np.maximum(in_force, 0)]
+    return daily_rate(annual, bars_per_year)
+
+def cash_accrual(index, annual_cash_return, bars_per_year=TRADING_DAYS_PER_YEAR):
+    """Growth of idle cash from bar 0 to every bar, as one cumulative product: cash held from bar j to bar i grows by
+    accrual[i] / accrual[j]. The engines keep cash in units of this index, so it is never compounded bar by bar."""
+    growth = 1 + cash_rates(index, annual_cash_return, bars_per_year)
+    growth[0] = 1.0
+    return np.cumprod(growth)
+
+def cash_rate_key(annual_cash_return):
+    """annual_cash_return as checkpoint configs and results-store keys record it: a constant as is, a rate series by a digest of its dates and rates."""
+    if np.ndim(annual_cash_return) == 0: return annual_cash_return
+    digest = hashlib.sha1(annual_cash_return.index.asi8.tobytes() + annual_cash_return.to_numpy(dtype=np.float64).tobytes())
+    return f"series:{digest.hexdigest()}"
+
+def performance_summary(name, final_equity, stats, initial_capital, num_days, bars_per_year=TRADING_DAYS_PER_YEAR):
+    """Metrics row in the calculate_performance_metrics layout, from a final equity and the curve's
+    metrics.summarize_sums statistics. num_days counts bars, bars_per_year of which make a year."""
+    final_pnl = final_equity - initial_capital
+    cagr = metrics.cagr_pct(final_equity, initial_capital, num_days, bars_per_year)
+    max_drawdown = stats['max_drawdown']
+    return { "Name": name, "Final Value": final_equity, "P&L": final_pnl, "CAGR": cagr, "Max Drawdown": max_drawdown, "Calmar": metrics.calmar(cagr, max_drawdown),
+             "Sharpe": stats['sharpe'], "Sortino": stats['sortino'], "Ulcer Index": stats['ulcer'], "Max DD Duration": int(stats['max_dd_bars']), "Exposure": stats['exposure'] }
+
+def strategy_name(stop_level_pct, pt_pct):
+    return f"Active Strategy (SL:{stop_level_pct or 'Struct'}, PT:{pt_pct or 'None'})"
+
+def new_grid_state(num_combos, num_assets, initial_capital):
+    """Start-of-data state of the portfolio grid kernel: cash (in units of the cash_accrual index), running equity stats (the metrics.curve_sums fields under
+    their own names) and the summed returns of closed trades per combination, plus the per-ticker position arrays
+    (shares, entry, peak, static stop) of every combination."""
+    return {'cash': np.full(num_combos, float(initial_capital)), 'shares': np.zeros((num_combos, num_assets)),
+            'entry': np.zeros((num_combos, num_assets)), 'peak': np.zeros((num_combos, num_assets)), 'static': np.zeros((num_combos, num_assets)),
+            'eq_peak': np.full(num_combos, -np.inf), 'min_dd': np.zeros(num_combos), 'last_eq': np.zeros(num_combos),
+            'dd_bars': np.zeros(num_combos), 'max_dd_bars': np.zeros(num_combos), 'dd_sq': np.zeros(num_combos), 'ret_sum': np.zeros(num_combos),
+            'ret_sq': np.zeros(num_combos), 'down_sq': np.zeros(num_combos), 'exposure': np.zeros(num_combos), 'trade_ret_sum': np.zeros(num_combos),
+            'trades': np.zeros(num_combos, dtype=np.int64)}
+
+def trade_return(entry_price, exit_price, commission_pct):
+    """Net return of a portfolio trade, with commission paid on top of the entry and out of the exit."""
+    return exit_price * (1 - commission_pct) / (entry_price * (1 + commission_pct)) - 1
+
+def average_trade_pct(total_trade_return, trades, shares, entry, last_close, commission_pct):
+    """Mean net return (%) per trade of each combination: closed trades from their summed returns, positions still
+    open marked at the last close without an exit commission, like a single-asset End of Data exit. The position
+    arrays are (combos x tickers); a combination without trades gets 0."""
+    held = shares > 0
+    open_returns = np.where(held, last_close / np.where(held, entry, 1.0) / (1 + commission_pct) - 1, 0.0).sum(axis=-1)
+    return np.divide((total_trade_return + open_returns) * 100, trades, out=np.zeros(np.shape(trades)), where=np.asarray(trades) > 0)
+
+def _state_average_trade(state, values, commission_pct):
+    return average_trade_pct(state['trade_ret_sum'], state['trades'], state['shares'], state['entry'], values[-1, :, F_CLOSE], commission_pct)
+
+def signal_events(signal):
+    """Crossover events of a (bars x tickers x rows) signal array in compressed form: the tickers signalling on bar i
+    for signal row r are events[ptr[r, i]:ptr[r, i + 1]], in ascending ticker order."""
+    n, num_assets, rows = signal.shape
+    ptr = np.empty((rows, n + 1), dtype=np.int64); events = []; offset = 0
+    for r in range(rows):
+        flat = np.flatnonzero(signal[:, :, r])  # bar-major positions, so each bar's tickers come out sorted
+        ptr[r] = offset + np.searchsorted(flat, np.arange(n + 1) * num_assets)
+        events.append(flat % num_assets); offset += len(flat)
+    return ptr, np.concatenate(events)
+
+def _held_lists(shares):
+    """(combos x tickers) ascending list of each combination's open positions, and its length, from the shares array."""
+    held = np.zeros(shares.shape, dtype=np.int64); num_held = np.zeros(len(shares), dtype=np.int64)
+    for c in range(len(shares)):
+        idx = np.flatnonzero(shares[c] > 0); held[c, :len(idx)] = idx; num_held[c] = len(idx)
+    return held, num_held
+
+def _portfolio_event_kernel(open_, high, low, close, signal_ptr, signal_events, signal_rows, prev_year_low, weight, mode, stop_levels, profit_targets, commission_pct, accrual,
+                            cash, shares, entry, peak, static, eq_peak, min_dd, last_eq, dd_bars, max_dd_bars, dd_sq, ret_sum, ret_sq, down_sq, exposure, trade_ret_sum,
+                            trades, held, num_held, start, equity_out, cash_out):
+    """Advances every (stop level, profit target) combination of the shared-capital portfolio over bars start..n-1,
+    updating the state arrays in place. Combination c enters on the crossover events of signal row signal_rows[c].
+    Each bar only touches the combination's open positions (held[c, :num_held[c]], kept in ascending ticker order)
+    and that bar's events, never the idle tickers, so its cost follows activity rather than universe size. Per-combination
+    logic, including the ticker order in which exits are booked and entries funded, mirrors run_active_strategy_reference.
+    An entry on ticker t is sized to weight[i, t] of equity. Cash is kept in units of the accrual index (cash_accrual)
+    and only converted on bars where it is spent or received, instead of being compounded on every bar.
+    The running sums of metrics.curve_sums are kept per combination along with the equity peak and drawdown.
+    When equity_out is non-empty, combination 0's equity and cash are recorded into equity_out and cash_out."""
+    n, num_assets = close.shape; num_combos = len(stop_levels)
+    new = np.empty(num_assets, dtype=np.int64)
+    for i in range(start, n):
+        for c in range(num_combos):
+            cash_now = cash[c] * accrual[i]
+            if i > 1:
+                kept = 0; k_before = num_held[c]
+                for k in range(num_held[c]):
+                    t = held[c, k]
+                    exit_price = -1.0
+                    if mode == 1:
+                        if high[i, t] > peak[c, t]: peak[c, t] = high[i, t]
+                        stop_price = peak[c, t] * (1 - stop_levels[c] / 100)
+                        if low[i, t] <= stop_price: exit_price = stop_price
+                    elif mode == 2 or mode == 3:
+                        if low[i, t] <= static[c, t]: exit_price = static[c, t]
+                    if exit_price == -1.0 and not np.isnan(profit_targets[c]):
+                        profit_target_price = entry[c, t] * (1 + profit_targets[c] / 100)
+                        if high[i, t] >= profit_target_price: exit_price = profit_target_price
+                    if exit_price != -1.0:
+                        cash_now += (shares[c, t] * exit_price) * (1 - commission_pct)
+                        trade_ret_sum[c] += exit_price * (1 - commission_pct) / (entry[c, t] * (1 + commission_pct)) - 1
+                        shares[c, t] = 0.0; entry[c, t] = 0.0; peak[c, t] = 0.0; static[c, t] = 0.0
+                    else:
+                        if kept != k: held[c, kept] = t
+                        kept += 1
+                num_held[c] = kept
+                invested_capital = 0.0
+                for k in range(kept):
+                    t = held[c, k]; invested_capital += shares[c, t] * close[i, t]
+                current_equity = cash_now + invested_capital
+                r = signal_rows[c]; num_new = 0
+                for e in range(signal_ptr[r, i], signal_ptr[r, i + 1]):
+                    t = signal_events[e]
+                    if shares[c, t] == 0:
+                        position_size_dollars = min(current_equity * weight[i, t], cash_now)
+                        if position_size_dollars > 1 and open_[i, t] > 0:
+                            entry_price = open_[i, t]
+                            num_shares = position_size_dollars / entry_price
+                            cash_now -= (num_shares * entry_price) * (1 + commission_pct)
+                            if mode == 2: static[c, t] = entry_price * (1 - stop_levels[c] / 100)
+                            elif mode == 3: static[c, t] = prev_year_low[i, t]
+                            else: static[c, t] = 0.0
+                            shares[c, t] = num_shares; entry[c, t] = entry_price; peak[c, t] = entry_price
+                            trades[c] += 1
+                            new[num_new] = t; num_new += 1
+                if num_new > 0:  # merge the new tickers into the sorted held list, from the back
+                    a = kept - 1; b = num_new - 1; w = kept + num_new - 1
+                    while b >= 0:
+                        if a >= 0 and held[c, a] > new[b]:
+                            held[c, w] = held[c, a]; a -= 1
+                        else:
+                            held[c, w] = new[b]; b -= 1
+                        w -= 1
+                    num_held[c] = kept + num_new
+                if kept < k_before or num_new > 0: cash[c] = cash_now / accrual[i]
+            invested_capital = 0.0
+            for k in range(num_held[c]):
+                t = held[c, k]; invested_capital += shares[c, t] * close[i, t]
+            equity = cash_now + invested_capital
+            if i > 0:
+                ret = equity / last_eq[c] - 1
+                ret_sum[c] += ret; ret_sq[c] += ret * ret
+                if ret < 0: down_sq[c] += ret * ret
+            last_eq[c] = equity
+            if equity > eq_peak[c]: eq_peak[c] = equity
+            drawdown = (equity - eq_peak[c]) / eq_peak[c]
+            if drawdown < min_dd[c]: min_dd[c] = drawdown
+            if drawdown < 0:
+                dd_bars[c] += 1
+                if dd_bars[c] > max_dd_bars[c]: max_dd_bars[c] = dd_bars[c]
+            else: dd_bars[c] = 0.0
+            dd_sq[c] += (drawdown * 100) ** 2
+            exposure[c] += invested_capital / equity
+            if c == 0 and len(equity_out) > 0: equity_out[i] = equity; cash_out[i] = cash_now
+
+_compiled_portfolio_event_kernel = compile_kernel(_portfolio_event_kernel)
+
+def _run_kernel(p, stop_loss_mode, combos, signal_rows, commission_pct, annual_cash_return, state, start, equity_out=None, cash_out=None):
+    v = p['values']
+    signal = p['signal'] if p['signal'].ndim == 3 else p['signal'][:, :, None]
+    ptr, events = signal_events(signal)
+    held, num_held = _held_lists(state['shares'])
+    stop_levels = np.array([float(sl or 0) for sl, _ in combos])
+    profit_targets = np.array([np.nan if pt is None else float(pt) for _, pt in combos])
+    kernel = select_kernel(_compiled_portfolio_event_kernel, _portfolio_event_kernel)
+    kernel(v[:, :, F_OPEN], v[:, :, F_HIGH], v[:, :, F_LOW], v[:, :, F_CLOSE], ptr, events, signal_rows, v[:, :, F_PREV_YEAR_LOW], p['weight'],
+           STOP_MODE_CODES.get(stop_loss_mode, 0), stop_levels, profit_targets, float(commission_pct), cash_accrual(p['index'], annual_cash_return, bars_per_year(p['index'])),
+           state['cash'], state['shares'], state['entry'], state['peak'], state['static'],
+           state['eq_peak'], state['min_dd'], state['last_eq'], state['dd_bars'], state['max_dd_bars'], state['dd_sq'], state['ret_sum'], state['ret_sq'],
+           state['down_sq'], state['exposure'], state['trade_ret_sum'], state['trades'], held, num_held, start,
+           np.zeros(0) if equity_out is None else equity_out, np.zeros(0) if cash_out is None else cash_out)
+
+def _resume_start(checkpoint, config, p):
+    """Bar to resume from when `checkpoint` was produced by the same configuration on a prefix of this panel, else None."""
+    if checkpoint is None or checkpoint['config'] != config: return None
+    n = checkpoint['num_bars']
+    if n < 1 or len(p['values']) < n or p['index'][n - 1] != checkpoint['last_date']: return None
+    if not np.allclose(p['values'][n - 1], checkpoint['last_bar'], rtol=1e-12, atol=0, equal_nan=True): return None
+    return n
+
+def run_active_strategy_grid(df, stop_loss_mode, combos, initial_capital, ma_period, annual_cash_return, commission_pct, panel=None, checkpoint=None, return_checkpoint=False, signal_rows=None):
+    """Simulates every (stop_level_pct, pt_pct) pair in `combos` in a single traversal of the portfolio data.
+    Returns the run_active_strategy metrics dict for each combination, in the order given.
+
+    With return_checkpoint=True, also returns the end-of-data state (cash, positions, equity peak and drawdown).
+    Passing it back as `checkpoint` resumes from it and simulates only the bars appended since; a checkpoint from
+    a different configuration or universe, or a history that no longer matches, is ignored and the full grid is rerun.
+
+    With a sweep panel from prepare_sweep_panel, signal_rows gives the MA column each combination trades on."""
+    p = panel if panel is not None else prepare_panel(df, ma_period)
+    signal_rows = np.zeros(len(combos), dtype=np.int64) if signal_rows is None else np.asarray(signal_rows, dtype=np.int64)
+    config = {'mode': stop_loss_mode, 'combos': list(combos), 'initial_capital': initial_capital, 'ma_period': ma_period,
+              'annual_cash_return': cash_rate_key(annual_cash_return), 'commission_pct': commission_pct, 'tickers': list(p['tickers']), 'signal_rows': signal_rows.tolist(),
+              'sizing': p['sizing'], 'version': CHECKPOINT_VERSION}
+    v = p['values']
+    start = _resume_start(checkpoint, config, p)
+    if start is None: start = 0; state = new_grid_state(len(combos), len(p['tickers']), initial_capital)
+    else: state = {k: x.copy() for k, x in checkpoint['state'].items()}
+    _run_kernel(p, stop_loss_mode, combos, signal_rows, commission_pct, annual_cash_return, state, start)
+    results = []; year_bars = bars_per_year(p['index'])
+    stats = metrics.summarize_sums(state, len(v), year_bars)
+    avg_trade = _state_average_trade(state, v, commission_pct)
+    for c, (sl_pct, pt_pct) in enumerate(combos):
+        summary = performance_summary(strategy_name(sl_pct, pt_pct), state['last_eq'][c], {k: x[c] for k, x in stats.items()}, initial_capital, len(v), year_bars)
+        summary["Total Trades"] = int(state['trades'][c]); summary["Avg Trade"] = avg_trade[c]
+        results.append(summary)
+    if not return_checkpoint: return results
+    new_checkpoint = {'config': config, 'num_bars': len(v), 'last_date': p['index'][-1], 'last_bar': v[-1].copy(),
+                      'state': state, 'resumed_from': start if start > 0 else None}
+    return results, new_checkpoint
+
+def run_active_strategy(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return, commission_pct, panel=None):
+    """Single-combination portfolio simulation that also records the equity and cash curves. With numba it runs on the
+    event-driven grid kernel, so its metrics are exactly the grid's; without, on whole-row NumPy operations per bar
+    (_run_active_strategy_numpy), which the interpreted kernel cannot match.
+    Returns (metrics, equity_curve, cash_curve) like run_active_strategy in portfolio_backtester_v2."""
+    p = panel if panel is not None else prepare_panel(df, ma_period)
+    if select_kernel(_compiled_portfolio_event_kernel, None) is None:
+        return _run_active_strategy_numpy(p, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, annual_cash_return, commission_pct)
+    n = len(p['values'])
+    state = new_grid_state(1, len(p['tickers']), initial_capital)
+    equity_curve = np.empty(n); cash_curve = np.empty(n)
+    _run_kernel(p, stop_loss_mode, [(stop_level_pct, pt_pct)], np.zeros(1, dtype=np.int64), commission_pct, annual_cash_return, state, 0, equity_curve, cash_curve)
+    stats = metrics.summarize_sums(state, n, bars_per_year(p['index']))
+    summary = performance_summary(strategy_name(stop_level_pct, pt_pct), state['last_eq'][0], {k: x[0] for k, x in stats.items()}, initial_capital, n, bars_per_year(p['index']))
+    summary["Total Trades"] = int(state['trades'][0]); summary["Avg Trade"] = _state_average_trade(state, p['values'], commission_pct)[0]
+    return summary, equity_curve.tolist(), cash_curve.tolist()
+
+def _run_active_strategy_numpy(p, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, annual_cash_return, commission_pct):
+    """run_active_strategy without numba. Positions are parallel per-ticker arrays and the stop, profit-target and
+    entry checks run across all tickers at once on each bar: interpreted, whole-row array operations beat visiting
+    only the active tickers. Matches the kernel to within rounding."""
+    values, signal, weight = p['values'], p['signal'], p['weight']
+    n, num_assets, _ = values.shape
+    year_bars = bars_per_year(p['index'])
+    bar_cash_rate = cash_rates(p['index'], annual_cash_return, year_bars)
+    sl_frac = (stop_level_pct or 0) / 100
+    cash = float(initial_capital)
+    shares = np.zeros(num_assets); entry = np.zeros(num_assets); peak = np.zeros(num_assets); static = np.zeros(num_assets)
+    equity_curve = np.empty(n); cash_curve = np.empty(n); total_trades = 0; total_trade_return = 0.0
+    for i in range(n):
+        bar = values[i]
+        if i > 0: cash *= (1 + bar_cash_rate[i])
+        if i > 1:
+            held = shares > 0
+            if held.any():
+                exit_price = np.full(num_assets, -1.0)
+                if stop_loss_mode == 'TRAILING':
+                    np.maximum(peak, bar[:, F_HIGH], out=peak, where=held)
+                    stop_price = peak * (1 - sl_frac)
+                    hit = held & (bar[:, F_LOW] <= stop_price)
+                    exit_price[hit] = stop_price[hit]
+                elif stop_loss_mode in ['FIXED', 'PREVIOUS_YEAR_LOW']:
+                    hit = held & (bar[:, F_LOW] <= static)
+                    exit_price[hit] = static[hit]
+                if pt_pct is not None:
+                    profit_target_price = entry * (1 + pt_pct / 100)
+                    hit = held & (exit_price == -1) & (bar[:, F_HIGH] >= profit_target_price)
+                    exit_price[hit] = profit_target_price[hit]
+                exits = held & (exit_price != -1)
+                if exits.any():
+                    cash += np.sum(shares[exits] * exit_price[exits]) * (1 - commission_pct)
+                    total_trade_return += np.sum(trade_return(entry[exits], exit_price[exits], commission_pct))
+                    shares[exits] = 0; entry[exits] = 0; peak[exits] = 0; static[exits] = 0
+            current_equity = cash + shares @ bar[:, F_CLOSE]
+            candidates = np.flatnonzero((shares == 0) & signal[i] & (bar[:, F_OPEN] > 0))
+            if len(candidates):
+                # Entries are funded in ticker order: full allocations while cash lasts, then one partial fill.
+                allocations = current_equity * weight[i, candidates]
+                spent = np.where(allocations > 1, allocations, 0) * (1 + commission_pct)
+                cash_before = cash - (np.cumsum(spent) - spent)
+                sizes = np.minimum(allocations, cash_before)
+                take = sizes > 1
+                if take.any():
+                    idx = candidates[take]; entry_price = bar[idx, F_OPEN]
+                    shares[idx] = sizes[take] / entry_price
+                    cash -= np.sum(shares[idx] * entry_price) * (1 + commission_pct)
+                    entry[idx] = entry_price; peak[idx] = entry_price
+                    if stop_loss_mode == 'FIXED': static[idx] = entry_price * (1 - sl_frac)
+                    elif stop_loss_mode == 'PREVIOUS_YEAR_LOW': static[idx] = bar[idx, F_PREV_YEAR_LOW]
+                    else: static[idx] = 0
+                    total_trades += len(idx)
+        equity_curve[i] = cash + shares @ bar[:, F_CLOSE]
+        cash_curve[i] = cash
+    stats = metrics.curve_stats(equity_curve, year_bars, invested=equity_curve - cash_curve)
+    summary = performance_summary(strategy_name(stop_level_pct, pt_pct), equity_curve[-1], stats, initial_capital, n, year_bars)
+    summary["Total Trades"] = total_trades
+    summary["Avg Trade"] = float(average_trade_pct(total_trade_return, total_trades, shares, entry, values[-1, :, F_CLOSE], commission_pct))
+    return summary, equity_curve.tolist(), cash_curve.tolist()
+
+def run_active_strategy_sweep(df, stop_loss_mode, ma_periods, combos, initial_capital, annual_cash_return, commission_pct, panel=None, checkpoint=None, return_checkpoint=False):
+    """Simulates the full MA x SL x PT surface of the portfolio in one traversal, indexing a precomputed
+    (bars x tickers x periods) crossover-signal array. Results come back MA-major, each led by an "MA Period" entry.
+    checkpoint/return_checkpoint resume and save the surface as in run_active_strategy_grid."""
+    p = panel if panel is not None else prepare_sweep_panel(df, ma_periods)
+    sweep_combos = [combo for _ in ma_periods for combo in combos]
+    signal_rows = [j for j in range(len(ma_periods)) for _ in combos]
+    output = run_active_strategy_grid(df, stop_loss_mode, sweep_combos, initial_capital, tuple(ma_periods), annual_cash_return, commission_pct, panel=p,
+                                      checkpoint=checkpoint, return_checkpoint=return_checkpoint, signal_rows=signal_rows)
+    results = [dict({"MA Period": ma_periods[row]}, **metrics) for metrics, row in zip(output[0] if return_checkpoint else output, signal_rows)]
+    return (results, output[1]) if return_checkpoint else results
+
+REBALANCE_PERIOD_KEYS = {'ANNUAL': lambda idx: idx.year, 'QUARTERLY': lambda idx: idx.year * 4 + idx.quarter, 'MONTHLY': lambda idx: idx.year * 12 + idx.month}
+
+def close_matrix(df):
+    """(bars x tickers) Close prices of the prepare_all_data frame, in the ticker order of prepare_panel."""
+    return np.column_stack([df[(ticker, 'Close')].to_numpy(dtype=np.float64) for ticker in df.columns.levels[0]])
+
+def buy_and_forget_equity(close, initial_capital):
+    """Equal-weight purchase on the first bar, held untouched: one (bars x tickers) @ shares product.
+    Tickers without a positive first price are left out, as in the per-bar loop."""
+    held = close[0] > 0
+    shares = initial_capital / close.shape[1] / close[0, held]
+    return close[:, held] @ shares
+
+def _drift_breach(close, shares, start, threshold, chunk=256):
+    """First bar after `start` on which some holding's weight is off its 1/N target by more than `threshold`
+    (relative), or None. Scans forward in blocks so a long quiet stretch costs a few matrix ops."""
+    target = 1.0 / close.shape[1]
+    for lo in range(start + 1, len(close), chunk):
+        holdings = close[lo:lo + chunk] * shares
+        weights = holdings / holdings.sum(axis=1)[:, None]
+        breached = np.flatnonzero((np.abs(weights / target - 1) > threshold).any(axis=1))
+        if len(breached): return lo + breached[0]
+    return None
+
+def rebalanced_equity(close, index, initial_capital, frequency='ANNUAL', drift_threshold=0.25):
+    """Equal-weight portfolio reset to 1/N at each rebalance bar's close, computed one holding period at a time:
+    within a period the shares are fixed, so its equity is a single (bars x tickers) @ shares product.
+    frequency is 'ANNUAL', 'QUARTERLY' or 'MONTHLY' (first bar of each calendar period) or 'DRIFT' (any weight
+    off target by more than drift_threshold, relative). Returns (equity curve, number of rebalances)."""
+    n, num_assets = close.shape
+    equity = np.empty(n); equity[0] = initial_capital
+    shares = np.zeros(num_assets); value = float(initial_capital); r = 0; rebalances = 0
+    if frequency != 'DRIFT':
+        keys = np.asarray(REBALANCE_PERIOD_KEYS[frequency](index))
+        calendar_bars = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    k = 0
+    while r is not None:
+        price = close[r]
+        shares = np.where(price > 0, value / num_assets / np.where(price > 0, price, 1.0), shares)  # a ticker without a price keeps its old position
+        rebalances += 1
+        if frequency == 'DRIFT': nxt = _drift_breach(close, shares, r, drift_threshold)
+        else: k += 1; nxt = calendar_bars[k] if k < len(calendar_bars) else None
+        stop = n if nxt is None else nxt + 1
+        equity[r + 1:stop] = close[r + 1:stop] @ shares  # the rebalance bar itself is marked with the old shares
+        if nxt is not None: value = equity[nxt]
+        r = nxt
+    return equity, rebalances
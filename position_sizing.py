@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+# --- Sizing Configuration ---
+MODELS = ('EQUAL', 'FIXED_FRACTIONAL', 'VOL_TARGET')
+VOL_MEASURES = ('STD', 'ATR')
+FRACTION = 0.10  # FIXED_FRACTIONAL: share of equity put into each new position
+TARGET_VOL = 0.15  # VOL_TARGET: annualized volatility a position is scaled to; a portfolio splits it over its N assets
+VOL_WINDOW = 20  # VOL_TARGET: bars in the rolling volatility estimate
+VOL_MEASURE = 'STD'  # VOL_TARGET: 'STD' (standard deviation of close-to-close returns) or 'ATR' (average true range over the close)
+MAX_WEIGHT = 1.0  # No position is sized above this share of equity, so sizing never borrows
+
+def spec(model='EQUAL', fraction=FRACTION, target_vol=TARGET_VOL, window=VOL_WINDOW, measure=VOL_MEASURE, max_weight=MAX_WEIGHT):
+    """A sizing model with the parameters it uses, as the plain dict the engines take and checkpoints compare.
+    'EQUAL' puts 1/N of equity into each position (all of it for a single asset), 'FIXED_FRACTIONAL' a fixed share
+    and 'VOL_TARGET' the share that gives the position target_vol, from the volatility up to the bar before entry."""
+    if model not in MODELS: raise ValueError(f"Unknown sizing model {model!r}, expected one of {MODELS}")
+    if measure not in VOL_MEASURES: raise ValueError(f"Unknown volatility measure {measure!r}, expected one of {VOL_MEASURES}")
+    if model == 'EQUAL': return {'model': model}
+    if model == 'FIXED_FRACTIONAL': return {'model': model, 'fraction': fraction, 'max_weight': max_weight}
+    return {'model': model, 'target_vol': target_vol, 'window': window, 'measure': measure, 'max_weight': max_weight}
+
+EQUAL = spec('EQUAL')
+
+def describe(sizing):
+    """One-line description of a spec for the reports."""
+    sizing = sizing or EQUAL
+    if sizing['model'] == 'EQUAL': return "Equal weight"
+    if sizing['model'] == 'FIXED_FRACTIONAL': return f"Fixed fractional ({sizing['fraction'] * 100:g}% of equity per position)"
+    return f"Volatility target ({sizing['target_vol'] * 100:g}% annualized, {sizing['window']}-bar {sizing['measure']})"
+
+def volatility(high, low, close, window=VOL_WINDOW, measure=VOL_MEASURE):
+    """Rolling per-bar volatility over the `window` bars up to and including each bar, for one series or the columns
+    of a (bars x tickers) array: the standard deviation of close-to-close returns ('STD') or the average true range
+    as a fraction of the close ('ATR'). NaN until a full window exists."""
+    close_values = np.asarray(close, dtype=np.float64)
+    close = pd.DataFrame(close_values.reshape(len(close_values), -1))
+    prev_close = close.shift(1)
+    if measure == 'STD': vol = (close / prev_close - 1).rolling(window, min_periods=window).std()
+    else:
+        high = pd.DataFrame(np.asarray(high, dtype=np.float64).reshape(close.shape)); low = pd.DataFrame(np.asarray(low, dtype=np.float64).reshape(close.shape))
+        true_range = np.maximum(high - low, np.maximum((high - prev_close).abs(), (low - prev_close).abs()))
+        vol = true_range.rolling(window, min_periods=window).mean() / close
+    return vol.to_numpy().reshape(close_values.shape)
+
+def entry_weights(sizing, high, low, close, bars_per_year, num_assets=1):
+    """Share of equity a position entered on each bar is sized to, shaped like close (one series, or bars x tickers
+    for a portfolio of num_assets). Built once per ticker and shared by every combination of a grid or sweep, so
+    the kernels only read weight[i] at an entry. An entry fills at its bar's open, so VOL_TARGET sizes it on the
+    volatility known at the previous close; bars without a full volatility window get 0, which skips the entry."""
+    sizing = sizing or EQUAL
+    shape = np.shape(close)
+    if sizing['model'] == 'EQUAL': return np.full(shape, 1.0 / num_assets)
+    if sizing['model'] == 'FIXED_FRACTIONAL': return np.full(shape, min(sizing['fraction'], sizing['max_weight']))
+    annual_vol = volatility(high, low, close, sizing['window'], sizing['measure']) * np.sqrt(bars_per_year)
+    weight = np.zeros(shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight[1:] = np.minimum(sizing['target_vol'] / (num_assets * annual_vol[:-1]), sizing['max_weight'])
+    return np.nan_to_num(weight, nan=0.0)
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import numpy as np
+import pandas as pd
+import backtest_engine
+import portfolio_engine
+import instrumentation
+
+# --- Results Store Configuration ---
+STORE_ENABLED = True
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'results.sqlite')  # Next to the scripts, whatever the working directory
+CURVE_CAP_BYTES = 512 * 1024 * 1024  # Per-bar series (equity/cash curves, trailing stops) beyond this are evicted least-recently-used first
+STORE_FORMAT_VERSION = 5  # Bump whenever an engine change alters results, so stale entries stop matching
+HASH_BLOCK_BYTES = 64 * 1024 * 1024  # Panel values are hashed this many bytes of bars at a time, so a memory-mapped panel is never read in whole
+
+def _hash_array(digest, values):
+    # hashlib reads the array's buffer in place; only a non-contiguous slice is copied.
+    values = np.ascontiguousarray(np.asarray(values))
+    digest.update(str((values.dtype.str, values.shape)).encode()); digest.update(values)
+
+def data_fingerprint(*arrays):
+    """SHA-1 over the raw bytes of the arrays a simulation reads (prices, indicators, dates)."""
+    digest = hashlib.sha1()
+    for values in arrays: _hash_array(digest, values)
+    return digest.hexdigest()
+
+def arrays_fingerprint(a, ma_column=None):
+    """Fingerprint of a prepare_arrays dict, or of one MA column of a prepare_sweep_arrays dict. The entry weights
+    stand in for the sizing model that produced them."""
+    sma = a['sma'] if ma_column is None else a['sma'][:, ma_column]
+    return data_fingerprint(a['index'].asi8, a['open'], a['high'], a['low'], a['close'], sma, a['prev_year_low'], a['weight'])
+
+def panel_fingerprint(p, ma_column=None):
+    """Fingerprint of a prepare_panel dict, or of one MA column of a prepare_sweep_panel dict. The SMA field of the
+    values array is left out since the engines only read it through the crossover signals, which are included.
+    The values are fed to the hash a block of bars at a time, so only one block is ever copied, and the digest is
+    that of data_fingerprint over the whole SMA-less array."""
+    digest = hashlib.sha1()
+    _hash_array(digest, p['index'].asi8); _hash_array(digest, np.asarray(p['tickers']))
+    values = p['values']; num_bars, num_assets, num_fields = values.shape
+    digest.update(str((values.dtype.str, (num_bars, num_assets, num_fields - 1))).encode())
+    block_bars = max(1, HASH_BLOCK_BYTES // max(1, values[:1].nbytes))
+    for i in range(0, num_bars, block_bars):
+        block = values[i:i + block_bars]
+        digest.update(np.concatenate([block[:, :, :portfolio_engine.F_SMA], block[:, :, portfolio_engine.F_SMA + 1:]], axis=2))
+    _hash_array(digest, p['signal'] if ma_column is None else p['signal'][:, :, ma_column]); _hash_array(digest, p['weight'])
+    return digest.hexdigest()
+
+def _json_value(v):
+    return v.item() if isinstance(v, np.generic) else str(v)
+
+def result_key(kind, fingerprint, params):
+    payload = json.dumps({'version': STORE_FORMAT_VERSION, 'kind': kind, 'data': fingerprint, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+class ResultsStore:
+    """SQLite-backed memo of simulation results, keyed by a hash of the input data and the full parameter set.
+    Metrics rows and trade logs are kept indefinitely; the bulky per-bar series live in a separate table that is
+    capped at CURVE_CAP_BYTES with least-recently-used eviction."""
+    def __init__(self, path=STORE_PATH, curve_cap_bytes=CURVE_CAP_BYTES):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.curve_cap_bytes = curve_cap_bytes
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')  # lets process-pool workers read while another one writes
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, kind TEXT, fingerprint TEXT, params TEXT, metrics TEXT, payload BLOB, created REAL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS curves (key TEXT PRIMARY KEY, payload BLOB, nbytes INTEGER, last_access REAL)')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, keys):
+        """Returns {key: result} for the keys that are stored. Per-bar series are attached when still cached."""
+        found = {}
+        for start in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            chunk = keys[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            for key, payload in self.conn.execute(f'SELECT key, payload FROM results WHERE key IN ({marks})', chunk):
+                found[key] = pickle.loads(payload)
+            for key, payload in self.conn.execute(f'SELECT key, payload FROM curves WHERE key IN ({marks})', chunk):
+                if key in found: found[key].update(pickle.loads(payload))
+            self.conn.execute(f'UPDATE curves SET last_access = ? WHERE key IN ({marks})', [time.time(), *chunk])
+        self.conn.commit()
+        return found
+
+    def put_many(self, entries):
+        """Stores (key, kind, fingerprint, params, metrics, result, curves) tuples. `result` is the picklable object handed
+        back by get_many; `curves` is a dict of per-bar series merged into it on retrieval (may be empty)."""
+        now = time.time()
+        for key, kind, fingerprint, params, metrics, result, curves in entries:
+            self.conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (key, kind, fingerprint, json.dumps(params, default=_json_value), json.dumps(metrics, default=_json_value), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), now))
+            if curves:
+                payload = pickle.dumps(curves, protocol=pickle.HIGHEST_PROTOCOL)
+                self.conn.execute('INSERT OR REPLACE INTO curves VALUES (?, ?, ?, ?)', (key, payload, len(payload), now))
+        self.conn.commit()
+        self._evict_curves()
+
+    def _evict_curves(self):
+        total = self.conn.execute('SELECT COALESCE(SUM(nbytes), 0) FROM curves').fetchone()[0]
+        if total <= self.curve_cap_bytes: return
+        stale = []
+        for key, nbytes in self.conn.execute('SELECT key, nbytes FROM curves ORDER BY last_access ASC'):
+            if total <= self.curve_cap_bytes: break
+            stale.append((key,)); total -= nbytes
+        self.conn.executemany('DELETE FROM curves WHERE key = ?', stale)
+        self.conn.commit()
+
+    def query(self, kind=None, fingerprint=None):
+        """Stored metrics rows as a DataFrame (one column per parameter and per metric), for report generation
+        without re-running simulations."""
+        sql = 'SELECT fingerprint, params, metrics FROM results WHERE 1=1'; args = []
+        if kind is not None: sql += ' AND kind = ?'; args.append(kind)
+        if fingerprint is not None: sql += ' AND fingerprint = ?'; args.append(fingerprint)
+        rows = [dict({'fingerprint': fp}, **json.loads(params), **json.loads(metrics)) for fp, params, metrics in self.conn.execute(sql, args)]
+        return pd.DataFrame(rows)
+
+_default_store = None
+_default_store_pid = None
+
+def default_store():
+    """The process-wide store at STORE_PATH, or None when the store is disabled or cannot be opened.
+    Forked pool workers open their own connection rather than sharing the parent's."""
+    global _default_store, _default_store_pid
+    if not STORE_ENABLED: return None
+    if _default_store is None or _default_store_pid != os.getpid():
+        try:
+            _default_store = ResultsStore(STORE_PATH); _default_store_pid = os.getpid()
+        except sqlite3.Error as e:
+            print(f"  [Warning] Could not open results store {STORE_PATH}. Reason: {e}")
+            return None
+    return _default_store
+
+def memoize_runs(kind, fingerprints, params_list, simulate, split_curves=None, complete=None, store=None):
+    """Returns one result per entry of params_list, taking stored results where the (fingerprint, params) pair was seen
+    before and calling simulate(indices) for the rest; simulate returns the fresh results for those indices in order.
+    split_curves(result) -> (result without per-bar series, {name: series}) keeps the series out of the metrics table.
+    A stored result failing complete(result), e.g. one whose evicted curves the caller needs, is simulated again."""
+    store = store if store is not None else default_store()
+    if store is None: return simulate(list(range(len(params_list))))
+    keys = [result_key(kind, fp, params) for fp, params in zip(fingerprints, params_list)]
+    try:
+        cached = store.get_many(keys)
+    except sqlite3.Error as e:
+        print(f"  [Warning] Results store lookup failed, simulating everything. Reason: {e}")
+        return simulate(list(range(len(params_list))))
+    missing = [i for i, key in enumerate(keys) if key not in cached or (complete is not None and not complete(cached[key]))]
+    results = [cached.get(key) for key in keys]
+    instrumentation.count('results store hits', len(keys) - len(missing)); instrumentation.count('results store misses', len(missing))
+    if not missing: return results
+    entries = []
+    for i, result in zip(missing, simulate(missing)):
+        results[i] = result
+        core, curves = split_curves(result) if split_curves is not None else (result, {})
+        metrics = core['metrics'] if isinstance(core, dict) and 'metrics' in core else core
+        entries.append((keys[i], kind, fingerprints[i], params_list[i], metrics, core, curves))
+    try:
+        store.put_many(entries)
+    except sqlite3.Error as e:
+        print(f"  [Warning] Could not save results to the store. Reason: {e}")
+    return results
+
+# --- Memoized engine entry points ---
+# Same arguments and return values as the backtest_engine / portfolio_engine functions they wrap. A grid, a sweep and a
+# single run of the same combination on the same data share one stored entry.
+
+def _backtest_params(stop_loss_mode, stop_level_pct, profit_target_pct, initial_capital, commission_pct, sma_col):
+    return {'stop_loss_mode': stop_loss_mode, 'stop_level_pct': stop_level_pct, 'profit_target_pct': profit_target_pct,
+            'initial_capital': initial_capital, 'commission_pct': commission_pct, 'sma_col': sma_col}
+
+def _split_stop_series(result):
+    if result['trailing_stop_series'] is None: return result, {}
+    return dict(result, trailing_stop_series=None), {'trailing_stop_series': result['trailing_stop_series']}
+
+def _has_stop_series(result):
+    return result['trailing_stop_series'] is not None
+
+def backtest_grid(df, stop_loss_mode, combos, initial_capital, commission_pct, sma_col, arrays=None, record_stops=True, store=None):
+    """backtest_engine.run_backtest_grid through the store; only combinations not stored yet are simulated."""
+    a = arrays if arrays is not None else backtest_engine.prepare_arrays(df, sma_col)
+    fingerprint = arrays_fingerprint(a)
+    params = [_backtest_params(stop_loss_mode, sl, pt, initial_capital, commission_pct, sma_col) for sl, pt in combos]
+    simulate = lambda idx: backtest_engine.run_backtest_grid(df, stop_loss_mode, [combos[i] for i in idx], initial_capital, commission_pct, sma_col, arrays=a, record_stops=record_stops)
+    return memoize_runs('backtest', [fingerprint] * len(combos), params, simulate, _split_stop_series, _has_stop_series if record_stops else None, store)
+
+def backtest_run(df, stop_loss_mode, stop_level_pct, profit_target_pct, initial_capital, commission_pct, sma_col, arrays=None, store=None):
+    """backtest_engine.run_backtest through the store."""
+    return backtest_grid(df, stop_loss_mode, [(stop_level_pct, profit_target_pct)], initial_capital, commission_pct, sma_col, arrays=arrays, store=store)[0]
+
+def backtest_sweep(df, stop_loss_mode, ma_periods, combos, initial_capital, commission_pct, arrays=None, store=None):
+    """backtest_engine.run_backtest_sweep through the store. Entries are keyed per MA column, so they are shared with
+    grids and single runs on that MA; if any combination is missing the sweep is rerun as a whole."""
+    a = arrays if arrays is not None else backtest_engine.prepare_sweep_arrays(df, ma_periods)
+    fingerprints = [arrays_fingerprint(a, j) for j in range(len(ma_periods)) for _ in combos]
+    params = [_backtest_params(stop_loss_mode, sl, pt, initial_capital, commission_pct, f'SMA_{m}') for m in ma_periods for sl, pt in combos]
+    def simulate(idx):
+        results = backtest_engine.run_backtest_sweep(df, stop_loss_mode, ma_periods, combos, initial_capital, commission_pct, arrays=a)
+        for result in results: result['metrics'] = {k: v for k, v in result['metrics'].items() if k != "MA Period"}
+        return [results[i] for i in idx]
+    results = memoize_runs('backtest', fingerprints, params, simulate, _split_stop_series, None, store)
+    return [dict(result, metrics=dict({"MA Period": ma_periods[k // len(combos)]}, **result['metrics'])) for k, result in enumerate(results)]
+
+def _portfolio_params(stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return, commission_pct):
+    return {'stop_loss_mode': stop_loss_mode, 'stop_level_pct': stop_level_pct, 'pt_pct': pt_pct, 'initial_capital': initial_capital,
+            'ma_period': ma_period, 'annual_cash_return': portfolio_engine.cash_rate_key(annual_cash_return), 'commission_pct': commission_pct}
+
+def portfolio_grid(df, stop_loss_mode, combos, initial_capital, ma_period, annual_cash_return, commission_pct, panel=None, store=None):
+    """portfolio_engine.run_active_strategy_grid through the store; only combinations not stored yet are simulated."""
+    p = panel if panel is not None else portfolio_engine.prepare_panel(df, ma_period)
+    fingerprint = panel_fingerprint(p)
+    params = [_portfolio_params(stop_loss_mode, sl, pt, initial_capital, ma_period, annual_cash_return, commission_pct) for sl, pt in combos]
+    simulate = lambda idx: portfolio_engine.run_active_strategy_grid(df, stop_loss_mode, [combos[i] for i in idx], initial_capital, ma_period, annual_cash_return, commission_pct, panel=p)
+    return memoize_runs('portfolio_grid', [fingerprint] * len(combos), params, simulate, None, None, store)
+
+def portfolio_sweep(df, stop_loss_mode, ma_periods, combos, initial_capital, annual_cash_return, commission_pct, panel=None, store=None):
+    """portfolio_engine.run_active_strategy_sweep through the store, sharing entries with portfolio_grid on each MA."""
+    p = panel if panel is not None else portfolio_engine.prepare_sweep_panel(df, ma_periods)
+    fingerprints = [panel_fingerprint(p, j) for j in range(len(ma_periods)) for _ in combos]
+    params = [_portfolio_params(stop_loss_mode, sl, pt, initial_capital, m, annual_cash_return, commission_pct) for m in ma_periods for sl, pt in combos]
+    def simulate(idx):
+        results = portfolio_engine.run_active_strategy_sweep(df, stop_loss_mode, ma_periods, combos, initial_capital, annual_cash_return, commission_pct, panel=p)
+        return [{k: v for k, v in results[i].items() if k != "MA Period"} for i in idx]
+    results = memoize_runs('portfolio_grid', fingerprints, params, simulate, None, None, store)
+    return [dict({"MA Period": ma_periods[k // len(combos)]}, **metrics) for k, metrics in enumerate(results)]
+
+def portfolio_run(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return, commission_pct, panel=None, store=None):
+    """portfolio_engine.run_active_strategy through the store, with the equity and cash curves in the LRU-capped table.
+    Kept apart from the grid entries, whose metrics may differ from the single run's in the last digits."""
+    p = panel if panel is not None else portfolio_engine.prepare_panel(df, ma_period)
+    params = [_portfolio_params(stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return, commission_pct)]
+    def simulate(idx):
+        metrics, equity_curve, cash_curve = portfolio_engine.run_active_strategy(df, stop_loss_mode, stop_level_pct, pt_pct, initial_capital, ma_period, annual_cash_return, commission_pct, panel=p)
+        return [{'metrics': metrics, 'equity_curve': equity_curve, 'cash_curve': cash_curve}]
+    split = lambda r: ({'metrics': r['metrics']}, {'equity_curve': r['equity_curve'], 'cash_curve': r['cash_curve']})
+    result = memoize_runs('portfolio_run', [panel_fingerprint(p)], params, simulate, split, lambda r: 'equity_curve' in r, store)[0]
+    return result['metrics'], result['equity_curve'], result['cash_curve']
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from metrics import trade_returns
+from walk_forward import equity_curve_from_trades
+
+# --- Robustness Configuration ---
+RESAMPLE_METHOD = 'block'  # 'block': moving-block bootstrap of daily returns; 'trades': trades drawn with replacement; 'shuffle': trade order permuted
+NUM_PATHS = 10000
+BLOCK_BARS = 21  # Length of the resampled blocks for 'block'; keeps about a month of volatility clustering and trend together
+CONFIDENCE_PCT = 90
+SEED = 42
+PATHS_PER_CHUNK = 1000  # Paths simulated per array pass and per task; bounds memory at chunk x bars float64 values
+METHODS = ('block', 'trades', 'shuffle')
+METRICS = ['CAGR (%)', 'Max Drawdown (%)', 'Calmar Ratio']
+
+def daily_returns(equity_curve):
+    equity = np.asarray(equity_curve, dtype=np.float64)
+    return equity[1:] / equity[:-1] - 1
+
+def backtest_returns(a, trades_log, initial_capital, commission_pct, method=RESAMPLE_METHOD):
+    """The returns a single-asset run is resampled from: daily returns of its marked-to-market equity for 'block',
+    for 'trades' and 'shuffle' the equity growth of each trade, its net return times the share of equity it was
+    sized to. `a` is the run's prepare_arrays dict."""
+    if method == 'block': return daily_returns(equity_curve_from_trades(a, trades_log, initial_capital, commission_pct))
+    weights = np.array([a['weight'][a['index'].get_loc(t['entry_date'])] for t in trades_log if 'exit_price' in t], dtype=np.float64)
+    return trade_returns(trades_log, commission_pct) * weights
+
+def path_metrics(log_growth, num_years):
+    """CAGR (%), max drawdown (%) and Calmar of every row of a (paths x steps) matrix of log growth factors, each
+    computed with one cumulative pass along the rows. The starting capital counts as the first equity peak."""
+    log_equity = np.cumsum(log_growth, axis=1)
+    peak = np.maximum(np.maximum.accumulate(log_equity, axis=1), 0)
+    max_drawdown = -np.expm1((log_equity - peak).min(axis=1)) * 100
+    cagr = np.expm1(log_equity[:, -1] / num_years) * 100 if num_years > 0 else np.zeros(len(log_equity))
+    calmar = np.divide(cagr, max_drawdown, out=np.zeros_like(cagr), where=max_drawdown > 0)
+    return np.stack([cagr, max_drawdown, calmar])
+
+def _resample_chunk(task):
+    """Draws one chunk of paths as a single (paths x steps) index matrix and measures them all at once."""
+    log_growth, method, num_paths, block_bars, num_years, seed = task
+    rng = np.random.default_rng(seed)
+    n = len(log_growth)
+    if method == 'block':
+        block = min(block_bars, n)
+        starts = rng.integers(0, n - block + 1, size=(num_paths, -(-n // block)))
+        sample = log_growth[(starts[:, :, None] + np.arange(block)).reshape(num_paths, -1)[:, :n]]
+    elif method == 'trades': sample = log_growth[rng.integers(0, n, size=(num_paths, n))]
+    else: sample = rng.permuted(np.tile(log_growth, (num_paths, 1)), axis=1)
+    return path_metrics(sample, num_years)
+
+def resample_metrics(returns, num_years, method=RESAMPLE_METHOD, num_paths=NUM_PATHS, block_bars=BLOCK_BARS, seed=SEED, workers=1, paths_per_chunk=PATHS_PER_CHUNK):
+    """Resamples `returns` (daily or per-trade, see backtest_returns) into num_paths alternative histories spanning
+    num_years and returns their CAGR (%), Max Drawdown (%) and Calmar Ratio as a DataFrame with one row per path.
+    'shuffle' only reorders the trades, so every path keeps the observed CAGR and only the drawdown varies.
+    Chunks of paths run across `workers` processes, each from its own child seed of `seed`, so the result does not
+    depend on the number of workers. Returns None when there is nothing to resample."""
+    if method not in METHODS: raise ValueError(f"Unknown resample method {method!r}, expected one of {METHODS}")
+    log_growth = np.log1p(np.asarray(returns, dtype=np.float64))
+    if len(log_growth) == 0 or num_paths <= 0: return None
+    sizes = [min(paths_per_chunk, num_paths - i) for i in range(0, num_paths, paths_per_chunk)]
+    tasks = [(log_growth, method, size, block_bars, num_years, s) for size, s in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor: outputs = list(executor.map(_resample_chunk, tasks))
+    else: outputs = [_resample_chunk(task) for task in tasks]
+    return pd.DataFrame(np.concatenate(outputs, axis=1).T, columns=METRICS)
+
+def confidence_table(returns, num_years, paths, confidence_pct=CONFIDENCE_PCT):
+    """Observed value, mean, median and central confidence interval of every metric over the resampled paths, plus
+    the share of paths that came out below the observed value."""
+    observed = path_metrics(np.log1p(np.asarray(returns, dtype=np.float64))[None, :], num_years)[:, 0]
+    tail = (100 - confidence_pct) / 2
+    rows = []
+    for col, value in zip(METRICS, observed):
+        v = paths[col].to_numpy()
+        low, median, high = np.percentile(v, [tail, 50, 100 - tail])
+        rows.append({"Metric": col, "Observed": value, "Mean": v.mean(), "Median": median,
+                     f"{confidence_pct:g}% CI Low": low, f"{confidence_pct:g}% CI High": high, "Paths Below Observed (%)": (v < value).mean() * 100})
+    return pd.DataFrame(rows)
+
+def robustness_report(returns, num_years, method=RESAMPLE_METHOD, num_paths=NUM_PATHS, block_bars=BLOCK_BARS, confidence_pct=CONFIDENCE_PCT, seed=SEED, workers=1):
+    """Resamples a run and renders the confidence table as a Markdown section for the backtest reports.
+    Returns (section, table), or (None, None) when there is nothing to resample."""
+    paths = resample_metrics(returns, num_years, method, num_paths, block_bars, seed, workers)
+    if paths is None: return None, None
+    table = confidence_table(returns, num_years, paths, confidence_pct)
+    how = {'block': f"moving-block bootstrap of daily returns ({block_bars}-bar blocks)",
+           'trades': "trades drawn with replacement, drawdown measured from trade to trade",
+           'shuffle': "trade order shuffled, drawdown measured from trade to trade (CAGR is fixed)"}[method]
+    display_df = table.copy()
+    for col in display_df.columns[1:]: display_df[col] = display_df[col].apply(lambda x: f"{x:,.2f}")
+    md_content = "## Robustness (Monte Carlo)\n"
+    md_content += f"_{num_paths:,} resampled paths, {how}, seed {seed}. A wide interval, or an observed value far out in the tail, means the optimal combination owes much of its result to the particular order of history._\n\n"
+    md_content += display_df.to_markdown(index=False) + "\n"
+    return md_content, table
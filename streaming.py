@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import backtest_engine
+import data_cache
+import metrics
+import position_sizing
+from backtest_engine import DAY_NS, ST_CASH, ST_IN_POS, ST_LAST_EQ, ST_SHARES, ST_TRADES
+
+# --- Streaming Configuration ---
+CHUNK_BARS = 250_000  # Rows parsed, indicated and simulated per pass; memory follows this, not the length of the file
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+CARRY_BARS = 2  # A bar's entry looks at the crossover over the two bars before it, so each chunk is preceded by the last two of the previous one
+
+class IndicatorStream:
+    """The SMA and PrevYearLow columns of prepare_data for consecutive chunks of one price series, equal to computing
+    them on the whole file: the last max(period)-1 closes, the current year's running low and the previous year's
+    low are carried from chunk to chunk. Like prepare_data, gaps are forward-filled (across chunk boundaries too)
+    and the warm-up bars without a full SMA window or a previous year are dropped."""
+    def __init__(self, ma_periods):
+        self.ma_periods = list(ma_periods)
+        self.close_tail = np.empty(0)
+        self.year, self.year_low, self.prev_year_low = None, np.nan, np.nan
+        self.last_row = None
+
+    def update(self, chunk):
+        close = chunk['Close'].to_numpy(dtype=np.float64)
+        combined = np.concatenate([self.close_tail, close])
+        sma = data_cache.sma_matrix(combined, self.ma_periods)[len(self.close_tail):]
+        keep = max(self.ma_periods) - 1
+        self.close_tail = combined[max(0, len(combined) - keep):]
+        years = chunk.index.year.to_numpy(); lows = chunk['Low'].to_numpy(dtype=np.float64)
+        prev_year_low = np.empty(len(chunk))
+        bounds = [0, *(np.flatnonzero(np.diff(years)) + 1), len(chunk)]
+        for s, e in zip(bounds[:-1], bounds[1:]):
+            if years[s] != self.year: self.year, self.year_low, self.prev_year_low = years[s], np.nan, self.year_low
+            prev_year_low[s:e] = self.prev_year_low
+            if not np.isnan(lows[s:e]).all(): self.year_low = np.fmin(self.year_low, np.nanmin(lows[s:e]))
+        df = chunk[PRICE_COLUMNS].copy()
+        for j, period in enumerate(self.ma_periods): df[f'SMA_{period}'] = sma[:, j]
+        df['PrevYearLow'] = prev_year_low
+        if self.last_row is not None: df = pd.concat([self.last_row, df]).ffill().iloc[1:]
+        else: df = df.ffill()
+        if len(df): self.last_row = df.iloc[-1:]
+        return df.dropna()
+
+def stream_backtest_grid(file_path, stop_loss_mode, combos, initial_capital, commission_pct, ma_period, chunk_bars=CHUNK_BARS, sizing=None):
+    """run_backtest_grid over a price CSV read chunk_bars rows at a time, for histories (years of minute bars) too
+    large to hold in memory. Each chunk resumes the kernel from the previous chunk's checkpoint, replaying the last
+    CARRY_BARS bars in front of it; closed trades are moved out of the checkpoint as they complete, so it only ever
+    holds the open ones. Metrics and trades match run_backtest_grid on prepare_data's frame of the whole file, to
+    within the rounding of the chunked SMA sums; no trailing stop series is kept. Entry weights of the position_sizing
+    spec `sizing` are computed as each chunk arrives, over the last volatility window of the one before it; their
+    annualization uses the bars per year of the first chunk, which for intraday files is an estimate.
+    Returns (results, info) where info has the bars, first and last date, bars per year and the buy & hold stats,
+    or None when the file has too few bars."""
+    sma_col = f'SMA_{ma_period}'
+    indicators = IndicatorStream([ma_period])
+    checkpoint = pending = first_date = None
+    closed = [[] for _ in combos]; num_bars = 0; session_bars = {}; head_ns = np.empty(0, dtype=np.int64)
+    first_open = last_close = bh_sums = None
+    sizing = sizing or position_sizing.EQUAL; price_tail = weight_bars = None
+    for chunk in data_cache.read_price_chunks(file_path, chunk_bars, PRICE_COLUMNS):
+        frame = indicators.update(chunk)
+        if len(frame):
+            if weight_bars is None: weight_bars = backtest_engine.bars_per_year(frame.index)
+            prices = frame[['High', 'Low', 'Close']] if price_tail is None else pd.concat([price_tail, frame[['High', 'Low', 'Close']]])
+            weight = position_sizing.entry_weights(sizing, prices['High'], prices['Low'], prices['Close'].to_numpy(dtype=np.float64), weight_bars)
+            frame = frame.assign(Weight=weight[len(prices) - len(frame):])
+            price_tail = prices.iloc[-(sizing.get('window', 0) + 1):]
+            close = frame['Close'].to_numpy(dtype=np.float64)
+            if first_open is None: first_open, first_date = frame['Open'].iloc[0], frame.index[0]
+            if first_open > 0: bh_sums = metrics.curve_sums(close * (initial_capital / first_open), sums=bh_sums)
+            last_close = close[-1]
+            # bars_per_year needs the whole history's bars per calendar day, so they are tallied chunk by chunk;
+            # the bar spacing is taken from the first thousand bars.
+            ns = frame.index.values.astype('datetime64[ns]').view(np.int64)
+            if len(head_ns) < 1000: head_ns = np.concatenate([head_ns, ns[:1000]])
+            for day, count in zip(*np.unique(ns // DAY_NS, return_counts=True)): session_bars[day] = session_bars.get(day, 0) + count
+        if pending is not None: frame = pd.concat([pending, frame])
+        if len(frame) < CARRY_BARS + 1 or (checkpoint is not None and len(frame) == CARRY_BARS): pending = frame; continue
+        a = backtest_engine.prepare_arrays(frame, sma_col)
+        a['weight'] = frame['Weight'].to_numpy(dtype=np.float64); a['sizing'] = sizing
+        results, checkpoint = backtest_engine.run_backtest_grid(None, stop_loss_mode, combos, initial_capital, commission_pct, sma_col, arrays=a,
+                                                                record_stops=False, checkpoint=checkpoint, return_checkpoint=True)
+        num_bars += len(frame) - (checkpoint['resumed_from'] or 0)
+        state = checkpoint['state']
+        for c in range(len(combos)):
+            trades = checkpoint['trades'][c]
+            open_trades = trades[-1:] if state[c, ST_IN_POS] == 1.0 else []
+            closed[c].extend(trades[:len(trades) - len(open_trades)])
+            checkpoint['trades'][c] = open_trades
+        # Trade slots restart with each chunk: only the open trade, if any, is carried over.
+        state[:, ST_TRADES] = state[:, ST_IN_POS]
+        checkpoint['num_bars'] = CARRY_BARS
+        pending = frame.iloc[-CARRY_BARS:]
+    if checkpoint is None: return None
+    span_days = (pending.index[-1] - first_date) / pd.Timedelta(days=1)
+    year_bars = backtest_engine.session_bars_per_year(np.median(np.diff(head_ns)) / DAY_NS, np.array(list(session_bars.values())), span_days)
+    output = []; stats = backtest_engine.state_stats(checkpoint['state'], num_bars, year_bars)
+    for c, ((stop_level_pct, profit_target_pct), result) in enumerate(zip(combos, results)):
+        s = checkpoint['state'][c]
+        trades_log = closed[c] + (result['trades_log'][-1:] if s[ST_IN_POS] == 1.0 else [])
+        final_equity = s[ST_SHARES] * last_close + s[ST_CASH] if s[ST_IN_POS] == 1.0 else s[ST_LAST_EQ]
+        summary = backtest_engine.summarize_backtest(num_bars, {k: v[c] for k, v in stats.items()}, final_equity, trades_log, stop_level_pct, profit_target_pct,
+                                                     initial_capital, commission_pct, year_bars)
+        output.append({"metrics": summary, "trades_log": trades_log, "trailing_stop_series": None})
+    # A first open of 0 cannot be bought, so buy & hold reports zeros, as calculate_benchmark_stats does for the whole file.
+    if first_open <= 0: buy_and_hold = dict.fromkeys(backtest_engine.BENCHMARK_METRICS, 0)
+    else: buy_and_hold = backtest_engine.buy_and_hold_summary(initial_capital / first_open * last_close, metrics.summarize_sums(bh_sums, num_bars, year_bars), initial_capital, num_bars, year_bars)
+    info = {'bars': num_bars, 'first_date': first_date, 'last_date': pending.index[-1], 'bars_per_year': year_bars, 'buy_and_hold': buy_and_hold}
+    return output, info
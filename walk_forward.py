@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import backtest_engine
+import portfolio_engine
+import metrics
+from backtest_engine import bars_per_year, slice_arrays
+from metrics import max_drawdown_pct
+from portfolio_engine import slice_panel
+
+def walk_forward_windows(num_bars, train_bars, test_bars):
+    """Rolling (train_start, train_end, test_end) bar ranges: each test window directly follows its training
+    window, and consecutive test windows tile the history without overlap. The last test window may be short."""
+    windows = []
+    start = 0
+    while start + train_bars + 2 < num_bars:  # a test window needs at least 3 bars to see a crossover entry
+        windows.append((start, start + train_bars, min(start + train_bars + test_bars, num_bars)))
+        start += test_bars
+    return windows
+
+def equity_curve_from_trades(a, trades_log, initial_capital, commission_pct):
+    """Marks a run_backtest trade log to market on every bar's close: flat bars hold the cash, held bars the
+    position's value plus the cash its entry weight left aside. The last value equals the run's final equity."""
+    close, index = a['close'], a['index']
+    equity = np.empty(len(close))
+    cash = float(initial_capital); pos = 0
+    for trade in trades_log:
+        entry_bar = index.get_loc(trade['entry_date']); exit_bar = index.get_loc(trade['exit_date'])
+        equity[pos:entry_bar] = cash
+        invested = cash * a['weight'][entry_bar]
+        shares = invested * (1 - commission_pct) / trade['entry_price']; cash -= invested
+        equity[entry_bar:exit_bar] = shares * close[entry_bar:exit_bar] + cash
+        cash += shares * trade['exit_price'] * (1 if trade['reason'] == 'End of Data' else (1 - commission_pct))
+        equity[exit_bar] = cash
+        pos = exit_bar + 1
+    equity[pos:] = cash
+    return equity
+
+def _map(fn, tasks, workers):
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor: return list(executor.map(fn, tasks))
+    return [fn(task) for task in tasks]
+
+def _stitch(rows, curves, initial_capital, year_bars):
+    """Chains the test-window equity curves, each simulated from initial_capital, into one out-of-sample curve
+    by carrying the ending capital of every window into the next. year_bars is the data's bars_per_year.
+    Exposure is not reported, since the stitched curve does not keep the windows' cash."""
+    stitched = []; capital = float(initial_capital)
+    for curve in curves:
+        scaled = np.asarray(curve) * (capital / initial_capital)
+        stitched.append(scaled); capital = scaled[-1]
+    equity = np.concatenate(stitched)
+    stats = metrics.curve_stats(equity, year_bars)
+    summary = portfolio_engine.performance_summary(None, equity[-1], stats, initial_capital, len(equity), year_bars)
+    summary = {k: v for k, v in summary.items() if k not in ("Name", "Exposure")}
+    summary["Windows"] = len(rows)
+    return equity, summary
+
+def _window_dates(index, train_start, train_end, test_end):
+    return {"Train Start": index[train_start].strftime('%Y-%m-%d'), "Train End": index[train_end - 1].strftime('%Y-%m-%d'),
+            "Test Start": index[train_end].strftime('%Y-%m-%d'), "Test End": index[test_end - 1].strftime('%Y-%m-%d')}
+
+def _individual_window(task):
+    """Optimizes MA/SL/PT on one training window by max Calmar in a single sweep, then runs the winner on the following test window."""
+    train_arrays, test_arrays, stop_loss_mode, ma_periods, combos, initial_capital, commission_pct = task
+    results = backtest_engine.run_backtest_sweep(None, stop_loss_mode, ma_periods, combos, initial_capital, commission_pct, arrays=train_arrays)
+    best = max(range(len(results)), key=lambda k: results[k]['metrics']['Calmar Ratio'])
+    ma_row, (sl_pct, pt_pct) = best // len(combos), combos[best % len(combos)]
+    train_metrics = results[best]['metrics']
+    a = dict(test_arrays, sma=test_arrays['sma'][:, ma_row], signal=test_arrays['signal'][:, ma_row])
+    test_result = backtest_engine.run_backtest(None, stop_loss_mode, sl_pct, pt_pct, initial_capital, commission_pct, f'SMA_{ma_periods[ma_row]}', arrays=a)
+    curve = equity_curve_from_trades(a, test_result['trades_log'], initial_capital, commission_pct)
+    row = {"MA": ma_periods[ma_row], "Stop Level (%)": train_metrics['Stop Level (%)'], "Profit Target (%)": train_metrics['Profit Target (%)'],
+           "IS Calmar": train_metrics['Calmar Ratio'], "OOS Return (%)": (curve[-1] / initial_capital - 1) * 100,
+           "OOS Max Drawdown (%)": max_drawdown_pct(curve), "OOS Trades": test_result['metrics']['Total Trades']}
+    return row, curve
+
+def walk_forward_individual(df, stop_loss_mode, combos, ma_periods, initial_capital, commission_pct, train_bars, test_bars, workers=1, sizing=None):
+    """Walk-forward optimization of one asset: on every rolling training window the best (MA, SL, PT) by Calmar is
+    chosen and then traded on the next test window. df needs an SMA_<p> column for every p in ma_periods.
+    Indicator arrays (and the entry weights of the position_sizing spec `sizing`) are prepared once and sliced per
+    window; windows run across `workers` processes.
+    Returns (per-window DataFrame, out-of-sample equity Series, stitched metrics dict), or None if the history is too short."""
+    arrays = backtest_engine.prepare_sweep_arrays(df, ma_periods, sizing)
+    windows = walk_forward_windows(len(df), train_bars, test_bars)
+    if not windows: return None
+    tasks = [(slice_arrays(arrays, s, m), slice_arrays(arrays, m, e), stop_loss_mode, list(ma_periods), combos, initial_capital, commission_pct) for s, m, e in windows]
+    outputs = _map(_individual_window, tasks, workers)
+    rows = [dict(_window_dates(df.index, *w), **row) for w, (row, _) in zip(windows, outputs)]
+    equity, summary = _stitch(rows, [curve for _, curve in outputs], initial_capital, bars_per_year(df.index))
+    return pd.DataFrame(rows), pd.Series(equity, index=df.index[windows[0][1]:windows[-1][2]]), summary
+
+def _portfolio_window(task):
+    """Optimizes MA/SL/PT of the shared-capital portfolio on one training window in a single sweep, then runs the winner on the test window."""
+    train_panel, test_panel, stop_loss_mode, ma_periods, combos, initial_capital, annual_cash_return, commission_pct = task
+    results = portfolio_engine.run_active_strategy_sweep(None, stop_loss_mode, ma_periods, combos, initial_capital, annual_cash_return, commission_pct, panel=train_panel)
+    best = max(range(len(results)), key=lambda k: results[k]['Calmar'])
+    ma_row, (sl_pct, pt_pct) = best // len(combos), combos[best % len(combos)]
+    p = dict(test_panel, signal=test_panel['signal'][:, :, ma_row])
+    test_metrics, curve, _ = portfolio_engine.run_active_strategy(None, stop_loss_mode, sl_pct, pt_pct, initial_capital, ma_periods[ma_row], annual_cash_return, commission_pct, panel=p)
+    row = {"MA": ma_periods[ma_row], "Stop Level (%)": sl_pct if sl_pct is not None else "Struct", "Profit Target (%)": "None" if pt_pct is None else pt_pct,
+           "IS Calmar": results[best]['Calmar'], "OOS Return (%)": (curve[-1] / initial_capital - 1) * 100,
+           "OOS Max Drawdown (%)": test_metrics['Max Drawdown'], "OOS Trades": test_metrics['Total Trades']}
+    return row, curve
+
+def walk_forward_portfolio(df, stop_loss_mode, combos, ma_periods, initial_capital, annual_cash_return, commission_pct, train_bars, test_bars, workers=1, sizing=None):
+    """Portfolio counterpart of walk_forward_individual on the prepare_all_data frame, which needs an SMA_<p>
+    column per ticker for every p in ma_periods. The sweep panel is built once and sliced per window."""
+    panel = portfolio_engine.prepare_sweep_panel(df, ma_periods, sizing)
+    windows = walk_forward_windows(len(df), train_bars, test_bars)
+    if not windows: return None
+    tasks = [(slice_panel(panel, s, m), slice_panel(panel, m, e), stop_loss_mode, list(ma_periods), combos, initial_capital, annual_cash_return, commission_pct)
+             for s, m, e in windows]
+    outputs = _map(_portfolio_window, tasks, workers)
+    rows = [dict(_window_dates(df.index, *w), **row) for w, (row, _) in zip(windows, outputs)]
+    equity, summary = _stitch(rows, [curve for _, curve in outputs], initial_capital, bars_per_year(df.index))
+    return pd.DataFrame(rows), pd.Series(equity, index=df.index[windows[0][1]:windows[-1][2]]), summary